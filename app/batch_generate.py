@@ -0,0 +1,212 @@
+"""
+Offline PLS generation over a CSV corpus.
+
+Reads rows shaped like data/simplified_texts.csv (filename, original_text,
+simplified_text) as a stream, runs clean_text, classify_text,
+generate_pls_from_model and get_scores on each abstract and appends the
+results in the layout of data/abstract_generated_pls_*.csv (plus status and
+score columns) to a CSV or JSONL file.
+
+Rows are processed concurrently so the classifier micro-batcher and the
+generation scheduler see full batches, and readability scoring runs in a
+process pool while the GPU moves on to the next rows. After each written row
+the output offset is checkpointed, so a killed job resumes where it stopped.
+Rows whose status is an error are retried on resume; the retry is appended,
+so the last row of a filename is the one that counts:
+
+    python batch_generate.py --input ../data/simplified_texts.csv --output pls.csv
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from core.class_model import AllScores
+from core.scoring import get_scores
+from core.text_cleaning import clean_text
+from core.prompt_template import PROMPT_TEMPLATE
+
+SCORE_NAMES = ("CLI", "FRE", "GFI", "SMOG", "FKGL", "DCRS")
+FIELDNAMES = ["filename", "original_text", "simplified_text", "pls_text_content", "status"] + \
+    [f"{which}_{name}" for which in ("original", "generated") for name in SCORE_NAMES]
+
+
+def score_pair(original: str, generated: str) -> dict:
+    """Readability of the abstract and its PLS; runs in the scoring process pool."""
+    return AllScores(original=get_scores(original), generated=get_scores(generated)).model_dump()
+
+
+class ResultWriter:
+    """
+    Appends results to a CSV or JSONL file and checkpoints the byte offset of
+    the last complete row, so a partial row from a killed run is discarded on
+    resume. `done` holds the filenames whose last row is not an error, which
+    a resumed run skips; `errors` counts the rows it retries.
+    """
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.checkpoint_path = path + ".ckpt"
+        self.done = set()
+        self.errors = 0
+
+        offset = 0
+        if os.path.exists(path) and not os.path.exists(self.checkpoint_path):
+            raise FileExistsError(f"{path} exists but has no checkpoint; remove it or pick another output.")
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                offset = json.load(f)["offset"]
+        if os.path.exists(path):
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+            self._read_done()
+
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=FIELDNAMES)
+            if offset == 0:
+                self._csv.writeheader()
+                self._commit()
+
+    def _read_done(self):
+        csv.field_size_limit(sys.maxsize)
+        with open(self.path, newline="", encoding="utf-8") as f:
+            if self.fmt == "csv":
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+        failed = set()
+        for row in rows:
+            if row["status"].startswith("error"):
+                failed.add(row["filename"])
+                self.done.discard(row["filename"])
+            else:
+                failed.discard(row["filename"])
+                self.done.add(row["filename"])
+        self.errors = len(failed)
+
+    def write(self, record: dict):
+        if self.fmt == "csv":
+            row = {key: record[key] for key in FIELDNAMES[:5]}
+            for which, scores in (record.get("scores") or {}).items():
+                for name, value in scores.items():
+                    row[f"{which}_{name}"] = value
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if not record["status"].startswith("error"):
+            self.done.add(record["filename"])
+        self._commit()
+
+    def _commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"offset": self._file.tell(), "rows": len(self.done)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        self._file.close()
+
+
+def read_rows(path: str):
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8") as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            row["filename"] = row.get("filename") or str(index)
+            yield row
+
+
+def process_row(row: dict, score_pool) -> dict:
+    """Clean, classify, generate and score one row."""
+    # Imported here so the scoring worker processes never load torch
+    from core.classifier_model import classify_text
+    from core.model_loader import generate_pls_from_model
+
+    record = {
+        "filename": row["filename"],
+        "original_text": row.get("original_text", ""),
+        "simplified_text": row.get("simplified_text", ""),
+        "pls_text_content": "",
+        "status": "ok",
+        "scores": None,
+    }
+    try:
+        abstract_text = clean_text(row.get("original_text"))
+        if not abstract_text:
+            record["status"] = "empty"
+            return record
+
+        pred, _ = classify_text(abstract_text)
+        if pred == 'PLS':
+            record["status"] = "already_pls"
+            return record
+
+        record["pls_text_content"] = generate_pls_from_model(abstract_text, PROMPT_TEMPLATE)
+        record["scores"] = score_pool.submit(score_pair, abstract_text, record["pls_text_content"]).result()
+    except Exception as e:
+        record["status"] = f"error: {getattr(e, 'detail', e)}"
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable offline PLS generation over a CSV corpus.")
+    parser.add_argument("--input", required=True, help="CSV with filename and original_text columns")
+    parser.add_argument("--output", required=True, help="Output .csv or .jsonl file")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the output extension")
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH'))
+    parser.add_argument("--batch-size", type=int, default=8, help="Rows generated concurrently")
+    parser.add_argument("--score-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--limit", type=int, help="Stop after this many input rows")
+    args = parser.parse_args()
+
+    if not args.model_path:
+        parser.error("--model-path or MODEL_PATH is required")
+    fmt = args.format or ("jsonl" if args.output.endswith(".jsonl") else "csv")
+
+    # The scheduler batches the concurrent generations on the GPU
+    os.environ.setdefault('BATCH_MAX_SIZE', str(args.batch_size))
+    from core.classifier_model import load_classifier_model
+    from core.model_loader import load_ai_model
+    load_ai_model(args.model_path)
+    load_classifier_model()
+
+    writer = ResultWriter(args.output, fmt)
+    if writer.done or writer.errors:
+        print(f"Resuming after {len(writer.done)} completed rows, retrying {writer.errors} failed rows.")
+    else:
+        print("Starting new run.")
+
+    window = deque()
+    written = 0
+    with ThreadPoolExecutor(max_workers=args.batch_size * 2) as row_pool, \
+            ProcessPoolExecutor(max_workers=args.score_processes,
+                                mp_context=multiprocessing.get_context("spawn")) as score_pool:
+        for index, row in enumerate(read_rows(args.input)):
+            if args.limit is not None and index >= args.limit:
+                break
+            if row["filename"] in writer.done:
+                continue
+
+            window.append(row_pool.submit(process_row, row, score_pool))
+            # Write finished rows in input order and keep a bounded number in flight
+            while window and (window[0].done() or len(window) >= args.batch_size * 2):
+                writer.write(window.popleft().result())
+                written += 1
+
+        while window:
+            writer.write(window.popleft().result())
+            written += 1
+
+    writer.close()
+    print(f"Done. {written} rows written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
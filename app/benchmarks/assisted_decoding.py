@@ -0,0 +1,87 @@
+"""
+Latency of assisted decoding with a draft model against plain greedy decoding.
+
+Loads the main and draft models through load_ai_model (DRAFT_MODEL_PATH),
+generates the PLS of a few abstracts with and without the draft, checks that
+the outputs are identical and reports the latency per summary, the speedup
+and the draft acceptance rate from the Prometheus metrics. Run from the app
+folder, e.g. with Llama-3.2-1B-Instruct drafting for the 3B model:
+
+    python -m benchmarks.assisted_decoding --model-path ./model/llm/ --draft-model-path ./model/draft/
+"""
+import argparse
+import os
+import statistics
+import time
+
+from prometheus_client import REGISTRY
+
+from benchmarks.end_to_end import load_abstracts
+from core import model_loader
+from core.prompt_template import PROMPT_TEMPLATE
+
+
+def counter(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def run(abstracts):
+    latencies, outputs = [], []
+    for abstract in abstracts:
+        start = time.perf_counter()
+        outputs.append(model_loader.generate_pls_from_model(abstract, PROMPT_TEMPLATE))
+        latencies.append(time.perf_counter() - start)
+    return latencies, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH'), required=not os.environ.get('MODEL_PATH'))
+    parser.add_argument("--draft-model-path", required=True)
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--max-new-tokens", type=int, help="Override the generation length for quick runs")
+    args = parser.parse_args()
+
+    os.environ['DRAFT_MODEL_PATH'] = args.draft_model_path
+    os.environ['BATCH_MAX_SIZE'] = '1'
+    loaded = model_loader.load_ai_model(args.model_path)
+
+    if args.max_new_tokens:
+        get_generation_config = model_loader.get_generation_config
+
+        def short_generation_config(loaded=None):
+            config = get_generation_config(loaded)
+            config.min_new_tokens = min(config.min_new_tokens, args.max_new_tokens)
+            config.max_new_tokens = args.max_new_tokens
+            return config
+
+        model_loader.get_generation_config = short_generation_config
+
+    abstracts = load_abstracts(args.data, args.samples)
+    draft_model = loaded.draft_model
+
+    loaded.draft_model = None
+    plain_latencies, plain_outputs = run(abstracts)
+
+    loaded.draft_model = draft_model
+    assisted_latencies, assisted_outputs = run(abstracts)
+
+    accepted = counter("pls_draft_tokens_total", result="accepted")
+    rejected = counter("pls_draft_tokens_total", result="rejected")
+    steps = counter("pls_assisted_tokens_per_step_count")
+    tokens_per_step = counter("pls_assisted_tokens_per_step_sum") / steps if steps else 0
+    identical = sum(a == b for a, b in zip(plain_outputs, assisted_outputs))
+
+    plain, assisted = statistics.mean(plain_latencies), statistics.mean(assisted_latencies)
+    print(f"\n{len(abstracts)} abstracts")
+    print(f"greedy           {plain:8.2f} s per summary")
+    print(f"assisted         {assisted:8.2f} s per summary")
+    print(f"speedup          {plain / assisted:8.2f}x")
+    print(f"acceptance rate  {accepted / max(accepted + rejected, 1):8.1%}")
+    print(f"tokens per step  {tokens_per_step:8.2f}")
+    print(f"identical output {identical}/{len(abstracts)}")
+
+
+if __name__ == "__main__":
+    main()
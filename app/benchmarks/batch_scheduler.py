@@ -0,0 +1,112 @@
+"""
+Token parity of the continuous batching scheduler with model.generate().
+
+Generates the PLS prompts of a few abstracts greedily one at a time with
+generate(), then submits them to a GenerationScheduler at each batch size:
+half of them at once, the rest while the first half is decoding, so prompts
+are both prefilled together and merged into a running batch. With the prefix
+KV cache on, prompts only prefill what follows the shared prefix, as in the
+API. Every sequence must match generate() token for token (fp32 on CPU);
+exits with status 1 otherwise. Without --model-path a tiny random model is
+built. Run from the app folder:
+
+    python -m benchmarks.batch_scheduler --samples 8 --batch-sizes 1,2,4,8
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+
+from benchmarks.end_to_end import build_stub_model, load_abstracts
+from core import model_loader
+from core.batch_scheduler import GenerationScheduler
+from core.prompt_template import PROMPT_TEMPLATE
+
+
+def load(model_path):
+    loaded = model_loader.LoadedModel(model_path, model_path)
+    loaded.llama_tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if loaded.llama_tokenizer.pad_token_id is None:
+        loaded.llama_tokenizer.pad_token_id = loaded.llama_tokenizer.eos_token_id
+    loaded.llama_model = AutoModelForCausalLM.from_pretrained(model_path, dtype=torch.float32).eval()
+    return loaded
+
+
+def reference_tokens(loaded, prompts, gen_config):
+    outputs = []
+    with torch.no_grad():
+        for prompt in prompts:
+            generated = loaded.llama_model.generate(input_ids=prompt, generation_config=gen_config)
+            outputs.append(generated[0, prompt.shape[1]:].tolist())
+    return outputs
+
+
+def scheduler_tokens(loaded, prompts, gen_config, batch_size, prefix_provider=None):
+    scheduler = GenerationScheduler(
+        loaded.llama_model, loaded.llama_tokenizer, max_batch_size=batch_size, prefix_provider=prefix_provider
+    )
+    try:
+        half = (len(prompts) + 1) // 2
+        futures = [scheduler.submit(prompt[0], gen_config) for prompt in prompts[:half]]
+        # The rest join while the first ones decode
+        while scheduler.active_jobs() == 0 and not futures[0].done():
+            time.sleep(0.001)
+        futures += [scheduler.submit(prompt[0], gen_config) for prompt in prompts[half:]]
+        return [future.result().tolist() for future in futures]
+    finally:
+        scheduler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", help="Small local causal LM; a tiny random model is built if omitted")
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--new-tokens", type=int, default=48)
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    args = parser.parse_args()
+
+    abstracts = load_abstracts(args.data, args.samples)
+    model_path = args.model_path
+    if not model_path:
+        model_path = tempfile.mkdtemp(prefix="pls-stub-")
+        build_stub_model(model_path, abstracts)
+    loaded = load(model_path)
+    tokenizer = loaded.llama_tokenizer
+
+    prompts = [model_loader.build_prompt_inputs(abstract, PROMPT_TEMPLATE, loaded) for abstract in abstracts]
+    gen_config = GenerationConfig(
+        max_new_tokens=args.new_tokens, do_sample=False,
+        eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id,
+    )
+    model_loader.build_prefix_cache(PROMPT_TEMPLATE, loaded)
+
+    start = time.perf_counter()
+    reference = reference_tokens(loaded, prompts, gen_config)
+    reference_seconds = time.perf_counter() - start
+    total_tokens = sum(map(len, reference))
+
+    print(f"\n{len(prompts)} prompts of {min(p.shape[1] for p in prompts)}-{max(p.shape[1] for p in prompts)} tokens, "
+          f"{args.new_tokens} new tokens, generate() one at a time: {total_tokens / reference_seconds:.1f} tok/s")
+    print(f"{'batch size':>10}{'prefix cache':>14}{'identical':>11}{'tok/s':>9}")
+    mismatches = 0
+    for batch_size in map(int, args.batch_sizes.split(",")):
+        for prefix_provider in (None, lambda: model_loader.get_prefix_cache(loaded)):
+            start = time.perf_counter()
+            outputs = scheduler_tokens(loaded, prompts, gen_config, batch_size, prefix_provider)
+            seconds = time.perf_counter() - start
+            identical = sum(output == expected for output, expected in zip(outputs, reference))
+            mismatches += len(prompts) - identical
+            print(f"{batch_size:>10}{'on' if prefix_provider else 'off':>14}{f'{identical}/{len(prompts)}':>11}"
+                  f"{sum(map(len, outputs)) / seconds:>9.1f}")
+
+    if mismatches:
+        print(f"{mismatches} sequences differ from generate()")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
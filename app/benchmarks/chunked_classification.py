@@ -0,0 +1,77 @@
+"""
+Accuracy and latency of chunked classification against truncation.
+
+Classifies the original (technical) and simplified (PLS) texts of the CSV with
+each CLASSIFIER_CHUNKING mode: "truncate" scores the first 256 tokens only,
+"mean" and "max" combine overlapping windows scored in one padded pass.
+Reports accuracy at the calibrated threshold, ROC AUC (which does not depend
+on the threshold, calibrated for truncation), the accuracy on texts longer
+than one window, the windows scored per text, single-text latency and
+batched throughput. Run from the app folder:
+
+    python -m benchmarks.chunked_classification --data ../data/simplified_texts.csv
+"""
+import argparse
+import statistics
+
+from benchmarks.classifier_backends import load_texts, measure
+from core import classifier_model
+from core.classifier_model import CLASSIFIER_CHUNKING_MODES, CLASSIFIER_MAX_LENGTH
+
+
+def roc_auc(probabilities, labels):
+    """Probability that a PLS text scores above a technical one (ties count half)."""
+    positives = [p for p, label in zip(probabilities, labels) if label]
+    negatives = [p for p, label in zip(probabilities, labels) if not label]
+    wins = sum((p > n) + 0.5 * (p == n) for p in positives for n in negatives)
+    return wins / (len(positives) * len(negatives))
+
+
+def windows_per_text(texts):
+    """Windows each text is split into by chunking, before CLASSIFIER_MAX_CHUNKS."""
+    inputs = classifier_model.classifier_tokenizer(
+        texts, truncation=True, max_length=CLASSIFIER_MAX_LENGTH,
+        stride=classifier_model.CLASSIFIER_CHUNK_OVERLAP, return_overflowing_tokens=True,
+    )
+    counts = [0] * len(texts)
+    for owner in inputs["overflow_to_sample_mapping"]:
+        counts[owner] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/simplified_texts.csv")
+    parser.add_argument("--samples", type=int, default=300, help="CSV rows to use (two texts per row)")
+    parser.add_argument("--latency-samples", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", default=list(CLASSIFIER_CHUNKING_MODES), choices=CLASSIFIER_CHUNKING_MODES)
+    args = parser.parse_args()
+
+    texts = load_texts(args.data, args.samples)
+    # load_texts returns the original texts first, then the simplified ones
+    labels = [0] * (len(texts) // 2) + [1] * (len(texts) // 2)
+
+    print(f"{'mode':<9} {'accuracy':>9} {'long acc':>9} {'ROC AUC':>8} {'windows':>8} {'p50 ms':>8} {'texts/s':>8}")
+    for mode in ["truncate"] + [m for m in args.modes if m != "truncate"]:
+        classifier_model.load_classifier_model(chunking_mode=mode)
+        if mode == "truncate":
+            windows = windows_per_text(texts)
+            long_texts = [i for i, count in enumerate(windows) if count > 1]
+            scored = [min(count, classifier_model.CLASSIFIER_MAX_CHUNKS) for count in windows]
+
+        results, latency_ms, throughput = measure(texts, args.latency_samples)
+        pls_label = classifier_model.labels_map["1"]
+        correct = [(label == pls_label) == bool(truth) for (label, _), truth in zip(results, labels)]
+        accuracy = sum(correct) / len(texts)
+        long_accuracy = sum(correct[i] for i in long_texts) / len(long_texts) if long_texts else float("nan")
+        auc = roc_auc([prob for _, prob in results], labels)
+        mean_windows = 1.0 if mode == "truncate" else statistics.mean(scored)
+        print(f"{mode:<9} {accuracy:>9.2%} {long_accuracy:>9.2%} {auc:>8.4f} {mean_windows:>8.2f} "
+              f"{latency_ms:>8.1f} {throughput:>8.1f}")
+
+    print(f"\n{len(texts)} texts, {len(long_texts)} longer than {CLASSIFIER_MAX_LENGTH} tokens, "
+          f"threshold {classifier_model.custom_threshold}")
+
+
+if __name__ == "__main__":
+    main()
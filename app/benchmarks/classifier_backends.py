@@ -0,0 +1,72 @@
+"""
+Parity and speed of the PLS classifier backends (torch, int8, onnx).
+
+Every backend classifies the original and simplified texts of the CSV. PLS
+probabilities and threshold decisions are compared against the fp32 PyTorch
+path, and single-text latency and batched throughput are reported.
+Run from the app folder:
+
+    python -m benchmarks.classifier_backends --data ../data/simplified_texts.csv
+"""
+import argparse
+import csv
+import statistics
+import sys
+import time
+
+from core import classifier_model
+from core.classifier_model import CLASSIFIER_BACKENDS, classify_texts
+from core.text_cleaning import clean_text
+
+
+def load_texts(csv_path, samples):
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = [row for _, row in zip(range(samples), csv.DictReader(f))]
+    return [clean_text(row["original_text"]) for row in rows] + [clean_text(row["simplified_text"]) for row in rows]
+
+
+def measure(texts, latency_samples):
+    latencies = []
+    for text in texts[:latency_samples]:
+        start = time.perf_counter()
+        classify_texts([text])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = classify_texts(texts)
+    elapsed = time.perf_counter() - start
+    return results, statistics.median(latencies) * 1000, len(texts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/simplified_texts.csv")
+    parser.add_argument("--samples", type=int, default=300, help="CSV rows to use (two texts per row)")
+    parser.add_argument("--latency-samples", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=list(CLASSIFIER_BACKENDS), choices=CLASSIFIER_BACKENDS)
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Max allowed PLS probability difference")
+    args = parser.parse_args()
+
+    texts = load_texts(args.data, args.samples)
+    reference = None
+    failed = False
+
+    print(f"{'backend':<8} {'p50 ms':>8} {'texts/s':>9} {'max |dp|':>9} {'agreement':>10}")
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        classifier_model.load_classifier_model(backend)
+        results, latency_ms, throughput = measure(texts, args.latency_samples)
+        if reference is None:
+            reference = results
+
+        max_diff = max(abs(prob - ref_prob) for (_, prob), (_, ref_prob) in zip(results, reference))
+        agreement = sum(label == ref_label for (label, _), (ref_label, _) in zip(results, reference)) / len(texts)
+        print(f"{backend:<8} {latency_ms:>8.1f} {throughput:>9.1f} {max_diff:>9.4f} {agreement:>10.2%}")
+        failed |= max_diff > args.tolerance
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
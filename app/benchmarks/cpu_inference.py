@@ -0,0 +1,130 @@
+"""
+Tokens/s of the generation model across CPU inference modes.
+
+Loads the model through load_ai_model once per mode (the CPU_DTYPE and
+CPU_QUANTIZATION settings, plus the previous fp16 loading for reference) and
+generates a fixed number of greedy tokens for a few abstracts. Reports load
+time, prefill time, decode tokens/s and how many leading tokens match the
+fp32 output. Without --model-path a tiny random model is built, which only
+shows framework overhead; use a small real checkpoint for meaningful numbers.
+Run from the app folder:
+
+    python -m benchmarks.cpu_inference --model-path ./model/llm/ --new-tokens 64
+"""
+import argparse
+import gc
+import os
+import statistics
+import tempfile
+import time
+
+import torch
+from transformers import GenerationConfig, StoppingCriteriaList
+
+from benchmarks.end_to_end import build_stub_model, load_abstracts
+from core import model_loader
+from core.prompt_template import PROMPT_TEMPLATE
+
+# mode -> (MODEL_DEVICE, CPU_DTYPE, CPU_QUANTIZATION)
+MODES = {
+    "fp16 (previous)": ("cuda", None, None),
+    "fp32": ("cpu", "fp32", "none"),
+    "bf16": ("cpu", "bf16", "none"),
+    "fp32+int8": ("cpu", "fp32", "int8"),
+    "bf16+int8": ("cpu", "bf16", "int8"),
+}
+
+
+def run_mode(mode, loaded, abstracts, new_tokens):
+    device, dtype, quantization = MODES[mode]
+    os.environ['MODEL_DEVICE'] = device
+    if dtype:
+        os.environ['CPU_DTYPE'] = dtype
+        os.environ['CPU_QUANTIZATION'] = quantization
+
+    start = time.perf_counter()
+    if device == "cuda":
+        # The previous loading path, forced onto the CPU
+        loaded.llama_model = model_loader.AutoModelForCausalLM.from_pretrained(
+            loaded.path, dtype=torch.float16, low_cpu_mem_usage=True
+        ).eval()
+    else:
+        loaded.llama_model = model_loader.load_cpu_model(loaded.path)
+    load_seconds = time.perf_counter() - start
+
+    prefill, decode_rates, outputs = [], [], []
+    for abstract in abstracts:
+        inputs = model_loader.build_prompt_inputs(abstract, PROMPT_TEMPLATE, loaded)
+        timer = model_loader.GenerationTimer()
+        with torch.no_grad():
+            output = loaded.llama_model.generate(
+                input_ids=inputs,
+                generation_config=GenerationConfig(
+                    min_new_tokens=new_tokens, max_new_tokens=new_tokens, do_sample=False,
+                    pad_token_id=loaded.llama_tokenizer.pad_token_id,
+                ),
+                stopping_criteria=StoppingCriteriaList([timer]),
+            )
+        prefill_seconds, decode_seconds = timer.stop()
+        prefill.append(prefill_seconds)
+        decode_rates.append((new_tokens - 1) / decode_seconds)
+        outputs.append(output[0, inputs.shape[1]:].tolist())
+
+    loaded.llama_model = None
+    gc.collect()
+    return {
+        "load_s": load_seconds,
+        "prefill_ms": statistics.median(prefill) * 1000,
+        "decode_tok_s": statistics.median(decode_rates),
+        "outputs": outputs,
+    }
+
+
+def matching_prefix(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", help="Small local causal LM; a tiny random model is built if omitted")
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated subset of: " + ", ".join(MODES))
+    args = parser.parse_args()
+
+    abstracts = load_abstracts(args.data, args.samples)
+    model_path = args.model_path
+    if not model_path:
+        model_path = tempfile.mkdtemp(prefix="pls-stub-")
+        build_stub_model(model_path, abstracts)
+
+    model_loader.configure_cpu_threads()
+    loaded = model_loader.LoadedModel(model_path, model_path)
+    loaded.llama_tokenizer = model_loader.AutoTokenizer.from_pretrained(model_path)
+    if loaded.llama_tokenizer.pad_token_id is None:
+        loaded.llama_tokenizer.pad_token_id = loaded.llama_tokenizer.eos_token_id
+
+    modes = args.modes.split(",")
+    results = {mode: run_mode(mode, loaded, abstracts, args.new_tokens) for mode in modes}
+    reference = results.get("fp32")
+
+    print(f"\n{args.samples} abstracts, {args.new_tokens} new tokens, {torch.get_num_threads()} threads, "
+          f"CPU bf16 support: {model_loader.cpu_supports_bf16()}")
+    print(f"{'mode':<18}{'load s':>8}{'prefill ms':>12}{'decode tok/s':>14}{'same as fp32':>14}")
+    for mode, result in results.items():
+        agreement = "-"
+        if reference is not None:
+            matched = sum(matching_prefix(a, b) for a, b in zip(result["outputs"], reference["outputs"]))
+            agreement = f"{matched / (args.new_tokens * len(abstracts)):.0%}"
+        print(f"{mode:<18}{result['load_s']:>8.2f}{result['prefill_ms']:>12.1f}"
+              f"{result['decode_tok_s']:>14.1f}{agreement:>14}")
+
+
+if __name__ == "__main__":
+    main()
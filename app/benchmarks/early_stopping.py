@@ -0,0 +1,130 @@
+"""
+Tokens saved and readability impact of the PLS stopping criteria.
+
+Replays the reference summaries in ../data/simplified_texts.csv through
+PlsStoppingCriteria token by token, as if the model had written them, and
+compares two policies with max_new_tokens=900:
+
+- previous: min_new_tokens=500, so a summary that ends earlier is padded with
+  forced tokens up to 500 (counted here, but their text is unknown), and the
+  rest runs until EOS or 900 tokens;
+- structured: no minimum, and the criteria stop at the end of the Results
+  section, the word budget or a repetition loop.
+
+Reports tokens per summary under both, the stop reasons, the readability
+grades of the kept text against the previous output, and the criteria's cost
+per token. A second pass cuts each summary after LOOP_AFTER tokens and lets
+it loop on one sentence until max_new_tokens, to check the repetition
+detector. Token counts depend on the tokenizer: pass the model
+folder for real numbers, otherwise one is trained on the texts. Run from the
+app folder:
+
+    python -m benchmarks.early_stopping --tokenizer ./model/llm/
+"""
+import argparse
+import csv
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from transformers import AutoTokenizer
+
+from benchmarks.end_to_end import build_stub_model
+from core.scoring import get_scores
+from core.stopping import PlsStoppingCriteria
+
+MAX_NEW_TOKENS = 900
+PREVIOUS_MIN_NEW_TOKENS = 500
+LOOP_AFTER = 400
+LOOP = "The study showed that the medicine helped people. " * 100
+
+
+def load_texts(csv_path, samples):
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [row["simplified_text"] for _, row in zip(range(samples), csv.DictReader(f))]
+
+
+def replay(tokenizer, ids, word_budget):
+    """Feeds `ids` one token at a time; returns (stopper, tokens generated)."""
+    stopper = PlsStoppingCriteria(tokenizer, 0, word_budget=word_budget)
+    for generated, token_id in enumerate(ids[:MAX_NEW_TOKENS], 1):
+        stopper.reason = stopper.update([token_id])
+        if stopper.reason:
+            return stopper, generated
+    return stopper, min(len(ids), MAX_NEW_TOKENS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokenizer", help="Folder of the generation model's tokenizer")
+    parser.add_argument("--data", default="../data/simplified_texts.csv")
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--word-budget", type=int, default=900)
+    args = parser.parse_args()
+
+    texts = load_texts(args.data, args.samples)
+    tokenizer_path = args.tokenizer
+    if not tokenizer_path:
+        tokenizer_path = tempfile.mkdtemp(prefix="pls-stub-")
+        build_stub_model(tokenizer_path, texts)
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+
+    reasons, previous_tokens, structured_tokens, forced_tokens, capped = Counter(), [], [], 0, 0
+    deltas, seconds, replayed = {}, 0.0, 0
+    for text in texts:
+        ids = tokenizer(text, add_special_tokens=False).input_ids
+        # The reference summary ends with EOS
+        natural = len(ids) + 1
+        previous = min(max(natural, PREVIOUS_MIN_NEW_TOKENS), MAX_NEW_TOKENS)
+        forced_tokens += max(PREVIOUS_MIN_NEW_TOKENS - natural, 0)
+        capped += natural > MAX_NEW_TOKENS
+
+        start = time.perf_counter()
+        stopper, generated = replay(tokenizer, ids, args.word_budget)
+        seconds += time.perf_counter() - start
+        replayed += generated
+
+        if stopper.reason is None:
+            generated = min(natural, MAX_NEW_TOKENS)
+            reasons["eos" if natural <= MAX_NEW_TOKENS else "max_new_tokens"] += 1
+        else:
+            reasons[stopper.reason] += 1
+        previous_tokens.append(previous)
+        structured_tokens.append(generated)
+
+        previous_text = tokenizer.decode(ids[:MAX_NEW_TOKENS])
+        kept_text = tokenizer.decode(ids[:min(generated, MAX_NEW_TOKENS)][:stopper.keep_tokens]).rstrip()
+        before, after = get_scores(previous_text), get_scores(kept_text)
+        for name, value in after.model_dump().items():
+            deltas.setdefault(name, []).append(value - getattr(before, name))
+
+    loop_reasons, loop_saved = Counter(), []
+    for text in texts:
+        ids = tokenizer(text, add_special_tokens=False).input_ids[:LOOP_AFTER]
+        ids += tokenizer(" " + LOOP, add_special_tokens=False).input_ids
+        stopper, generated = replay(tokenizer, ids, args.word_budget)
+        loop_reasons[stopper.reason] += 1
+        loop_saved.append(MAX_NEW_TOKENS - generated)
+
+    previous_total, structured_total = sum(previous_tokens), sum(structured_tokens)
+    print(f"\n{len(texts)} summaries, tokenizer: {args.tokenizer or 'trained on the texts'}")
+    print(f"tokens per summary, previous policy   {statistics.mean(previous_tokens):8.1f}"
+          f"   ({forced_tokens / len(texts):.1f} of them forced by min_new_tokens)")
+    print(f"tokens per summary, structured        {statistics.mean(structured_tokens):8.1f}")
+    print(f"decode steps saved                    {previous_total - structured_total:8d}"
+          f"   ({1 - structured_total / previous_total:.1%})")
+    print(f"summaries cut by max_new_tokens       {capped:8d}")
+    print(f"criteria cost                         {seconds / replayed * 1e6:8.1f} us per token")
+    print("stop reasons: " + ", ".join(f"{reason} {count}" for reason, count in reasons.most_common()))
+    print("\nreadability of the kept text minus the previous output (mean, max |delta|)")
+    for name, values in deltas.items():
+        print(f"  {name:<5}{statistics.mean(values):+8.3f}{max(abs(v) for v in values):8.3f}")
+    print(f"\nlooping after {LOOP_AFTER} tokens: stop reasons {dict(loop_reasons)}, "
+          f"{statistics.mean(loop_saved):.1f} of {MAX_NEW_TOKENS - LOOP_AFTER} looping tokens saved per summary")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+End-to-end latency and throughput of /generate_pls on a CPU-only box.
+
+Builds a tiny randomly initialised Llama-style model (with a BPE tokenizer
+trained on the corpus and a Llama 3 style chat template), loads it together
+with the bundled DistilBERT classifier, and drives the FastAPI app in-process
+with abstracts from ../data at the requested concurrency. Reports p50/p95/p99
+latency, requests/s, generated tokens/s and the time spent in each stage
+(clean, classify, generate, score), and saves everything as JSON so runs can
+be compared. Run from the app folder:
+
+    python -m benchmarks.end_to_end --requests 32 --concurrency 4 --output bench.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+STAGES = {
+    "clean": "clean_text",
+    "classify": "classify_text",
+    "generate": "generate_pls_from_model",
+    "score": "get_scores",
+}
+CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for m in messages %}<|start_header_id|>{{ m['role'] }}<|end_header_id|>\n\n"
+    "{{ m['content'] }}<|eot_id|>{% endfor %}"
+    "{% if add_generation_prompt %}<|start_header_id|>assistant<|end_header_id|>\n\n{% endif %}"
+)
+
+
+def load_abstracts(csv_path, samples):
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [row["original_text"] for _, row in zip(range(samples), csv.DictReader(f))]
+
+
+def build_stub_model(path, corpus, seed=0):
+    """Saves a tiny random causal LM and a tokenizer trained on `corpus` to `path`."""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    from core.prompt_template import PROMPT_TEMPLATE
+
+    specials = ["<|begin_of_text|>", "<|eot_id|>", "<|start_header_id|>", "<|end_header_id|>"]
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(
+        [PROMPT_TEMPLATE] + corpus,
+        trainers.BpeTrainer(vocab_size=4000, special_tokens=specials,
+                            initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    )
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, bos_token=specials[0], eos_token=specials[1])
+    tokenizer.chat_template = CHAT_TEMPLATE
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=128, intermediate_size=256,
+        num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+    )
+    LlamaForCausalLM(config).save_pretrained(path)
+
+
+def instrument(main_module, timings):
+    """Wraps the pipeline functions used by main.py to record time per stage."""
+    lock = threading.Lock()
+    for stage, name in STAGES.items():
+        original = getattr(main_module, name)
+
+        def timed(*args, _original=original, _stage=stage, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                with lock:
+                    timings[_stage].append(time.perf_counter() - start)
+
+        setattr(main_module, name, timed)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "mean_ms": statistics.mean(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+async def drive(app, abstracts, total_requests, concurrency):
+    import httpx
+
+    latencies, statuses, texts = [], defaultdict(int), []
+    counter = iter(range(total_requests))
+
+    async def worker(client):
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.post("/generate_pls", json={"text": abstracts[i % len(abstracts)]})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                texts.append(response.json()["pls"])
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, dict(statuses), texts, elapsed
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=50, help="Distinct abstracts to cycle through")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--model-dir", help="Reuse or create the stub model here instead of a temp dir")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    abstracts = load_abstracts(args.data, args.samples)
+    model_dir = args.model_dir or tempfile.mkdtemp(prefix="pls-stub-")
+    if not os.path.exists(os.path.join(model_dir, "config.json")):
+        build_stub_model(model_dir, abstracts)
+
+    # Configure main.py before importing it: it loads the models at import time
+    os.environ.pop("MODEL_SOURCE", None)
+    os.environ["MODEL_PATH"] = model_dir
+    os.environ["MODEL_NAME"] = "stub-llama"
+    os.environ["RESULT_CACHE"] = "0"
+    os.environ.setdefault("INFERENCE_MAX_CONCURRENCY", str(args.concurrency))
+    os.environ.setdefault("INFERENCE_MAX_QUEUE", str(args.requests))
+
+    import main as app_main
+    from core import model_loader
+
+    if not app_main.model_startup.wait():
+        raise SystemExit(f"Models failed to load: {app_main.model_startup.status()}")
+
+    timings = defaultdict(list)
+    instrument(app_main, timings)
+
+    latencies, statuses, texts, elapsed = asyncio.run(
+        drive(app_main.app, abstracts, args.requests, args.concurrency)
+    )
+    generated_tokens = sum(len(model_loader.llama_tokenizer(text, add_special_tokens=False).input_ids)
+                           for text in texts)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "samples": len(abstracts),
+            "batch_max_size": os.environ.get("BATCH_MAX_SIZE", "1"),
+        },
+        "status_codes": statuses,
+        "elapsed_s": elapsed,
+        "requests_per_s": args.requests / elapsed,
+        "generated_tokens": generated_tokens,
+        "tokens_per_s": generated_tokens / elapsed,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
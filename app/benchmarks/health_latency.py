@@ -0,0 +1,115 @@
+"""
+Latency of /health and /get_model_name while PLS generations are running.
+
+Loads the app with a tiny random Llama-style model (see end_to_end.py), sends
+one warm-up request, then keeps --generations requests to /generate_pls and
+/generate_pls/stream in flight and probes the health endpoints every
+--interval-ms until they finish. Every probe must answer 200 within
+--max-latency-ms, or the script exits with status 1: a blocking call on the
+event loop shows up as a probe that waits for a whole generation. Run from
+the app folder:
+
+    python -m benchmarks.health_latency --generations 4 --max-latency-ms 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.end_to_end import build_stub_model, load_abstracts, percentile
+
+PROBES = ("/health", "/health/live", "/get_model_name")
+
+
+async def drive(app, abstracts, generations, interval):
+    import httpx
+
+    probes = {path: [] for path in PROBES}
+    failures, statuses = [], []
+    done = asyncio.Event()
+
+    async def generate(client, i):
+        body = {"text": abstracts[i % len(abstracts)]}
+        if i % 2:
+            async with client.stream("POST", "/generate_pls/stream", json=body) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+        else:
+            response = await client.post("/generate_pls", json=body)
+        statuses.append(response.status_code)
+
+    async def probe(client, path):
+        while not done.is_set():
+            start = time.perf_counter()
+            response = await client.get(path)
+            probes[path].append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures.append(f"{path}: {response.status_code}")
+            await asyncio.sleep(interval)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        # The first generation pays one-off costs (lazy kernel setup) that are not what is measured
+        await client.post("/generate_pls", json={"text": abstracts[0]})
+        probe_tasks = [asyncio.create_task(probe(client, path)) for path in PROBES]
+        start = time.perf_counter()
+        await asyncio.gather(*(generate(client, i) for i in range(generations)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*probe_tasks)
+    return probes, failures, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--generations", type=int, default=4)
+    parser.add_argument("--interval-ms", type=float, default=20)
+    parser.add_argument("--max-latency-ms", type=float, default=200)
+    parser.add_argument("--model-dir", help="Reuse or create the stub model here instead of a temp dir")
+    args = parser.parse_args()
+
+    abstracts = load_abstracts(args.data, args.generations)
+    model_dir = args.model_dir or tempfile.mkdtemp(prefix="pls-stub-")
+    if not os.path.exists(os.path.join(model_dir, "config.json")):
+        build_stub_model(model_dir, abstracts)
+
+    # Configure main.py before importing it: it loads the models at import time
+    os.environ.pop("MODEL_SOURCE", None)
+    os.environ["MODEL_PATH"] = model_dir
+    os.environ["MODEL_NAME"] = "stub-llama"
+    os.environ["RESULT_CACHE"] = "0"
+    os.environ.setdefault("INFERENCE_MAX_QUEUE", str(args.generations))
+
+    import main as app_main
+
+    if not app_main.model_startup.wait():
+        raise SystemExit(f"Models failed to load: {app_main.model_startup.status()}")
+
+    probes, failures, statuses, elapsed = asyncio.run(
+        drive(app_main.app, abstracts, args.generations, args.interval_ms / 1000)
+    )
+
+    print(f"\n{args.generations} generations in {elapsed:.1f} s, status codes {sorted(statuses)}")
+    print(f"{'endpoint':<18}{'probes':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    slow = 0
+    for path, latencies in probes.items():
+        slow += sum(latency * 1000 > args.max_latency_ms for latency in latencies)
+        print(f"{path:<18}{len(latencies):>8}{statistics.median(latencies) * 1000:>9.1f}"
+              f"{percentile(latencies, 99) * 1000:>9.1f}{max(latencies) * 1000:>9.1f}")
+
+    if any(status != 200 for status in statuses):
+        failures.append("a generation did not answer 200")
+    if slow:
+        failures.append(f"{slow} probes took longer than {args.max_latency_ms:g} ms")
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
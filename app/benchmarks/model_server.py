@@ -0,0 +1,169 @@
+"""
+Throughput of serve.py with several API workers and one model server.
+
+Starts the app over real HTTP twice with the same tiny stub model as
+benchmarks.end_to_end: once as a single process (`--workers 1`, models in the
+API process) and once as `--workers N` sharing a model server over a Unix
+socket. Each setup is driven with /generate_pls and /classify requests at the
+requested concurrency. Reports requests/s, p50/p95 latency and the resident
+memory of the whole process tree, since the point of the model server is one
+copy of the models however many workers there are. More workers only pay off
+with spare cores for HTTP handling, cleaning and scoring. Run from the app
+folder:
+
+    python -m benchmarks.model_server --workers 4 --requests 64 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.end_to_end import build_stub_model, load_abstracts, summarize
+
+ENDPOINTS = {
+    "generate_pls": lambda text: ("/generate_pls", {"text": text}),
+    "classify": lambda text: ("/classify", {"texts": [text]}),
+}
+
+
+def process_tree_rss_mb(root_pid):
+    """Resident memory of `root_pid` and all its descendants, read from /proc."""
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The parent pid follows the ")" that closes the command name
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children[ppid].append(int(entry))
+
+    total_kb, pending = 0, [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total_kb += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+        except OSError:
+            pass
+    return total_kb / 1024
+
+
+def start_server(workers, port, model_dir, concurrency, requests):
+    env = dict(os.environ, MODEL_PATH=model_dir, MODEL_NAME="stub-llama", RESULT_CACHE="0",
+               INFERENCE_MAX_CONCURRENCY=str(concurrency), INFERENCE_MAX_QUEUE=str(requests))
+    env.pop("MODEL_SOURCE", None)
+    env.pop("MODEL_SERVER_SOCKET", None)
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="pls-bench-"), "model-server.sock")
+    return subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--socket", socket_path],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+async def wait_ready(client, process, workers, timeout):
+    """Waits until `workers` consecutive readiness checks pass, so every worker has imported the app."""
+    deadline, streak = time.monotonic() + timeout, 0
+    while streak < workers:
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit("The server did not become ready")
+        try:
+            response = await client.get("/health/ready")
+            streak = streak + 1 if response.status_code == 200 else 0
+        except httpx.TransportError:
+            streak = 0
+        await asyncio.sleep(0.5)
+
+
+async def drive(client, abstracts, endpoint, total_requests, concurrency):
+    latencies, statuses = [], defaultdict(int)
+    counter = iter(range(total_requests))
+
+    async def worker():
+        for i in counter:
+            path, body = ENDPOINTS[endpoint](abstracts[i % len(abstracts)])
+            start = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "status_codes": dict(statuses),
+        "requests_per_s": total_requests / elapsed,
+        "latency": summarize(latencies),
+    }
+
+
+async def run_setup(workers, args, abstracts):
+    process = start_server(workers, args.port, args.model_dir, args.concurrency, args.requests)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None) as client:
+            await wait_ready(client, process, workers, args.startup_timeout)
+            # Warm up every worker's connection to the model server and the model itself
+            await drive(client, abstracts, "generate_pls", args.concurrency, args.concurrency)
+            result = {"workers": workers, "rss_mb": process_tree_rss_mb(process.pid)}
+            for endpoint in ENDPOINTS:
+                result[endpoint] = await drive(client, abstracts, endpoint, args.requests, args.concurrency)
+            result["rss_mb_after"] = process_tree_rss_mb(process.pid)
+            return result
+    finally:
+        stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=50, help="Distinct abstracts to cycle through")
+    parser.add_argument("--workers", type=int, default=4, help="API workers of the model server setup")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--model-dir", help="Reuse or create the stub model here instead of a temp dir")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    abstracts = load_abstracts(args.data, args.samples)
+    args.model_dir = args.model_dir or tempfile.mkdtemp(prefix="pls-stub-")
+    if not os.path.exists(os.path.join(args.model_dir, "config.json")):
+        build_stub_model(args.model_dir, abstracts)
+
+    results = [asyncio.run(run_setup(workers, args, abstracts)) for workers in (1, args.workers)]
+
+    print(f"\n{os.cpu_count()} CPUs, {args.requests} requests per endpoint, concurrency {args.concurrency}")
+    print(f"{'workers':>8}{'endpoint':>14}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>9}")
+    for result in results:
+        for endpoint in ENDPOINTS:
+            stats = result[endpoint]
+            print(f"{result['workers']:>8}{endpoint:>14}{stats['requests_per_s']:9.2f}"
+                  f"{stats['latency']['p50_ms']:10.1f}{stats['latency']['p95_ms']:10.1f}"
+                  f"{result['rss_mb_after']:9.0f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Prefill latency with and without the precomputed prompt-prefix KV cache.
+
+Also checks that greedy generation is token-for-token identical in both modes.
+Run from the app folder:
+
+    python -m benchmarks.prefix_cache --model-path ./model/llm/ --samples 20
+"""
+import argparse
+import csv
+import statistics
+import sys
+import time
+
+import torch
+
+from core import model_loader
+from core.prompt_template import PROMPT_TEMPLATE
+from core.text_cleaning import clean_text
+
+
+def load_abstracts(csv_path, samples):
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(f)
+        return [clean_text(row["original_text"]) for _, row in zip(range(samples), rows)]
+
+
+def time_prefill(input_ids, past_key_values=None):
+    start = time.perf_counter()
+    with torch.no_grad():
+        if past_key_values is None:
+            model_loader.llama_model(input_ids=input_ids, use_cache=True)
+        else:
+            cached = past_key_values.get_seq_length()
+            model_loader.llama_model(input_ids=input_ids[:, cached:], past_key_values=past_key_values, use_cache=True)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return time.perf_counter() - start
+
+
+def greedy_tokens(input_ids, max_new_tokens, past_key_values=None):
+    with torch.no_grad():
+        outputs = model_loader.llama_model.generate(
+            input_ids=input_ids,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=model_loader.llama_tokenizer.pad_token_id,
+            past_key_values=past_key_values,
+        )
+    return outputs[0, input_ids.shape[1]:].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--data", default="../data/simplified_texts.csv")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    model_loader.load_ai_model(args.model_path)
+    model_loader.build_prefix_cache(PROMPT_TEMPLATE)
+    prefix_length = len(model_loader.prefix_cache["input_ids"])
+
+    full_times, cached_times, identical = [], [], 0
+    abstracts = load_abstracts(args.data, args.samples)
+    for abstract in abstracts:
+        input_ids = model_loader.build_prompt_inputs(abstract, PROMPT_TEMPLATE)
+        full_times.append(time_prefill(input_ids))
+        cached_times.append(time_prefill(input_ids, model_loader.get_prefix_past_key_values(input_ids)))
+
+        reference = greedy_tokens(input_ids, args.new_tokens)
+        cached = greedy_tokens(input_ids, args.new_tokens, model_loader.get_prefix_past_key_values(input_ids))
+        identical += reference == cached
+
+    full_ms = statistics.median(full_times) * 1000
+    cached_ms = statistics.median(cached_times) * 1000
+    print(f"Prefix tokens:          {prefix_length}")
+    print(f"Prefill p50 (no cache): {full_ms:.1f} ms")
+    print(f"Prefill p50 (cached):   {cached_ms:.1f} ms")
+    print(f"Speedup:                {full_ms / cached_ms:.2f}x")
+    print(f"Identical outputs:      {identical}/{len(abstracts)}")
+    if identical != len(abstracts):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
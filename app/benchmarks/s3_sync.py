@@ -0,0 +1,124 @@
+"""
+Cold and warm timings of the S3 model sync against an in-process S3 stand-in.
+
+Uploads a synthetic model folder (a few large "safetensors" files uploaded
+with multipart, plus small config files) to a moto bucket, then times:
+the old one-by-one download, a cold sync into an empty folder, a warm sync
+with nothing changed, and a sync after one shard was replaced. Every synced
+file is compared byte for byte with the source. Run from the app folder
+(needs `pip install moto`):
+
+    python -m benchmarks.s3_sync --shards 3 --shard-mb 64
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import tempfile
+import time
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from moto import mock_aws
+
+from core.s3_sync import MANIFEST_NAME, sync_from_s3
+
+BUCKET = "pls-models"
+PREFIX = "models/sft2-merged/"
+
+
+def make_model_folder(path, shards, shard_mb):
+    os.makedirs(path)
+    for name in ("config.json", "generation_config.json", "tokenizer_config.json"):
+        with open(os.path.join(path, name), "w") as f:
+            f.write('{"example": true}\n')
+    for i in range(shards):
+        with open(os.path.join(path, f"model-{i + 1:05d}-of-{shards:05d}.safetensors"), "wb") as f:
+            for _ in range(shard_mb):
+                f.write(os.urandom(1024 * 1024))
+
+
+def upload(client, source):
+    config = TransferConfig(multipart_threshold=16 * 1024 * 1024, multipart_chunksize=16 * 1024 * 1024)
+    for name in sorted(os.listdir(source)):
+        client.upload_file(os.path.join(source, name), BUCKET, PREFIX + name, Config=config)
+
+
+def sequential_download(client, local_path):
+    """What download_from_s3 used to do: list and download every object in turn."""
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=PREFIX):
+        for obj in page.get('Contents', []):
+            local_file_path = os.path.join(local_path, os.path.relpath(obj['Key'], PREFIX))
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            client.download_file(BUCKET, obj['Key'], local_file_path)
+
+
+def check_same(source, target):
+    names = sorted(os.listdir(source))
+    _, mismatch, errors = filecmp.cmpfiles(source, target, names, shallow=False)
+    if mismatch or errors:
+        raise SystemExit(f"Synced files differ from the source: {mismatch + errors}")
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f} s   {result or ''}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--shard-mb", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--part-mb", type=int, default=16)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="s3-sync-bench-")
+    source = os.path.join(workdir, "source")
+    make_model_folder(source, args.shards, args.shard_mb)
+    total_mb = sum(os.path.getsize(os.path.join(source, name)) for name in os.listdir(source)) / 2 ** 20
+
+    def sync(target):
+        return sync_from_s3(client, BUCKET, PREFIX, target, max_workers=args.workers,
+                            part_size=args.part_mb * 1024 * 1024)
+
+    try:
+        with mock_aws():
+            client = boto3.client("s3", region_name="us-east-1",
+                                  config=Config(max_pool_connections=args.workers * args.workers))
+            client.create_bucket(Bucket=BUCKET)
+            upload(client, source)
+            print(f"{args.shards} shards, {total_mb:.0f} MB in total, {args.workers} workers\n")
+
+            timed("old sequential download", lambda: sequential_download(client, os.path.join(workdir, "old")))
+
+            target = os.path.join(workdir, "synced")
+            timed("cold sync", lambda: sync(target))
+            check_same(source, target)
+            timed("warm sync (no changes)", lambda: sync(target))
+
+            # Change one shard: only that file is fetched again
+            changed = sorted(name for name in os.listdir(source) if name.endswith(".safetensors"))[0]
+            with open(os.path.join(source, changed), "r+b") as f:
+                f.write(os.urandom(1024))
+            upload(client, source)
+            timed("sync after one shard changed", lambda: sync(target))
+            check_same(source, target)
+
+            # A file deleted on disk is detected through its size and fetched again
+            os.remove(os.path.join(target, "config.json"))
+            timed("sync after a local delete", lambda: sync(target))
+            check_same(source, target)
+
+            print(f"\nAll synced files match the source. Manifest: {os.path.join(target, MANIFEST_NAME)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
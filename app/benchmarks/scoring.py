@@ -0,0 +1,164 @@
+"""
+Speed and parity of the readability scorer against readability.getmeasures.
+
+Scores every text column of the CSV corpora in ../data with the previous
+implementation (syntok + readability.getmeasures) and with core.scoring, then
+reports the largest difference per measure, the time each one took and the
+speedup. On a sample of the texts, the Tokens of core.scoring.tokenize are
+also compared with those of syntok's Tokenizer.
+
+It also feeds a sample of the texts to ReadabilityAccumulator in random
+pieces (single characters, token-sized pieces of 1 to 8 characters and
+longer spans, plus edge cases around blank lines) and checks that its scores
+are exactly those of get_scores, timing what is left for scores() once the
+whole text was added. Exits with status 1 on any difference. Run from the
+app folder:
+
+    python -m benchmarks.scoring --processes 4
+"""
+import argparse
+import csv
+import glob
+import os
+import random
+import statistics
+import sys
+import time
+
+import readability
+import syntok.segmenter as segmenter
+from syntok.tokenizer import Tokenizer
+
+from core.scoring import ReadabilityAccumulator, get_scores, get_scores_batch, tokenize
+
+TEXT_COLUMNS = ("original_text", "simplified_text", "pls_text_content", "pls")
+MEASURES = {
+    "CLI": "Coleman-Liau",
+    "FRE": "FleschReadingEase",
+    "GFI": "GunningFogIndex",
+    "SMOG": "SMOGIndex",
+    "FKGL": "Kincaid",
+    "DCRS": "DaleChallIndex",
+}
+# Paragraph and run boundaries that may arrive split across pieces
+EDGE_CASES = (
+    "One line.\n\nTwo. Three.", "Hello.\r\n\r\n  World!  \n\n", "zero\u200bwidth space.\n \n\n",
+    "(see Fig. 1) e.g. this one. And", "Dr. Smith left.\n\n\n", "  \n\nword", "trailing \n", "hyphen-\nated word.",
+)
+
+
+def load_texts(pattern):
+    csv.field_size_limit(sys.maxsize)
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                texts.extend(row[c] for c in TEXT_COLUMNS if row.get(c) and row[c].strip())
+    return texts
+
+
+def reference_scores(text):
+    tokenized = '\n\n'.join(
+        '\n'.join(' '.join(token.value for token in sentence) for sentence in paragraph)
+        for paragraph in segmenter.analyze(text))
+    grades = readability.getmeasures(tokenized, lang='en')['readability grades']
+    return {name: grades[key] for name, key in MEASURES.items()}
+
+
+def check_tokenize(texts):
+    """Texts with a paragraph that core.scoring.tokenize splits unlike syntok's Tokenizer."""
+    tokenizer = Tokenizer(replace_not_contraction=False)
+    mismatches = []
+    for text in texts:
+        for offset, paragraph in segmenter.preprocess_with_offsets(text):
+            expected = [(t.spacing, t.value, t.offset) for t in tokenizer.tokenize(paragraph, offset)]
+            if [(t.spacing, t.value, t.offset) for t in tokenize(paragraph, offset)] != expected:
+                mismatches.append(text)
+                break
+    return mismatches
+
+
+def check_incremental(texts, seed=0):
+    """
+    Texts whose accumulated scores differ from get_scores, and the seconds
+    spent in scores() and in get_scores.
+    """
+    rng = random.Random(seed)
+    piece_sizes = (lambda: 1, lambda: rng.randint(1, 8), lambda: rng.randint(1, 200))
+    mismatches, finish_seconds, one_shot_seconds = [], [], []
+    for text in texts:
+        start = time.perf_counter()
+        try:
+            expected = get_scores(text)
+        except ValueError:
+            continue
+        one_shot_seconds.append(time.perf_counter() - start)
+        for piece_size in piece_sizes:
+            accumulator = ReadabilityAccumulator()
+            position = 0
+            while position < len(text):
+                size = piece_size()
+                accumulator.add(text[position:position + size])
+                position += size
+            start = time.perf_counter()
+            scores = accumulator.scores()
+            finish_seconds.append(time.perf_counter() - start)
+            if scores != expected:
+                mismatches.append(text)
+                break
+    return mismatches, finish_seconds, one_shot_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/*.csv", help="Glob of CSV corpora")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    parser.add_argument("--skip-reference", action="store_true", help="Only time the new scorer")
+    parser.add_argument("--incremental-samples", type=int, default=300,
+                        help="Texts fed to ReadabilityAccumulator piece by piece")
+    args = parser.parse_args()
+
+    texts = load_texts(args.data)
+    print(f"Texts: {len(texts)}")
+
+    sample = random.Random(0).sample(texts, min(args.incremental_samples, len(texts)))
+    mismatches = check_tokenize(sample + list(EDGE_CASES))
+    print(f"tokenize: {len(mismatches)} of {len(sample) + len(EDGE_CASES)} texts split unlike syntok")
+    if mismatches:
+        print(f"  first difference: {mismatches[0][:200]!r}")
+        sys.exit(1)
+
+    mismatches, finish_seconds, one_shot_seconds = check_incremental(sample)
+    for seed in range(20):
+        mismatches += check_incremental(EDGE_CASES, seed)[0]
+    print(f"ReadabilityAccumulator: {len(mismatches)} of {len(sample) + len(EDGE_CASES)} texts differ from get_scores")
+    print(f"  scores() after the last piece: {statistics.median(finish_seconds) * 1000:.2f} ms median, "
+          f"get_scores: {statistics.median(one_shot_seconds) * 1000:.2f} ms median")
+    if mismatches:
+        print(f"  first difference: {mismatches[0][:200]!r}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    scores = get_scores_batch(texts, processes=args.processes)
+    scoring_seconds = time.perf_counter() - start
+    print(f"core.scoring:          {scoring_seconds:.2f} s")
+    if args.skip_reference:
+        return
+
+    start = time.perf_counter()
+    reference = [reference_scores(text) for text in texts]
+    reference_seconds = time.perf_counter() - start
+    print(f"readability reference: {reference_seconds:.2f} s ({reference_seconds / scoring_seconds:.2f}x slower)")
+
+    failed = False
+    for name in MEASURES:
+        diff = max(abs(getattr(s, name) - r[name]) for s, r in zip(scores, reference))
+        print(f"  max |{name} diff| = {diff:.2e}")
+        failed |= diff > args.tolerance
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
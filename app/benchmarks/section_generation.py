@@ -0,0 +1,114 @@
+"""
+Latency and readability of section-parallel generation against the single pass.
+
+Loads the model through load_ai_model, generates the PLS of a few abstracts
+in the default single-pass mode and with GENERATION_MODE=sections, and
+reports the latency per summary, the generated tokens, the mean readability
+grades of both outputs and how many summaries have all four section
+headings. With --check, each section of the parallel batch is also compared
+with a separate greedy generate() of the prompt and its heading (use
+CPU_DTYPE=fp32 for an exact match). Run from the app folder:
+
+    python -m benchmarks.section_generation --model-path ./model/llm/ --samples 5
+"""
+import argparse
+import os
+import statistics
+import time
+
+import torch
+
+from benchmarks.end_to_end import load_abstracts
+from core import model_loader
+from core.prompt_template import PROMPT_TEMPLATE
+from core.scoring import get_scores
+from core.section_generation import SECTION_HEADINGS, SectionGenerator
+from core.stopping import parse_heading, section_index
+
+GRADES = ("FRE", "FKGL", "GFI", "SMOG", "CLI", "DCRS")
+
+
+def run(abstracts):
+    latencies, outputs = [], []
+    for abstract in abstracts:
+        start = time.perf_counter()
+        outputs.append(model_loader.generate_pls_from_model(abstract, PROMPT_TEMPLATE))
+        latencies.append(time.perf_counter() - start)
+    return latencies, outputs
+
+
+def has_all_sections(text) -> bool:
+    found = set()
+    for line in text.splitlines():
+        heading = parse_heading(line.strip())
+        if heading is not None and section_index(heading[1]) is not None:
+            found.add(section_index(heading[1]))
+    return len(found) == len(SECTION_HEADINGS)
+
+
+def mean_grades(texts) -> dict:
+    scores = [get_scores(text) for text in texts if text.strip()]
+    return {grade: statistics.mean(getattr(s, grade) for s in scores) if scores else float("nan") for grade in GRADES}
+
+
+def check_sections(loaded, section_generator, abstract) -> int:
+    """Sections of one abstract whose tokens differ from a separate greedy generation."""
+    inputs = model_loader.build_prompt_inputs(abstract, PROMPT_TEMPLATE, loaded)
+    result = section_generator.generate(inputs, eos_token_ids={loaded.llama_tokenizer.eos_token_id})
+    mismatches = 0
+    for heading_ids, tokens in zip(section_generator.heading_ids, result["section_tokens"]):
+        prompt = torch.cat([inputs, heading_ids.unsqueeze(0).to(inputs.device)], dim=-1)
+        with torch.no_grad():
+            outputs = loaded.llama_model.generate(
+                input_ids=prompt, do_sample=False, max_new_tokens=len(tokens),
+                eos_token_id=loaded.llama_tokenizer.eos_token_id, pad_token_id=loaded.llama_tokenizer.pad_token_id,
+            )
+        mismatches += outputs[0, prompt.shape[1]:].tolist() != tokens
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH'), required=not os.environ.get('MODEL_PATH'))
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="Compare each section with a separate greedy generation")
+    args = parser.parse_args()
+
+    os.environ['GENERATION_MODE'] = 'single'
+    os.environ['BATCH_MAX_SIZE'] = '1'
+    os.environ.pop('DRAFT_MODEL_PATH', None)
+    loaded = model_loader.load_ai_model(args.model_path)
+    section_generator = SectionGenerator(
+        loaded.llama_model, loaded.llama_tokenizer, word_budget=int(os.environ.get('STOP_WORD_BUDGET', '900'))
+    )
+    abstracts = load_abstracts(args.data, args.samples)
+
+    single_latencies, single_outputs = run(abstracts)
+    loaded.section_generator = section_generator
+    sections_latencies, sections_outputs = run(abstracts)
+    loaded.section_generator = None
+
+    tokenizer = loaded.llama_tokenizer
+    print(f"\n{len(abstracts)} abstracts, section budgets {section_generator.budgets}")
+    print(f"{'':18}{'single':>10}{'sections':>10}")
+    for label, single, sections in (
+        ("mean latency s", statistics.mean(single_latencies), statistics.mean(sections_latencies)),
+        ("median latency s", statistics.median(single_latencies), statistics.median(sections_latencies)),
+        ("tokens per PLS", *(statistics.mean(len(tokenizer(t).input_ids) for t in outputs)
+                             for outputs in (single_outputs, sections_outputs))),
+    ):
+        print(f"{label:18}{single:10.2f}{sections:10.2f}")
+    single_grades, sections_grades = mean_grades(single_outputs), mean_grades(sections_outputs)
+    for grade in GRADES:
+        print(f"{grade:18}{single_grades[grade]:10.2f}{sections_grades[grade]:10.2f}")
+    print(f"{'all 4 sections':18}{sum(map(has_all_sections, single_outputs)):10d}"
+          f"{sum(map(has_all_sections, sections_outputs)):10d}")
+
+    if args.check:
+        mismatches = sum(check_sections(loaded, section_generator, abstract) for abstract in abstracts)
+        print(f"sections that differ from a separate greedy generation: {mismatches}/{len(abstracts) * len(SECTION_HEADINGS)}")
+
+
+if __name__ == "__main__":
+    main()
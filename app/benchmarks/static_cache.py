@@ -0,0 +1,110 @@
+"""
+Per-token decode latency of the static KV cache and compiled decode step.
+
+Loads the model through load_ai_model with STATIC_CACHE=1, which warms up
+(and compiles) every prompt bucket before returning, then generates the PLS
+of a few abstracts through generate_pls_from_model in three modes:
+
+- eager: the dynamic cache, as without STATIC_CACHE;
+- static: the preallocated cache with the decode step left eager;
+- compiled: the preallocated cache with the compiled decode step.
+
+Reports the per-token decode latency (from the Prometheus decode histogram),
+the first and median request latency and how many outputs match eager. On
+CPU the compiled path uses inductor's C++ backend without CUDA graphs, so
+expect much smaller gains than on a GPU; bf16 rounding can also change a few
+greedy tokens, since attention runs over the whole padded cache. Run from the
+app folder:
+
+    python -m benchmarks.static_cache --model-path ./model/llm/ --max-new-tokens 128
+"""
+import argparse
+import os
+import statistics
+import time
+
+from prometheus_client import REGISTRY
+
+from benchmarks.end_to_end import load_abstracts
+from core import model_loader
+from core.prompt_template import PROMPT_TEMPLATE
+from core.static_cache import StaticCachePool
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def run(abstracts):
+    decode_before = sample("pls_stage_duration_seconds_sum", stage="decode")
+    tokens_before = sample("pls_generated_tokens_total")
+    latencies, outputs = [], []
+    for abstract in abstracts:
+        start = time.perf_counter()
+        outputs.append(model_loader.generate_pls_from_model(abstract, PROMPT_TEMPLATE))
+        latencies.append(time.perf_counter() - start)
+    decode_seconds = sample("pls_stage_duration_seconds_sum", stage="decode") - decode_before
+    # The first token of each generation comes from the prefill
+    decode_tokens = sample("pls_generated_tokens_total") - tokens_before - len(abstracts)
+    return {
+        "decode_ms_per_token": decode_seconds / max(decode_tokens, 1) * 1000,
+        "first_s": latencies[0],
+        "median_s": statistics.median(latencies[1:] or latencies),
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH'), required=not os.environ.get('MODEL_PATH'))
+    parser.add_argument("--data", default="../data/abstract_generated_pls_gemini25.csv")
+    parser.add_argument("--samples", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, help="Override the generation length for quick runs")
+    parser.add_argument("--buckets", help="STATIC_CACHE_BUCKETS for this run")
+    args = parser.parse_args()
+
+    if args.max_new_tokens:
+        # Before loading, so the caches are sized for it
+        get_generation_config = model_loader.get_generation_config
+
+        def short_generation_config(loaded=None):
+            config = get_generation_config(loaded)
+            config.min_new_tokens = min(config.min_new_tokens, args.max_new_tokens)
+            config.max_new_tokens = args.max_new_tokens
+            return config
+
+        model_loader.get_generation_config = short_generation_config
+
+    os.environ['STATIC_CACHE'] = '1'
+    os.environ['BATCH_MAX_SIZE'] = '1'
+    os.environ.pop('DRAFT_MODEL_PATH', None)
+    if args.buckets:
+        os.environ['STATIC_CACHE_BUCKETS'] = args.buckets
+    start = time.perf_counter()
+    loaded = model_loader.load_ai_model(args.model_path)
+    load_seconds = time.perf_counter() - start
+
+    abstracts = load_abstracts(args.data, args.samples)
+    compiled_pool = loaded.static_cache_pool
+    eager_pool = StaticCachePool(loaded.llama_model, compiled_pool.buckets, compiled_pool.max_new_tokens,
+                                 compile_decode=False)
+
+    results = {}
+    for mode, pool in (("eager", None), ("static", eager_pool), ("compiled", compiled_pool)):
+        loaded.static_cache_pool = pool
+        results[mode] = run(abstracts)
+
+    prompt_lengths = [model_loader.build_prompt_inputs(a, PROMPT_TEMPLATE).shape[1] for a in abstracts]
+    print(f"\n{len(abstracts)} abstracts, prompts of {min(prompt_lengths)}-{max(prompt_lengths)} tokens, "
+          f"buckets {compiled_pool.buckets}, device {model_loader.llama_model.device}, "
+          f"compiled decode: {compiled_pool.compile_config is not None}")
+    print(f"load with warmup {load_seconds:.1f} s")
+    print(f"{'mode':<10}{'decode ms/token':>16}{'first s':>9}{'median s':>10}{'same as eager':>15}")
+    for mode, result in results.items():
+        same = sum(a == b for a, b in zip(result["outputs"], results["eager"]["outputs"]))
+        print(f"{mode:<10}{result['decode_ms_per_token']:>16.2f}{result['first_s']:>9.2f}"
+              f"{result['median_s']:>10.2f}{f'{same}/{len(abstracts)}':>15}")
+
+
+if __name__ == "__main__":
+    main()
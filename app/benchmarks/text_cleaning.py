@@ -0,0 +1,141 @@
+"""
+Speed and parity of clean_text against the previous implementation.
+
+Checks that core.text_cleaning gives exactly the output of the previous
+clean_text (NFKC, a unicodedata.category filter per character and two regex
+passes) on:
+
+- every code point of the Basic Multilingual Plane and a sample beyond it,
+  alone and between whitespace, quotes and letters;
+- random strings built from the characters each step treats specially
+  (controls, Unicode spaces, quotes, compatibility forms, combining marks,
+  surrogates, private use and unassigned code points, emoji);
+- every text column of the CSV corpora in ../data, through clean_texts.
+
+Then times both over the corpus, split into ASCII and non-ASCII texts. Exits
+with status 1 and prints the first counterexample on any difference. Run
+from the app folder:
+
+    python -m benchmarks.text_cleaning --random 200000
+"""
+import argparse
+import csv
+import glob
+import random
+import re
+import sys
+import time
+import unicodedata
+
+from core.text_cleaning import clean_text, clean_texts
+
+TEXT_COLUMNS = ("original_text", "simplified_text", "pls_text_content", "pls")
+SPECIAL = (
+    "\x00\x07\t\n\x0b\x0c\r\x1c\x1f\x7f\x85\xa0\xad   ​‍   "
+    " ⁠　﻿￹\"'‘’“”＂＇`‐–…"
+    "ﬁ①Ａ½ééẛ̣ÅÅ가가𐏿"
+    "͸￾\U0001f600\U0001d400\U000e0001\U000e0020\U000f0000\U0010fffd\U0010ffff"
+)
+PLAIN = "ab Z.,;-0"
+
+
+def previous_clean_text(text):
+    """clean_text before the fast path, kept as the reference."""
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize('NFKC', text)
+    text = "".join(ch for ch in text if unicodedata.category(ch)[0] != "C")
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'["\']', '', text)
+    return text.strip()
+
+
+def stream_texts(pattern):
+    """Yields the non-empty text columns of every CSV matching `pattern`, one row at a time."""
+    csv.field_size_limit(sys.maxsize)
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield from (row[c] for c in TEXT_COLUMNS if row.get(c))
+
+
+def code_point_cases(rng, astral_samples):
+    astral = rng.sample(range(0x10000, sys.maxunicode + 1), astral_samples)
+    for code in list(range(0x10000)) + astral:
+        ch = chr(code)
+        yield ch
+        yield f" a{ch}' \n{ch}{ch}b\t{ch} "
+
+
+def random_cases(rng, count, max_length=40):
+    alphabet = SPECIAL + PLAIN
+    for _ in range(count):
+        yield "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+
+def check(cases):
+    """Returns (cases checked, first counterexample or None)."""
+    checked = 0
+    for text in cases:
+        checked += 1
+        if clean_text(text) != previous_clean_text(text):
+            return checked, text
+    return checked, None
+
+
+def timed(function, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            function(text)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="../data/*.csv")
+    parser.add_argument("--random", type=int, default=200000, help="Random strings to check")
+    parser.add_argument("--astral", type=int, default=20000, help="Code points beyond the BMP to check")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    corpus = list(stream_texts(args.data))
+
+    for name, cases in (("code points", code_point_cases(rng, args.astral)),
+                        ("random strings", random_cases(rng, args.random))):
+        checked, counterexample = check(cases)
+        print(f"{name:<16} {checked:>9} checked, {'identical' if counterexample is None else 'MISMATCH'}")
+        if counterexample is not None:
+            failed = True
+            print(f"  input    {counterexample!r}\n  expected {previous_clean_text(counterexample)!r}\n"
+                  f"  got      {clean_text(counterexample)!r}")
+
+    mismatches = [(text, output) for text, output in zip(corpus, clean_texts(corpus))
+                  if output != previous_clean_text(text)]
+    print(f"{'corpus texts':<16} {len(corpus):>9} checked, {'identical' if not mismatches else 'MISMATCH'}")
+    if mismatches:
+        failed = True
+        text, output = mismatches[0]
+        print(f"  input    {text[:200]!r}...\n  expected {previous_clean_text(text)[:200]!r}...\n  got      {output[:200]!r}...")
+
+    print(f"\n{'texts':<10} {'count':>6} {'MB':>7} {'previous ms':>12} {'new ms':>9} {'speedup':>8}")
+    for name, texts in (("ascii", [t for t in corpus if t.isascii()]),
+                        ("non-ascii", [t for t in corpus if not t.isascii()]),
+                        ("all", corpus)):
+        if not texts:
+            continue
+        previous = timed(previous_clean_text, texts, args.repeat)
+        new = timed(clean_text, texts, args.repeat)
+        megabytes = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+        print(f"{name:<10} {len(texts):>6} {megabytes:>7.1f} {previous * 1000:>12.1f} {new * 1000:>9.1f} "
+              f"{previous / new:>7.1f}x")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from transformers import DynamicCache
+
+from core.cancellation import GenerationCancelled
+
+
+class GenerationJob:
+    """A single prompt waiting for (or taking part in) a batched decode."""
+
+    def __init__(self, input_ids, gen_config, streamer=None, stopping_criteria=None, cancellation=None):
+        self.input_ids = input_ids
+        self.gen_config = gen_config
+        self.streamer = streamer
+        self.stopping_criteria = stopping_criteria
+        self.cancellation = cancellation
+        self.tokens = []
+        self.future = Future()
+
+
+class GenerationScheduler:
+    """
+    Continuous batching scheduler for greedy decoding.
+
+    Concurrent callers submit prompts to a queue. A single worker thread owns the
+    model: it prefills newly arrived prompts, merges them into the running batch
+    (left padded, sharing one KV cache) and advances every sequence one token per
+    step. Finished sequences leave the batch immediately and waiting prompts take
+    their slot on the next step.
+
+    `prefix_provider` may return a dict with the `input_ids` and
+    `past_key_values` of a shared prompt prefix; prompts that start with it
+    only prefill the remaining tokens.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_wait_ms=20, prefix_provider=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.prefix_provider = prefix_provider
+        self.pad_token_id = tokenizer.pad_token_id
+
+        self._queue = queue.Queue()
+        self._jobs = []
+        self._cache = None
+        self._mask = None
+        self._last_tokens = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids, gen_config, streamer=None, stopping_criteria=None, cancellation=None) -> Future:
+        """
+        Queues a 1-D tensor of prompt ids. The returned future resolves to the
+        tensor of newly generated token ids, or fails with GenerationCancelled
+        if `cancellation` fires before the prompt joins the batch. Once it has
+        joined, the stopping criteria are what stop it.
+        """
+        if gen_config.do_sample:
+            raise ValueError("GenerationScheduler only supports greedy decoding (do_sample=False).")
+        job = GenerationJob(input_ids.reshape(-1).cpu(), gen_config, streamer, stopping_criteria, cancellation)
+        self._queue.put(job)
+        return job.future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def active_jobs(self) -> int:
+        return len(self._jobs)
+
+    def close(self):
+        """
+        Stops the worker thread once the jobs already submitted are done, so
+        it no longer holds the model; nothing may be submitted afterwards.
+        """
+        self._queue.put(None)
+
+    # --- Worker loop ---
+
+    def _run(self):
+        while not (self._closed and not self._jobs and self._queue.empty()):
+            new_jobs = self._collect()
+            try:
+                with torch.no_grad():
+                    if new_jobs:
+                        self._admit(new_jobs)
+                    if self._jobs:
+                        self._decode_step()
+            except Exception as e:
+                print(f"Generation scheduler error: {e}")
+                self._fail_all(new_jobs, e)
+
+    def _collect(self):
+        """
+        Takes waiting jobs off the queue. When the batch is idle it blocks for the
+        first job and then waits up to max_wait for others to join; while decoding
+        it only picks up what is already queued so running sequences never stall.
+        """
+        free_slots = self.max_batch_size - len(self._jobs)
+        jobs = []
+        if not self._jobs and not self._closed:
+            jobs.append(self._queue.get())
+            deadline = time.monotonic() + self.max_wait
+            while len(jobs) < free_slots:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            while len(jobs) < free_slots:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        if None in jobs:
+            # close() was called; jobs queued before it still run
+            self._closed = True
+            jobs = [job for job in jobs if job is not None]
+        return [job for job in jobs if job.future.set_running_or_notify_cancel() and not self._drop_cancelled(job)]
+
+    @staticmethod
+    def _drop_cancelled(job) -> bool:
+        """Fails a job cancelled while it waited, so it is never prefilled."""
+        reason = job.cancellation.reason() if job.cancellation is not None else None
+        if reason is None:
+            return False
+        if job.streamer is not None:
+            job.streamer.end()
+        job.future.set_exception(GenerationCancelled(reason))
+        return True
+
+    def _admit(self, jobs):
+        """Prefills the new prompts as one padded batch and merges them into the running batch."""
+        device = self.model.device
+        prefix_ids, cache = self._shared_prefix(jobs)
+        skip = len(prefix_ids)
+
+        # Layout of each row: [shared prefix][padding][rest of the prompt]
+        lengths = [len(job.input_ids) - skip for job in jobs]
+        width = max(lengths)
+        input_ids = torch.full((len(jobs), width), self.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(jobs), skip + width), dtype=torch.long)
+        mask[:, :skip] = 1
+        for i, job in enumerate(jobs):
+            input_ids[i, width - lengths[i]:] = job.input_ids[skip:]
+            mask[i, skip + width - lengths[i]:] = 1
+            if job.streamer is not None:
+                job.streamer.put(job.input_ids.unsqueeze(0))
+
+        input_ids, mask = input_ids.to(device), mask.to(device)
+        position_ids = (mask.cumsum(-1) - 1).clamp(min=0)[:, skip:]
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+        )
+        next_tokens = self._select_tokens(jobs, outputs.logits[:, -1, :])
+
+        if self._jobs:
+            self._cache, self._mask = _merge_caches(self._cache, self._mask, outputs.past_key_values, mask)
+            self._last_tokens = torch.cat([self._last_tokens, next_tokens])
+        else:
+            self._cache, self._mask = outputs.past_key_values, mask
+            self._last_tokens = next_tokens
+        self._jobs.extend(jobs)
+        self._finish_done()
+
+    def _shared_prefix(self, jobs):
+        """
+        Returns the cached prefix tokens common to every new prompt and a copy
+        of their KV cache expanded to the batch, or an empty prefix and a fresh cache.
+        """
+        prefix = self.prefix_provider() if self.prefix_provider else None
+        if prefix is None:
+            return _empty_ids(), DynamicCache()
+
+        prefix_ids = prefix["input_ids"]
+        # Keep at least one token per prompt for the prefill
+        length = min(common_prefix_length(prefix_ids, job.input_ids[:-1]) for job in jobs)
+        if length == 0:
+            return _empty_ids(), DynamicCache()
+
+        cache = copy.deepcopy(prefix["past_key_values"])
+        if length < len(prefix_ids):
+            cache.crop(length - len(prefix_ids))
+        cache.batch_repeat_interleave(len(jobs))
+        return prefix_ids[:length], cache
+
+    def _decode_step(self):
+        """Advances every running sequence by one token."""
+        device = self.model.device
+        self._mask = torch.cat([self._mask, torch.ones((len(self._jobs), 1), dtype=torch.long, device=device)], dim=-1)
+        position_ids = self._mask.sum(-1, keepdim=True) - 1
+        outputs = self.model(
+            input_ids=self._last_tokens.unsqueeze(-1),
+            attention_mask=self._mask,
+            position_ids=position_ids,
+            past_key_values=self._cache,
+            use_cache=True,
+        )
+        self._cache = outputs.past_key_values
+        self._last_tokens = self._select_tokens(self._jobs, outputs.logits[:, -1, :])
+        self._finish_done()
+
+    def _select_tokens(self, jobs, logits):
+        """Greedy selection honouring each job's min_new_tokens, then records the token."""
+        for i, job in enumerate(jobs):
+            if len(job.tokens) < (job.gen_config.min_new_tokens or 0):
+                logits[i, _eos_ids(job.gen_config)] = -float("inf")
+        next_tokens = logits.argmax(dim=-1)
+        for job, token in zip(jobs, next_tokens.tolist()):
+            job.tokens.append(token)
+            if job.streamer is not None:
+                job.streamer.put(torch.tensor([token]))
+        return next_tokens
+
+    def _finish_done(self):
+        """Resolves finished jobs and drops their rows from the shared cache."""
+        keep = []
+        for i, job in enumerate(self._jobs):
+            if _is_finished(job):
+                if job.streamer is not None:
+                    job.streamer.end()
+                job.future.set_result(torch.tensor(job.tokens, dtype=torch.long))
+            else:
+                keep.append(i)
+
+        if len(keep) == len(self._jobs):
+            return
+        self._jobs = [self._jobs[i] for i in keep]
+        if not self._jobs:
+            self._cache, self._mask, self._last_tokens = None, None, None
+            return
+
+        index = torch.tensor(keep, device=self._mask.device)
+        self._cache.batch_select_indices(index)
+        self._mask = self._mask[index]
+        self._last_tokens = self._last_tokens[index]
+
+        # Drop leading columns that are padding for every remaining row
+        offset = int((self._mask.sum(0) == 0).long().cumprod(0).sum())
+        if offset:
+            self._mask = self._mask[:, offset:]
+            for layer in self._cache.layers:
+                layer.keys = layer.keys[..., offset:, :]
+                layer.values = layer.values[..., offset:, :]
+
+    def _fail_all(self, new_jobs, error):
+        for job in self._jobs + [job for job in new_jobs if job not in self._jobs]:
+            if job.streamer is not None:
+                job.streamer.end()
+            if not job.future.done():
+                job.future.set_exception(error)
+        self._jobs, self._cache, self._mask, self._last_tokens = [], None, None, None
+
+
+def _eos_ids(gen_config):
+    eos = gen_config.eos_token_id
+    if eos is None:
+        return []
+    return eos if isinstance(eos, list) else [eos]
+
+
+def _is_finished(job) -> bool:
+    if job.tokens[-1] in _eos_ids(job.gen_config):
+        return True
+    if len(job.tokens) >= job.gen_config.max_new_tokens:
+        return True
+    if job.stopping_criteria:
+        sequence = torch.cat([job.input_ids, torch.tensor(job.tokens, dtype=torch.long)]).unsqueeze(0)
+        return bool(job.stopping_criteria(sequence, None).any())
+    return False
+
+
+def _empty_ids():
+    return torch.zeros(0, dtype=torch.long)
+
+
+def common_prefix_length(a, b) -> int:
+    n = min(len(a), len(b))
+    mismatch = (a[:n] != b[:n]).nonzero()
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+def _merge_caches(cache_a, mask_a, cache_b, mask_b):
+    """Left pads two batched KV caches to the same length and stacks them on the batch dimension."""
+    width = max(mask_a.shape[1], mask_b.shape[1])
+    pad_a, pad_b = width - mask_a.shape[1], width - mask_b.shape[1]
+    for layer_a, layer_b in zip(cache_a.layers, cache_b.layers):
+        layer_a.keys = torch.cat([_left_pad(layer_a.keys, pad_a), _left_pad(layer_b.keys, pad_b)])
+        layer_a.values = torch.cat([_left_pad(layer_a.values, pad_a), _left_pad(layer_b.values, pad_b)])
+    mask = torch.cat([_left_pad(mask_a, pad_a, dim=1), _left_pad(mask_b, pad_b, dim=1)])
+    return cache_a, mask
+
+
+def _left_pad(tensor, amount, dim=-2):
+    if amount == 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = amount
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+# Why a generation was cut short: the client went away, or its deadline passed
+CANCEL_REASONS = ("disconnected", "deadline")
+
+
+class GenerationCancelled(Exception):
+    """A request was abandoned before its generation produced anything worth returning."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Generation cancelled: {reason}")
+        self.reason = reason
+
+
+class Cancellation:
+    """
+    Lets a request stop its own generation. The API handler calls cancel()
+    when the client disconnects, and an optional deadline (in time.monotonic()
+    seconds) stops decoding once it passes. The generation checks reason()
+    once per decoded token, so it stops within a few tokens.
+
+    `poll`, if given, is called by reason() and may return a cancel reason;
+    the model server uses it to read cancellations sent by API workers.
+    After a deadline stop, `truncated` is "deadline" and the partial PLS is
+    returned. Holds no torch objects, so API workers can create it.
+    """
+
+    def __init__(self, deadline: float = None, poll=None):
+        self.deadline = deadline
+        self.truncated = None
+        self._poll = poll
+        self._reason = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_max_latency(cls, seconds: float = None, poll=None):
+        """A Cancellation whose deadline is `seconds` from now, or without one."""
+        return cls(deadline=None if seconds is None else time.monotonic() + seconds, poll=poll)
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def cancel(self, reason: str = "disconnected"):
+        """Cancels the generation; only the first reason is kept."""
+        with self._lock:
+            if self._reason is not None:
+                return
+            self._reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(reason)
+
+    def add_callback(self, callback):
+        """Calls `callback(reason)` on cancel(), right away if already cancelled."""
+        with self._lock:
+            if self._reason is None:
+                self._callbacks.append(callback)
+                return
+        callback(self._reason)
+
+    def reason(self):
+        """The cancel reason, "deadline" once the deadline passed, or None."""
+        if self._reason is None:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel("deadline")
+            elif self._poll is not None:
+                reason = self._poll()
+                if reason:
+                    self.cancel(reason)
+        return self._reason
+
+    def check(self):
+        """Raises GenerationCancelled if the request was cancelled or is past its deadline."""
+        reason = self.reason()
+        if reason is not None:
+            raise GenerationCancelled(reason)
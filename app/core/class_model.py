@@ -1,10 +1,18 @@
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, Field
 
 # --- 2. Define Request/Response Models ---
 
 class GenerateRequest(BaseModel):
-    """The input request model containing the abstract text."""
+    """
+    The input request model containing the abstract text. With
+    `max_latency_seconds`, generation stops when that time has passed since
+    the request arrived and the PLS written so far is returned as truncated.
+    `model` picks a model listed by GET /models instead of the default one.
+    """
     text: str
+    max_latency_seconds: Optional[float] = Field(default=None, gt=0)
+    model: Optional[str] = None
 
 class ReadabilityScores(BaseModel):
     """Model for the nested readability scores."""
@@ -21,7 +29,42 @@ class AllScores(BaseModel):
     generated: ReadabilityScores
 
 class GenerateResponse(BaseModel):
-    """The standard success response model."""
+    """The standard success response model. `truncated` is set when the deadline cut the PLS short."""
     status: str
     pls: str
     scores: AllScores
+    truncated: bool = False
+
+
+class ClassifyRequest(BaseModel):
+    """Texts to classify as PLS or technical."""
+    texts: List[str]
+
+class Classification(BaseModel):
+    """Classifier decision for a single text."""
+    label: str
+    pls_probability: float
+
+class ClassifyResponse(BaseModel):
+    """Classifications in the same order as the request texts."""
+    results: List[Classification]
+
+
+class BatchItem(BaseModel):
+    """One abstract of a /generate_pls/batch request, with an optional caller id and model."""
+    id: Optional[str] = None
+    text: str
+    model: Optional[str] = None
+
+class BatchItemResult(BaseModel):
+    """
+    One NDJSON line of a /generate_pls/batch response. `index` is the item's
+    position in the request and `status` the HTTP status it would have had
+    on its own.
+    """
+    index: int
+    id: str
+    status: int
+    pls: Optional[str] = None
+    scores: Optional[AllScores] = None
+    detail: Optional[str] = None
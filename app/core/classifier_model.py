@@ -1,74 +1,277 @@
 import torch
 import json
 import os
+import queue
+import threading
+import time
 import torch.nn.functional as F
-from transformers import DistilBertTokenizer, DistilBertForSequenceClassification
+from concurrent.futures import Future
+from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
 from torch.optim import AdamW
 from fastapi import HTTPException
+from core.startup import model_build_lock
 
-claffier_tokenizer, classifier_model, optimizer = None, None, None
+classifier_tokenizer, classifier_model, optimizer = None, None, None
+classifier_batcher = None
+onnx_session = None
+chunking = "truncate"
+
+# Loaded once from inference_config.json in load_classifier_model
+custom_threshold = 0.5
+labels_map = {"0": "Technical", "1": "PLS"}
+
+CLASSIFIER_PATH = './model/pls_classifier'
+CLASSIFIER_BATCH_SIZE = int(os.environ.get('CLASSIFIER_BATCH_SIZE', '32'))
+# "torch" (fp32, GPU if available), "int8" (dynamically quantized, CPU) or "onnx" (ONNX Runtime, CPU)
+CLASSIFIER_BACKENDS = ("torch", "int8", "onnx")
+# How texts longer than CLASSIFIER_MAX_LENGTH tokens are scored: "truncate" (only
+# the first window), or the "mean" or "max" PLS probability of overlapping windows
+CLASSIFIER_CHUNKING_MODES = ("truncate", "mean", "max")
+CLASSIFIER_MAX_LENGTH = 256
+CLASSIFIER_CHUNK_OVERLAP = int(os.environ.get('CLASSIFIER_CHUNK_OVERLAP', '64'))
+CLASSIFIER_MAX_CHUNKS = int(os.environ.get('CLASSIFIER_MAX_CHUNKS', '8'))
+# Shorter texts cannot be a plain language summary and skip the model
+CLASSIFIER_MIN_TOKENS = int(os.environ.get('CLASSIFIER_MIN_TOKENS', '8'))
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def load_classifier_model():
+def load_classifier_model(backend: str = None, chunking_mode: str = None):
     """
-    Loads AI Classification Model    
+    Loads AI Classification Model
     """
 
-    global classifier_tokenizer, classifier_model, optimizer
+    global classifier_tokenizer, classifier_model, optimizer, classifier_batcher, onnx_session
+    global custom_threshold, labels_map, device, chunking
 
-    classifier_tokenizer = DistilBertTokenizer.from_pretrained('./model/pls_classifier')
-    classifier_model = DistilBertForSequenceClassification.from_pretrained('./model/pls_classifier')
-    classifier_model.to(device)
-    classifier_model.eval()
-    optimizer = AdamW(classifier_model.parameters(), lr=2e-5)
-    print(f"✅ Classifier model loaded. Main device: {classifier_model.device}")
+    backend = backend or os.environ.get('CLASSIFIER_BACKEND', 'torch')
+    if backend not in CLASSIFIER_BACKENDS:
+        raise ValueError(f"Unknown CLASSIFIER_BACKEND '{backend}'. Use one of {CLASSIFIER_BACKENDS}.")
+    chunking_mode = chunking_mode or os.environ.get('CLASSIFIER_CHUNKING', 'truncate')
+    if chunking_mode not in CLASSIFIER_CHUNKING_MODES:
+        raise ValueError(f"Unknown CLASSIFIER_CHUNKING '{chunking_mode}'. Use one of {CLASSIFIER_CHUNKING_MODES}.")
+    chunking = chunking_mode
 
+    classifier_tokenizer = DistilBertTokenizerFast.from_pretrained(CLASSIFIER_PATH)
+    with model_build_lock:
+        classifier_model = DistilBertForSequenceClassification.from_pretrained(CLASSIFIER_PATH)
+    classifier_model.eval()
+    onnx_session = None
 
-def classify_text(text: str):
-    """
-    Uses the loaded model to classify if text is PLS or not.
-    """
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    config_path = ("./model/pls_classifier/inference_config.json")
-    custom_threshold = 0.5 # Default fallback
+    if backend == "torch":
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        classifier_model.to(device)
+        optimizer = AdamW(classifier_model.parameters(), lr=2e-5)
+    else:
+        # CPU backends leave the GPU to the generation model
+        device = torch.device("cpu")
+        optimizer = None
+        if backend == "int8":
+            classifier_model = torch.ao.quantization.quantize_dynamic(
+                classifier_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        else:
+            onnx_session = load_onnx_session(classifier_model)
 
+    config_path = os.path.join(CLASSIFIER_PATH, "inference_config.json")
     if os.path.exists(config_path):
         with open(config_path, "r") as f:
             inference_config = json.load(f)
             custom_threshold = inference_config.get("threshold", 0.5)
             labels_map = inference_config.get("labels", {"0": "Technical", "1": "PLS"})
             print(f"[INFO] Loaded custom threshold: {custom_threshold}")
-    else:
-        labels_map = {"0": "Technical", "1": "PLS"}
-        
+
+    # Concurrent single-text calls are grouped into one forward pass
+    if classifier_batcher is None:
+        classifier_batcher = ClassifierBatcher(
+            max_batch_size=CLASSIFIER_BATCH_SIZE,
+            max_wait_ms=float(os.environ.get('CLASSIFIER_MAX_WAIT_MS', '5')),
+        )
+    print(f"✅ Classifier model loaded. Backend: {backend}. Chunking: {chunking}. Main device: {device}")
+
+
+def load_onnx_session(model):
+    """
+    Creates an ONNX Runtime session for the classifier, exporting model.onnx
+    next to model.safetensors the first time (or when the weights are newer).
+    """
+    import onnxruntime as ort
+
+    onnx_path = os.path.join(CLASSIFIER_PATH, "model.onnx")
+    weights_path = os.path.join(CLASSIFIER_PATH, "model.safetensors")
+    if not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(weights_path):
+        print(f"Exporting classifier to {onnx_path}...")
+        sample = classifier_tokenizer(["sample text"], return_tensors="pt")
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+
+def classify_text(text: str):
+    """
+    Uses the loaded model to classify if text is PLS or not.
+    """
+    if classifier_model is None or classifier_tokenizer is None:
+        print("model or tokenizer not loaded.")
+        raise HTTPException(status_code=500, detail="Model or tokenizer not loaded.")
+
+    return classifier_batcher.submit(text).result()
+
+
+def classify_texts(texts: list, batch_size: int = CLASSIFIER_BATCH_SIZE) -> list:
+    """
+    Classifies many texts with padded batches. Returns a list of
+    (predicted_label, pls_probability) in the same order as `texts`.
+    """
     if classifier_model is None or classifier_tokenizer is None:
         print("model or tokenizer not loaded.")
         raise HTTPException(status_code=500, detail="Model or tokenizer not loaded.")
 
-    
+    # Batch texts of similar length together to keep padding small
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    probabilities = [0.0] * len(texts)
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        batch_probs = pls_probabilities([texts[i] for i in indices])
+        for i, prob in zip(indices, batch_probs):
+            probabilities[i] = prob
+
+    return [(label_for(prob), prob) for prob in probabilities]
+
+
+def pls_probabilities(texts: list) -> list:
+    """
+    Probability of class 1 (PLS) for each text, in a single forward pass.
+    With chunking, the windows of every text go through that same pass.
+    """
+    split = chunking != "truncate"
     inputs = classifier_tokenizer(
-            text, 
-            return_tensors="pt", 
-            padding=True, 
-            truncation=True, 
-            max_length=256
-        ).to(device)
-
-    with torch.no_grad():
-        outputs = classifier_model(**inputs)
-        logits = outputs.logits
-    
+            texts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=CLASSIFIER_MAX_LENGTH,
+            return_overflowing_tokens=split,
+            stride=CLASSIFIER_CHUNK_OVERLAP if split else 0,
+        )
+    # Text each row (window) comes from
+    owners = inputs.pop("overflow_to_sample_mapping", torch.arange(len(texts))).tolist()
+
+    probabilities = [0.0] * len(texts)
+    rows = select_windows(owners, inputs["attention_mask"])
+    if not rows:
+        return probabilities
+
+    # Drop the padding only the skipped rows needed
+    index = torch.tensor(rows)
+    width = int(inputs["attention_mask"][index].sum(dim=1).max())
+    window_probs = window_pls_probabilities({name: tensor[index, :width] for name, tensor in inputs.items()})
+
+    scores = {}
+    for row, prob in zip(rows, window_probs):
+        scores.setdefault(owners[row], []).append(prob)
+    for owner, values in scores.items():
+        probabilities[owner] = max(values) if chunking == "max" else sum(values) / len(values)
+    return probabilities
+
+
+def select_windows(owners: list, attention_mask) -> list:
+    """
+    Rows of the tokenized batch to score: up to CLASSIFIER_MAX_CHUNKS evenly
+    spaced windows per text (the first and last included), and none for texts
+    under CLASSIFIER_MIN_TOKENS tokens, which keep a PLS probability of 0.
+    """
+    windows = {}
+    for row, owner in enumerate(owners):
+        windows.setdefault(owner, []).append(row)
+
+    lengths = attention_mask.sum(dim=1).tolist()
+    rows = []
+    for text_rows in windows.values():
+        # Minus [CLS] and [SEP]
+        if len(text_rows) == 1 and lengths[text_rows[0]] - 2 < CLASSIFIER_MIN_TOKENS:
+            continue
+        if len(text_rows) > CLASSIFIER_MAX_CHUNKS:
+            step = (len(text_rows) - 1) / max(CLASSIFIER_MAX_CHUNKS - 1, 1)
+            text_rows = [text_rows[round(i * step)] for i in range(CLASSIFIER_MAX_CHUNKS)]
+        rows.extend(text_rows)
+    return rows
+
+
+def window_pls_probabilities(inputs: dict) -> list:
+    """
+    Probability of class 1 (PLS) for each row of tokenized `inputs`.
+    """
+    if onnx_session is not None:
+        logits = torch.from_numpy(onnx_session.run(
+            ["logits"],
+            {"input_ids": inputs["input_ids"].numpy(), "attention_mask": inputs["attention_mask"].numpy()}
+        )[0])
+    else:
+        with torch.no_grad():
+            outputs = classifier_model(**{name: tensor.to(device) for name, tensor in inputs.items()})
+            logits = outputs.logits
+
     # Convert logits to probabilities using Softmax
     probs = F.softmax(logits, dim=1)
-    
+
     # Get probability of Class 1 (PLS)
-    pls_probability = probs[0][1].item()
-    
+    return probs[:, 1].tolist()
+
+
+def label_for(pls_probability: float) -> str:
     # Apply the calibrated threshold
     if pls_probability > custom_threshold:
-        predicted_label = labels_map["1"] # PLS
-    else:
-        predicted_label = labels_map["0"] # Technical / Non-PLS
-        
-    return predicted_label, pls_probability
\ No newline at end of file
+        return labels_map["1"] # PLS
+    return labels_map["0"] # Technical / Non-PLS
+
+
+class ClassifierBatcher:
+    """
+    Groups concurrent classify_text calls into one padded forward pass. The
+    worker waits at most `max_wait_ms` for more texts once the first arrives.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait_ms=5):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="classifier-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while len(batch) < self.max_batch_size:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+
+            try:
+                results = classify_texts([text for text, _ in batch], batch_size=self.max_batch_size)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
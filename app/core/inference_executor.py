@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from fastapi import HTTPException
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for the blocking inference pipeline (classification,
+    generation and scoring), so the asyncio event loop stays free for
+    /health and other light endpoints.
+
+    At most `max_concurrency` jobs run at once and at most `max_queue` more may
+    wait. Anything beyond that is rejected right away with 429, and a job that
+    waits in the queue longer than `queue_timeout` seconds is dropped with 503.
+    Both responses carry a Retry-After header.
+    """
+
+    def __init__(self, max_concurrency=4, max_queue=16, queue_timeout=120.0, retry_after=30):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def pending(self) -> int:
+        """Jobs that are running or waiting for a worker."""
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Queues a blocking call, or raises 429 if the queue is already full.
+        """
+        with self._lock:
+            if self._pending >= self.max_concurrency + self.max_queue:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests in progress. Please retry later.",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+            self._pending += 1
+
+        future = self._pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Runs a blocking call in the pool and awaits its result without blocking
+        the event loop.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        wrapped = asyncio.wrap_future(future)
+
+        if self.queue_timeout:
+            done, _ = await asyncio.wait({wrapped}, timeout=self.queue_timeout)
+            # Only jobs that never got a worker can be cancelled
+            if not done and future.cancel():
+                raise HTTPException(
+                    status_code=503,
+                    detail="The server is busy. Please retry later.",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+
+        return await wrapped
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+
+def submit_thread(fn, *args) -> Future:
+    """Runs `fn(*args)` in a new daemon thread; for callers without an InferenceExecutor."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="pls-stream", daemon=True).start()
+    return future
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from core.cancellation import CANCEL_REASONS
+
+# --- Prometheus Metrics ---
+
+STAGE_SECONDS = Histogram(
+    "pls_stage_duration_seconds",
+    "Time spent in each pipeline stage. 'prefill' is the time to the first "
+    "generated token, including any wait to join the running batch.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+REQUEST_SECONDS = Histogram(
+    "pls_request_duration_seconds",
+    "End-to-end request time, including streaming the response body.",
+    ["endpoint", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160),
+)
+REQUESTS_IN_FLIGHT = Gauge("pls_requests_in_flight", "Requests currently being handled.", ["endpoint"])
+PROMPT_TOKENS = Counter("pls_prompt_tokens_total", "Prompt tokens sent to the generation model.")
+GENERATED_TOKENS = Counter("pls_generated_tokens_total", "Tokens generated by the generation model.")
+DECODE_TOKENS_PER_SECOND = Histogram(
+    "pls_decode_tokens_per_second",
+    "Decode speed of each generation.",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500),
+)
+QUEUE_DEPTH = Gauge(
+    "pls_queue_depth",
+    "Work waiting or running: 'inference' is the request executor, "
+    "'scheduler_waiting' and 'scheduler_active' the generation batch.",
+    ["queue"],
+)
+DRAFT_TOKENS = Counter(
+    "pls_draft_tokens_total",
+    "Tokens proposed by the draft model in assisted decoding, by whether the main model accepted them.",
+    ["result"],
+)
+ASSISTED_ACCEPTANCE_RATE = Histogram(
+    "pls_assisted_acceptance_rate",
+    "Share of draft tokens accepted per assisted generation.",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+ASSISTED_TOKENS_PER_STEP = Histogram(
+    "pls_assisted_tokens_per_step",
+    "Tokens produced per main-model forward pass in assisted decoding; plain "
+    "greedy decoding makes 1, so this bounds the speedup from the draft model.",
+    buckets=(1, 1.25, 1.5, 2, 2.5, 3, 4, 5, 6, 8),
+)
+
+GENERATION_STOPS = Counter(
+    "pls_generation_stops_total",
+    "Why each generation ended: 'eos' and 'max_new_tokens', the PLS stopping "
+    "criteria's 'results_complete', 'word_budget' and 'repetition', "
+    "'sections_complete' in section-parallel mode, or a cancellation: 'disconnected' (the client went away) and 'deadline'.",
+    ["reason"],
+)
+EARLY_STOP_SAVED_TOKENS = Counter(
+    "pls_early_stop_saved_tokens_total",
+    "Decode steps skipped by the PLS stopping criteria, counted up to max_new_tokens.",
+)
+CANCELLED_REQUESTS = Counter(
+    "pls_cancelled_requests_total",
+    "Generations abandoned because the client disconnected or the request's "
+    "deadline passed, by the stage they were in: 'queued' ones never started "
+    "decoding, 'generating' ones stopped early.",
+    ["reason", "stage"],
+)
+CANCELLED_SAVED_TOKENS = Counter(
+    "pls_cancelled_saved_tokens_total",
+    "Decode steps skipped by cancelled generations, counted up to max_new_tokens.",
+    ["reason"],
+)
+
+MODEL_LOAD_SECONDS = Gauge("pls_model_load_seconds", "Duration of each model loading step.", ["step"])
+COLD_START_SECONDS = Gauge("pls_cold_start_seconds", "Time from process start until every model was ready.")
+
+
+class ResultCacheCollector:
+    """Exposes the ResultCache hit and miss counters at scrape time."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        lookups = CounterMetricFamily("pls_result_cache_lookups", "Result cache lookups.", labels=["result"])
+        lookups.add_metric(["hit"], self.cache.hits)
+        lookups.add_metric(["miss"], self.cache.misses)
+        yield lookups
+
+
+class GpuMemoryCollector:
+    """Allocated and reserved CUDA memory per device, read at scrape time."""
+
+    def collect(self):
+        memory = GaugeMetricFamily("pls_gpu_memory_bytes", "CUDA memory used by this process.",
+                                   labels=["device", "kind"])
+        # API workers behind a model server never import torch and hold no CUDA memory
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            for index in range(torch.cuda.device_count()):
+                memory.add_metric([str(index), "allocated"], torch.cuda.memory_allocated(index))
+                memory.add_metric([str(index), "reserved"], torch.cuda.memory_reserved(index))
+        yield memory
+
+
+REGISTRY.register(GpuMemoryCollector())
+
+
+class ModelRegistryCollector:
+    """Resident generation models, their memory and load and eviction counts, read at scrape time."""
+
+    def __init__(self, get_registry):
+        self.get_registry = get_registry
+
+    def collect(self):
+        resident = GaugeMetricFamily("pls_model_resident", "1 for each generation model currently loaded.",
+                                     labels=["model"])
+        memory = GaugeMetricFamily("pls_model_memory_bytes",
+                                   "Memory of each loaded generation model, counted against MODEL_MEMORY_BUDGET_MB.",
+                                   labels=["model"])
+        loads = CounterMetricFamily("pls_model_loads", "Generation model loads by the model registry.",
+                                    labels=["model"])
+        evictions = CounterMetricFamily("pls_model_evictions",
+                                        "Generation models unloaded to stay within MODEL_MEMORY_BUDGET_MB.",
+                                        labels=["model"])
+        registry = self.get_registry()
+        if registry is not None:
+            sizes = registry.resident_memory()
+            for name in registry.specs:
+                resident.add_metric([name], 1 if name in sizes else 0)
+                if name in sizes:
+                    memory.add_metric([name], sizes[name])
+                loads.add_metric([name], registry.loads[name])
+                evictions.add_metric([name], registry.evictions[name])
+        yield resident
+        yield memory
+        yield loads
+        yield evictions
+
+
+def observe_generation(prompt_tokens: int, new_tokens: int, prefill_seconds: float, decode_seconds: float):
+    PROMPT_TOKENS.inc(prompt_tokens)
+    GENERATED_TOKENS.inc(new_tokens)
+    STAGE_SECONDS.labels("prefill").observe(prefill_seconds)
+    STAGE_SECONDS.labels("decode").observe(decode_seconds)
+    # The first token comes out of the prefill step
+    if new_tokens > 1 and decode_seconds > 0:
+        DECODE_TOKENS_PER_SECOND.observe((new_tokens - 1) / decode_seconds)
+
+
+def observe_assisted_generation(new_tokens: int, main_passes: int, draft_passes: int):
+    """
+    Each main-model pass yields one token of its own plus the draft tokens it
+    accepted, and each draft pass proposes one token.
+    """
+    if not main_passes:
+        return
+    accepted = max(new_tokens - main_passes, 0)
+    DRAFT_TOKENS.labels("accepted").inc(accepted)
+    DRAFT_TOKENS.labels("rejected").inc(max(draft_passes - accepted, 0))
+    if draft_passes:
+        ASSISTED_ACCEPTANCE_RATE.observe(min(accepted / draft_passes, 1.0))
+    ASSISTED_TOKENS_PER_STEP.observe(new_tokens / main_passes)
+
+
+def observe_stop(reason: str, new_tokens: int, max_new_tokens: int):
+    GENERATION_STOPS.labels(reason).inc()
+    if reason in CANCEL_REASONS:
+        observe_cancelled(reason, "generating", max(max_new_tokens - new_tokens, 0))
+    elif reason not in ("eos", "max_new_tokens"):
+        EARLY_STOP_SAVED_TOKENS.inc(max(max_new_tokens - new_tokens, 0))
+
+
+def observe_cancelled(reason: str, stage: str, saved_tokens: int):
+    CANCELLED_REQUESTS.labels(reason, stage).inc()
+    CANCELLED_SAVED_TOKENS.labels(reason).inc(saved_tokens)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware counting in-flight requests and their duration for the
+    given paths. It wraps the whole response, so streamed bodies are included.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        endpoint = scope["path"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_SECONDS.labels(endpoint, str(status["code"])).observe(time.perf_counter() - start)
+
+
+# --- Structured Logging ---
+
+# Fraction of per-request events that are written; errors are always written
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+
+logger = logging.getLogger("pls")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def log_event(event: str, level=logging.INFO, **fields):
+    """Writes one JSON log line."""
+    logger.log(level, json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+def log_sampled(event: str, **fields):
+    """Writes a per-request event for a LOG_SAMPLE_RATE fraction of calls."""
+    if LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE:
+        log_event(event, **fields)
@@ -1,62 +1,260 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM, GenerationConfig, pipeline, TextStreamer
+from transformers import AutoTokenizer, AutoModelForCausalLM, GenerationConfig, pipeline, TextStreamer, TextIteratorStreamer
+from transformers import StoppingCriteria, StoppingCriteriaList
 import torch
 from fastapi import HTTPException
-import boto3
 import os
+import gc
+import copy
+import queue
+import threading
+import time
+from core.s3_sync import sync_from_s3
+from core.batch_scheduler import GenerationScheduler, common_prefix_length
+from core.prompt_template import PROMPT_TEMPLATE
+from core.metrics import (
+    QUEUE_DEPTH, observe_generation, observe_assisted_generation, observe_stop, observe_cancelled, log_sampled
+)
+from core.stopping import PlsStoppingCriteria, CancellationCriteria, StableTextStreamer
+from core.cancellation import GenerationCancelled
+from core.static_cache import StaticCachePool
+from core.section_generation import SectionGenerator
+from core.startup import model_build_lock
+from core.inference_executor import submit_thread
+from core.model_registry import ModelRegistry
+from core.metrics import ModelRegistryCollector
+from prometheus_client import REGISTRY
 
 
-llama_tokenizer, llama_model = None, None
+# Generation models by name, loaded on first use; set by configure_models()
+model_registry = None
+# Models whose files were already downloaded (or logged in for) by this process
+prepared_models = set()
+
+# What load_generation_model builds for a model. These were module globals
+# before the registry; model_loader.<name> still reads the default model's.
+LOADED_MODEL_ATTRIBUTES = (
+    "llama_model", "llama_tokenizer", "generation_scheduler", "prefix_cache", "draft_model", "static_cache_pool",
+    "section_generator",
+)
+
+# Forward passes of the main and draft models made by the current thread's
+# assisted generation, used to report the draft acceptance rate
+_forward_passes = threading.local()
+
+PREFIX_SENTINEL = "<<ABSTRACT>>"
+
+SYSTEM_PROMPT = "You are an expert assistant specialized in creating Plain Language Summaries (PLS) from biomedical texts."
+
+def download_from_s3(local_path=None, s3_prefix=None):
+    """
+    Syncs the model files from S3 into `local_path` (MODEL_PATH by default)
+    from `s3_prefix` (S3_PREFIX). Files already on disk with the same size and
+    ETag are skipped, so restarts only fetch what changed.
+    """
+    import boto3
+    from botocore.config import Config
 
-def download_from_s3():
     region_name = os.environ['AWS_REGION']
-    s3 = boto3.client('s3', region_name=region_name)
+    max_workers = int(os.environ.get('S3_SYNC_WORKERS', '8'))
+    # S3_ENDPOINT_URL points the sync at a local S3 stand-in (moto, MinIO). Each of
+    # the max_workers files being downloaded makes up to max_workers ranged requests
+    s3 = boto3.client('s3', region_name=region_name, endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+                      config=Config(max_pool_connections=max_workers * max_workers))
     bucket_name = os.environ['S3_BUCKET_NAME']
-    s3_prefix = os.environ['S3_PREFIX']
+    s3_prefix = s3_prefix or os.environ['S3_PREFIX']
 
-    # Example: Download a tokenizer file
-    local_path = os.environ['MODEL_PATH']
+    local_path = local_path or os.environ['MODEL_PATH']
 
-    # List objects with the specified prefix
-    paginator = s3.get_paginator('list_objects_v2')
-    pages = paginator.paginate(Bucket=bucket_name, Prefix=s3_prefix)
+    stats = sync_from_s3(
+        s3,
+        bucket_name,
+        s3_prefix,
+        local_path,
+        max_workers=max_workers,
+        verify_etag=os.environ.get('S3_SYNC_VERIFY_ETAG', '1') == '1',
+    )
+    print(f"Download from s3 complete. Downloaded {stats['downloaded']} files, "
+          f"{stats['skipped']} already up to date.")
 
-    for page in pages:
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                s3_object_key = obj['Key']
-                # Construct local file path, preserving directory structure
-                relative_path = os.path.relpath(s3_object_key, s3_prefix)
-                local_file_path = os.path.join(local_path, relative_path)
 
-                # Create subdirectories if necessary
-                os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+def prepare_model_files(model_source, model_path=None, s3_prefix=None):
+    """
+    Downloads the model from S3 or logs in to Hugging Face, depending on MODEL_SOURCE.
+    """
+    if model_source == 's3':
+        print("Downloading model from S3...")
+        download_from_s3(model_path, s3_prefix)
+    elif model_source == 'huggingface':
+        # Imported here: only needed for this source and slow to import
+        from huggingface_hub import login
+        from core.secret_manager import get_secret
 
-                print(f"Downloading {s3_object_key} to {local_file_path}")
-                s3.download_file(bucket_name, s3_object_key, local_file_path)
-    
-    print("Download from s3 complete.")
+        print("Logging in to HuggingFace...")
+        hf_token_source = os.environ.get('HF_TOKEN_SOURCE')
+        if hf_token_source == 'aws':        
+            hf_token =  get_secret('huggingface_token')
+            login(token=hf_token)
+        elif hf_token_source == 'local':
+            login()
+        else:
+            raise ValueError("HF_TOKEN source not provided")
 
 
 
 # --- 4. Model Loading and Generation (Simulated) ---
 
+class LoadedModel:
+    """
+    A generation model and what load_generation_model builds for it: the
+    tokenizer, prefix KV cache, draft model, batching scheduler and static
+    KV caches. The model registry keeps one per resident model.
+    """
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        for attribute in LOADED_MODEL_ATTRIBUTES:
+            setattr(self, attribute, None)
+
+    def memory_bytes(self) -> int:
+        """Parameters and buffers of the model and its draft model."""
+        return sum(model.get_memory_footprint() for model in (self.llama_model, self.draft_model) if model is not None)
+
+    def close(self):
+        """Stops the batching scheduler and drops the references to the model."""
+        if self.generation_scheduler is not None:
+            self.generation_scheduler.close()
+        for attribute in LOADED_MODEL_ATTRIBUTES:
+            setattr(self, attribute, None)
+
+
+def __getattr__(name):
+    # model_loader.llama_model and the like, for scripts written before the registry
+    if name in LOADED_MODEL_ATTRIBUTES:
+        loaded = model_registry.get() if model_registry is not None else None
+        return getattr(loaded, name) if loaded is not None else None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def configure_models(specs: dict, default: str):
+    """
+    Sets up the model registry for `specs` (see load_model_specs) without
+    loading anything. MODEL_MEMORY_BUDGET_MB caps the memory of the resident
+    models; 0, the default, keeps every model loaded once.
+    """
+    global model_registry
+    model_registry = ModelRegistry(
+        specs,
+        default,
+        load=load_registered_model,
+        unload=unload_generation_model,
+        size=LoadedModel.memory_bytes,
+        estimate=estimate_model_bytes,
+        memory_budget=int(float(os.environ.get('MODEL_MEMORY_BUDGET_MB', '0')) * 1024 * 1024),
+    )
+    print(f"✅ Model registry: {', '.join(specs)}. Default: {default}")
+    return model_registry
+
+
+def get_model_registry() -> ModelRegistry:
+    if model_registry is None:
+        print("model or tokenizer not loaded.")
+        raise HTTPException(status_code=500, detail="Model or tokenizer not loaded.")
+    return model_registry
+
+
+def resolve_loaded(loaded=None) -> LoadedModel:
+    """`loaded`, or the default model when None; 500 if it is not loaded."""
+    if loaded is None:
+        loaded = get_model_registry().get()
+    if loaded is None or loaded.llama_model is None or loaded.llama_tokenizer is None:
+        print("model or tokenizer not loaded.")
+        raise HTTPException(status_code=500, detail="Model or tokenizer not loaded.")
+    return loaded
+
+
+def prepare_registered_model(name: str = None):
+    """Fetches the files of the registered model `name` (the default if None), once per process."""
+    registry = get_model_registry()
+    name = registry.resolve(name)
+    if name not in prepared_models:
+        spec = registry.specs[name]
+        prepare_model_files(spec.get("source"), spec["path"], spec.get("s3_prefix"))
+        prepared_models.add(name)
+
+
+def load_registered_model(name: str, spec: dict) -> LoadedModel:
+    """The registry's loader."""
+    prepare_registered_model(name)
+    return load_generation_model(name, spec["path"], spec.get("draft_path", os.environ.get('DRAFT_MODEL_PATH')))
+
+
+def unload_generation_model(loaded: LoadedModel):
+    """The registry's unloader: stops the model's scheduler and frees its memory."""
+    loaded.close()
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    print(f"Model {loaded.name} unloaded.")
+
+
+def estimate_model_bytes(spec: dict) -> int:
+    """Size of the weight files of a model on local disk, or 0 if they are not there yet."""
+    path = spec["path"]
+    if not os.path.isdir(path):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(path, file)) for file in os.listdir(path)
+        if file.endswith((".safetensors", ".bin", ".pt"))
+    )
+
+
+def load_default_model():
+    """Loads the default model of the registry; the startup step of the generation model."""
+    with get_model_registry().use() as loaded:
+        return loaded
+
+
+def list_models() -> dict:
+    """The default model, the memory budget and the state of every registered model."""
+    return get_model_registry().status()
+
+
+def preload_model(name: str) -> dict:
+    """Starts loading the model `name` in the background unless it is loaded; returns its state."""
+    return get_model_registry().preload(name)
+
+
 def load_ai_model(model_path):
+    """
+    Loads the model at `model_path` as the only and default model, for
+    scripts that serve a single model. Returns its LoadedModel.
+    """
+    configure_models({model_path: {"path": model_path}}, model_path)
+    return load_default_model()
+
+
+def load_generation_model(name: str, model_path: str, draft_model_path: str = None) -> LoadedModel:
     """
     Loads AI Model    
     """
-    global llama_tokenizer, llama_model    
+    loaded = LoadedModel(name, model_path)
 
     # --- AI Model (for PLS Generation) ---
     try:
-       
-        llama_model = AutoModelForCausalLM.from_pretrained(model_path, 
-                                                           return_dict=True,
-                                                           low_cpu_mem_usage=True,
-                                                           dtype=torch.float16,
-                                                           device_map="auto",
-                                                           trust_remote_code=True)       
+        if get_model_device() == "cpu":
+            loaded.llama_model = load_cpu_model(model_path)
+        else:
+            with model_build_lock:
+                loaded.llama_model = AutoModelForCausalLM.from_pretrained(model_path, 
+                                                                          return_dict=True,
+                                                                          low_cpu_mem_usage=True,
+                                                                          dtype=torch.float16,
+                                                                          device_map="auto",
+                                                                          trust_remote_code=True)       
+        llama_model = loaded.llama_model
         
-        llama_tokenizer = AutoTokenizer.from_pretrained(model_path)
+        llama_tokenizer = loaded.llama_tokenizer = AutoTokenizer.from_pretrained(model_path)
         
         if llama_tokenizer.pad_token_id is None:
             llama_tokenizer.pad_token_id = llama_tokenizer.eos_token_id
@@ -64,46 +262,316 @@ def load_ai_model(model_path):
         if llama_model.config.pad_token_id is None:
             llama_model.config.pad_token_id = llama_model.config.eos_token_id
 
-        print(f"✅ Model loaded. Main device: {llama_model.device}")
+        print(f"✅ Model {name} loaded. Main device: {llama_model.device}")
+
+        if os.environ.get('PREFIX_CACHE', '1') == '1':
+            build_prefix_cache(PROMPT_TEMPLATE, loaded)
+
+        if draft_model_path:
+            loaded.draft_model = load_draft_model(draft_model_path, loaded)
+
+        # Concurrent requests share the GPU through the batching scheduler
+        max_batch_size = int(os.environ.get('BATCH_MAX_SIZE', '1'))
+        if max_batch_size > 1 and loaded.draft_model is not None:
+            # Assisted generation works one sequence at a time
+            print("Assisted decoding is enabled, so the batching scheduler is not started.")
+        elif max_batch_size > 1:
+            loaded.generation_scheduler = GenerationScheduler(
+                llama_model,
+                llama_tokenizer,
+                max_batch_size=max_batch_size,
+                max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS', '20')),
+                prefix_provider=lambda: loaded.prefix_cache,
+            )
+            print(f"✅ Batching scheduler started. Max batch size: {max_batch_size}")
+
+        if generation_mode() == "sections":
+            if loaded.generation_scheduler is not None or loaded.draft_model is not None:
+                print("Section-parallel generation is only used without the batching scheduler and assisted decoding.")
+            else:
+                loaded.section_generator = SectionGenerator(
+                    llama_model,
+                    llama_tokenizer,
+                    word_budget=stop_word_budget(),
+                )
+                print(f"✅ Section-parallel generation enabled. Token budgets: {loaded.section_generator.budgets}")
+
+        if os.environ.get('STATIC_CACHE', '0') == '1':
+            if loaded.section_generator is not None:
+                print("The static KV cache is not used with section-parallel generation.")
+            elif loaded.generation_scheduler is not None or loaded.draft_model is not None:
+                print("The static KV cache is only used without the batching scheduler and assisted decoding.")
+            else:
+                loaded.static_cache_pool = StaticCachePool(
+                    llama_model,
+                    buckets=[int(b) for b in os.environ.get('STATIC_CACHE_BUCKETS', '1024,1536,2048,3072').split(',')],
+                    max_new_tokens=get_generation_config(loaded).max_new_tokens,
+                    compile_decode=os.environ.get('STATIC_CACHE_COMPILE', '1') == '1',
+                )
+                # Before the model is reported ready, so the first request does not pay for it
+                loaded.static_cache_pool.warm_up(llama_tokenizer.pad_token_id)
 
     except Exception as e:
         print(f"FATAL: Could not load  tokenizer. Error: {e}")
-        llama_tokenizer = None
-        llama_model = None
+        loaded.close()
+        raise
 
+    return loaded
 
-def generate_pls_from_model(abstract: str, prompt_template: str) -> str:
+
+def _scheduler_total(count) -> int:
+    if model_registry is None:
+        return 0
+    return sum(
+        count(loaded.generation_scheduler) for loaded in model_registry.resident()
+        if loaded.generation_scheduler is not None
+    )
+
+
+def track_scheduler_queue():
     """
-    Uses the loaded model to generate the PLS text.
+    Reports the batching schedulers' queues on pls_queue_depth, summed over
+    the resident models; read when /metrics is scraped.
     """
-    pls_text = ""
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    QUEUE_DEPTH.labels("scheduler_waiting").set_function(lambda: _scheduler_total(GenerationScheduler.queue_depth))
+    QUEUE_DEPTH.labels("scheduler_active").set_function(lambda: _scheduler_total(GenerationScheduler.active_jobs))
 
-    if llama_model is None or llama_tokenizer is None:
-        print("model or tokenizer not loaded.")
-        raise HTTPException(status_code=500, detail="Model or tokenizer not loaded.")
-   
+
+REGISTRY.register(ModelRegistryCollector(lambda: model_registry))
+
+
+def load_draft_model(draft_model_path, loaded: LoadedModel):
+    """
+    Loads the small draft model used for assisted decoding, on the same
+    device and with the same dtype as the main model. It must share the
+    main model's tokenizer.
+    """
+    llama_model, llama_tokenizer = loaded.llama_model, loaded.llama_tokenizer
+    draft_tokenizer = AutoTokenizer.from_pretrained(draft_model_path)
+    if draft_tokenizer.get_vocab() != llama_tokenizer.get_vocab():
+        raise ValueError(f"The draft model at {draft_model_path} uses a different tokenizer than the main model.")
+
+    if get_model_device() == "cpu":
+        model = load_cpu_model(draft_model_path)
+    else:
+        with model_build_lock:
+            model = AutoModelForCausalLM.from_pretrained(draft_model_path,
+                                                         return_dict=True,
+                                                         low_cpu_mem_usage=True,
+                                                         dtype=llama_model.dtype,
+                                                         device_map={"": llama_model.device},
+                                                         trust_remote_code=True)
+    model.eval()
+
+    # How many tokens the draft proposes per step, and the draft confidence
+    # below which it stops proposing early (transformers' defaults: 20 and 0.4)
+    if os.environ.get('DRAFT_NUM_TOKENS'):
+        model.generation_config.num_assistant_tokens = int(os.environ['DRAFT_NUM_TOKENS'])
+    if os.environ.get('DRAFT_CONFIDENCE_THRESHOLD'):
+        model.generation_config.assistant_confidence_threshold = float(os.environ['DRAFT_CONFIDENCE_THRESHOLD'])
+
+    llama_model.register_forward_pre_hook(_count_forward_pass("main"))
+    model.register_forward_pre_hook(_count_forward_pass("draft"))
+    print(f"✅ Draft model loaded for assisted decoding. Main device: {model.device}")
+    return model
+
+
+def _count_forward_pass(name):
+    def hook(module, args):
+        counts = getattr(_forward_passes, "counts", None)
+        if counts is not None:
+            counts[name] += 1
+    return hook
+
+
+def get_model_device() -> str:
+    """
+    "cuda" or "cpu" from MODEL_DEVICE; "auto" (the default) uses the GPU if there is one.
+    """
+    device = os.environ.get('MODEL_DEVICE', 'auto')
+    if device not in ("auto", "cuda", "cpu"):
+        raise ValueError(f"Unknown MODEL_DEVICE '{device}'. Use auto, cuda or cpu.")
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def load_cpu_model(model_path):
+    """
+    Loads the generation model for CPU inference: bf16 on CPUs with native
+    bf16 support and fp32 otherwise (fp16 matmuls are emulated and very slow),
+    PyTorch's SDPA attention, sized thread pools and optional int8 weights.
+    """
+    configure_cpu_threads()
+    dtype = get_cpu_dtype()
+    with model_build_lock:
+        model = AutoModelForCausalLM.from_pretrained(model_path,
+                                                     return_dict=True,
+                                                     low_cpu_mem_usage=True,
+                                                     dtype=dtype,
+                                                     attn_implementation="sdpa",
+                                                     trust_remote_code=True)
+    model.eval()
+
+    quantization = os.environ.get('CPU_QUANTIZATION', 'none')
+    if quantization == "int8":
+        model = quantize_int8_weights(model)
+    elif quantization != "none":
+        raise ValueError(f"Unknown CPU_QUANTIZATION '{quantization}'. Use none or int8.")
+
+    print(f"✅ CPU mode. dtype: {model.dtype}, quantization: {quantization}, "
+          f"threads: {torch.get_num_threads()}, inter-op threads: {torch.get_num_interop_threads()}")
+    return model
+
+
+def get_cpu_dtype() -> torch.dtype:
+    """CPU_DTYPE: bf16, fp32 or auto (bf16 when the CPU has AVX512-BF16 or AMX)."""
+    choice = os.environ.get('CPU_DTYPE', 'auto')
+    if choice == "auto":
+        choice = "bf16" if cpu_supports_bf16() else "fp32"
+    if choice not in ("bf16", "fp32"):
+        raise ValueError(f"Unknown CPU_DTYPE '{choice}'. Use auto, bf16 or fp32.")
+    return torch.bfloat16 if choice == "bf16" else torch.float32
+
+
+def cpu_supports_bf16() -> bool:
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line for line in f if line.startswith("flags")), "").split()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def configure_cpu_threads():
+    """
+    Sizes the intra-op pool to the CPUs this process may use (torch counts
+    the host's cores, which oversubscribes CPU-limited containers) and the
+    inter-op pool to CPU_INTEROP_THREADS; decoding is sequential, so 1 is enough.
+    """
+    threads = int(os.environ.get('CPU_THREADS', '0')) or len(os.sched_getaffinity(0))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(int(os.environ.get('CPU_INTEROP_THREADS', '1')))
+    except RuntimeError:
+        # Can only be set before the first inter-op parallel work in the process
+        print(f"Inter-op threads already fixed at {torch.get_num_interop_threads()}")
+
+
+def quantize_int8_weights(model):
+    """
+    int8 weight-only quantization of the linear layers with torchao when it is
+    installed; otherwise PyTorch's dynamic int8 quantization, which needs fp32.
+    """
+    try:
+        from torchao.quantization import quantize_, Int8WeightOnlyConfig
+    except ImportError:
+        print("torchao not installed; using dynamic int8 quantization (fp32 activations).")
+        return torch.ao.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+
+    quantize_(model, Int8WeightOnlyConfig())
+    return model
+
+
+def build_prompt_inputs(abstract: str, prompt_template: str, loaded: LoadedModel = None) -> torch.Tensor:
+    """
+    Builds the chat-formatted prompt ids for an abstract, for the default
+    model unless `loaded` is given.
+    """
+    loaded = resolve_loaded(loaded)
     # 1. Create the Llama 3 Instruct chat message format
     # The prompt template is the "user" message.
     messages = [
-        {"role": "system", "content": "You are an expert assistant specialized in creating Plain Language Summaries (PLS) from biomedical texts."},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt_template.format(text=abstract)}
     ]
 
     # 2. Tokenize the input using the chat template
     # This is the critical change.
-    inputs = llama_tokenizer.apply_chat_template(
+    return loaded.llama_tokenizer.apply_chat_template(
         messages,
         add_generation_prompt=True,
-        return_tensors="pt"
-    ).to(llama_model.device)
+        return_tensors="pt",
+        return_dict=False
+    ).to(loaded.llama_model.device)
+
+
+def build_prefix_cache(prompt_template: str, loaded: LoadedModel = None):
+    """
+    Precomputes past_key_values for the part of the chat prompt that precedes
+    the abstract (system message and instructions), so each request only has
+    to prefill its own abstract. The cache is rebuilt when the model, system
+    prompt or template changes.
+    """
+    loaded = resolve_loaded(loaded)
+    llama_model, llama_tokenizer = loaded.llama_model, loaded.llama_tokenizer
+
+    key = (id(llama_model), llama_model.name_or_path, SYSTEM_PROMPT, prompt_template)
+    if loaded.prefix_cache is not None and loaded.prefix_cache["key"] == key:
+        return loaded.prefix_cache
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt_template.format(text=PREFIX_SENTINEL)}
+    ]
+    rendered = llama_tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
+    prefix_text = rendered.split(PREFIX_SENTINEL)[0]
+    input_ids = llama_tokenizer(prefix_text, add_special_tokens=False, return_tensors="pt").input_ids
+
+    with torch.no_grad():
+        outputs = llama_model(input_ids=input_ids.to(llama_model.device), use_cache=True)
+
+    loaded.prefix_cache = {
+        "key": key,
+        "input_ids": input_ids[0],
+        "past_key_values": outputs.past_key_values,
+    }
+    print(f"✅ Prefix KV cache built. Prefix token length: {input_ids.shape[1]}")
+    return loaded.prefix_cache
+
 
+def get_prefix_cache(loaded: LoadedModel = None):
+    """The prefix cache if it was built for the loaded model, otherwise None."""
+    loaded = resolve_loaded(loaded)
+    prefix_cache = loaded.prefix_cache
+    if prefix_cache is None or prefix_cache["key"][0] != id(loaded.llama_model):
+        return None
+    return prefix_cache
 
-    print(f"Data tensor is on: {inputs.device}") # This MUST match the model's device
 
+def get_prefix_past_key_values(input_ids: torch.Tensor, loaded: LoadedModel = None):
+    """
+    Returns a private copy of the prefix cache covering the leading tokens that
+    `input_ids` shares with the cached prefix, or None if nothing can be reused.
+    """
+    prefix_cache = get_prefix_cache(loaded)
+    if prefix_cache is None:
+        return None
+
+    length = common_prefix_length(prefix_cache["input_ids"], input_ids.reshape(-1).cpu())
+    # At least one token has to be left for the model to prefill
+    length = min(length, input_ids.shape[-1] - 1)
+    if length <= 0:
+        return None
 
-    gen_config = GenerationConfig(    
-        min_new_tokens=500,    
+    past_key_values = copy.deepcopy(prefix_cache["past_key_values"])
+    to_remove = len(prefix_cache["input_ids"]) - length
+    if to_remove:
+        past_key_values.crop(-to_remove)
+    return past_key_values
+
+
+def get_generation_config(loaded: LoadedModel = None) -> GenerationConfig:
+    """
+    Generation settings used for every PLS, with the special tokens of the
+    default model unless `loaded` is given.
+    """
+    loaded = resolve_loaded(loaded)
+    llama_tokenizer = loaded.llama_tokenizer
+    config = GenerationConfig(    
+        # With the PLS stopping criteria the generation ends when the summary
+        # is complete; without them the previous 500-token floor applies
+        min_new_tokens=0 if structured_stopping_enabled() else 500,
         max_new_tokens=900,
         temperature=0.3,
         top_p=0.9,        
@@ -114,26 +582,309 @@ def generate_pls_from_model(abstract: str, prompt_template: str) -> str:
         eos_token_id=llama_tokenizer.eos_token_id,
         pad_token_id=llama_tokenizer.pad_token_id,
     )
+    # The stopping policy changes the PLS too, and the config is part of the
+    # result cache key, so results stopped differently are not reused
+    config.structured_stopping = structured_stopping_enabled()
+    config.stop_word_budget = stop_word_budget()
+    if loaded.section_generator is not None:
+        config.section_max_new_tokens = loaded.section_generator.budgets
+    return config
 
 
-    prompt_token_length = inputs.shape[1]
-    print(f"Prompt token length: {prompt_token_length}")
-    
-    llama_model.eval()
-    with torch.no_grad():
-        # 4. Generate output
-        # We pass input_ids and attention_mask from the tokenizer output
-        outputs = llama_model.generate(
-            input_ids=inputs,
-            generation_config=gen_config
+def generation_config_for(model_name: str = None) -> GenerationConfig:
+    """get_generation_config for the registered model `model_name`, loading it if needed."""
+    with get_model_registry().use(model_name) as loaded:
+        return get_generation_config(loaded)
+
+
+def generation_mode() -> str:
+    """
+    GENERATION_MODE: "single" generates the PLS as one sequence, "sections"
+    decodes its sections in parallel from the shared prompt (SectionGenerator).
+    """
+    mode = os.environ.get('GENERATION_MODE', 'single')
+    if mode not in ("single", "sections"):
+        raise ValueError(f"Unknown GENERATION_MODE '{mode}'. Use single or sections.")
+    return mode
+
+
+def structured_stopping_enabled() -> bool:
+    return os.environ.get('STRUCTURED_STOPPING', '1') == '1'
+
+
+def stop_word_budget() -> int:
+    """STOP_WORD_BUDGET: words of a PLS after which its generation stops."""
+    return int(os.environ.get('STOP_WORD_BUDGET', '900'))
+
+
+def build_stopping_criteria(prompt_token_length: int, loaded: LoadedModel = None):
+    """
+    Returns (StoppingCriteriaList, GenerationTimer, PlsStoppingCriteria or None)
+    for one generation.
+    """
+    timer = GenerationTimer()
+    stopping_criteria = StoppingCriteriaList([timer])
+    pls_stopper = None
+    if structured_stopping_enabled():
+        pls_stopper = PlsStoppingCriteria(
+            resolve_loaded(loaded).llama_tokenizer,
+            prompt_token_length,
+            word_budget=stop_word_budget(),
         )
+        stopping_criteria.append(pls_stopper)
+    return stopping_criteria, timer, pls_stopper
+
+
+def generate_pls_from_model(abstract: str, prompt_template: str, streamer=None, cancellation=None,
+                            model_name: str = None) -> str:
+    """
+    Uses the model `model_name` (the default if None) to generate the PLS
+    text, loading it first if it is not resident.
+    If a streamer is given, decoded tokens are pushed to it as they are produced.
+    With structured stopping, text a stop may still drop is held back until
+    the stop is decided, so the chunks add up to the text returned.
+    With a Cancellation, decoding stops within a token of it firing: a
+    deadline returns the PLS generated so far and sets `cancellation.truncated`,
+    a disconnect raises GenerationCancelled. A request cancelled before it
+    reaches the model raises GenerationCancelled right away.
+    """
+    with get_model_registry().use(model_name) as loaded:
+        return _generate_pls(loaded, abstract, prompt_template, streamer, cancellation)
+
+
+def _generate_pls(loaded: LoadedModel, abstract: str, prompt_template: str, streamer=None, cancellation=None) -> str:
+    llama_model, llama_tokenizer = loaded.llama_model, loaded.llama_tokenizer
+    generation_scheduler, draft_model = loaded.generation_scheduler, loaded.draft_model
+    static_cache_pool = loaded.static_cache_pool
+
+    gen_config = get_generation_config(loaded)
+
+    # The client may have left, or run out of time, while the request was queued
+    if cancellation is not None and cancellation.reason() is not None:
+        observe_cancelled(cancellation.reason(), "queued", gen_config.max_new_tokens)
+        raise GenerationCancelled(cancellation.reason())
+
+    inputs = build_prompt_inputs(abstract, prompt_template, loaded)
+    if loaded.section_generator is not None:
+        return _generate_sections(loaded, inputs, gen_config, streamer, cancellation)
 
-    # 5. Decode only the *new* tokens
-    new_tokens = outputs[0, prompt_token_length:]
+    prompt_token_length = inputs.shape[1]
+    stopping_criteria, timer, pls_stopper = build_stopping_criteria(prompt_token_length, loaded)
+    cancel_stopper = None
+    if cancellation is not None:
+        cancel_stopper = CancellationCriteria(cancellation)
+        stopping_criteria.append(cancel_stopper)
+    stable_streamer = None
+    if streamer is not None and pls_stopper is not None:
+        # Streams from the stopping criteria, so text a stop may still drop is held back
+        stable_streamer = StableTextStreamer(llama_tokenizer, streamer, pls_stopper)
+        stopping_criteria.append(stable_streamer)
+        streamer = None
+
+    if generation_scheduler is not None:
+        # 4. Join the running batch and wait for this sequence to finish
+        try:
+            new_tokens = generation_scheduler.submit(
+                inputs[0], gen_config, streamer=streamer, stopping_criteria=stopping_criteria,
+                cancellation=cancellation
+            ).result()
+        except GenerationCancelled as e:
+            observe_cancelled(e.reason, "queued", gen_config.max_new_tokens)
+            raise
+    elif draft_model is not None:
+        # 4. Assisted generation: the draft proposes tokens and the main model
+        # verifies them in one forward pass; greedy output is unchanged.
+        # The prefix cache is not used, since the draft keeps its own cache.
+        _forward_passes.counts = {"main": 0, "draft": 0}
+        try:
+            with torch.no_grad():
+                outputs = llama_model.generate(
+                    input_ids=inputs,
+                    generation_config=gen_config,
+                    streamer=streamer,
+                    stopping_criteria=stopping_criteria,
+                    assistant_model=draft_model
+                )
+            counts = _forward_passes.counts
+        finally:
+            _forward_passes.counts = None
+
+        new_tokens = outputs[0, prompt_token_length:]
+        observe_assisted_generation(len(new_tokens), counts["main"], counts["draft"])
+    elif static_cache_pool is not None and static_cache_pool.bucket_for(prompt_token_length) is not None:
+        # 4. Generate into a preallocated cache with the compiled decode step.
+        # The cache starts with the cached prefix, like the branch below.
+        llama_model.eval()
+        with static_cache_pool.cache_for(inputs, get_prefix_cache(loaded)) as static_cache, torch.no_grad():
+            outputs = llama_model.generate(
+                input_ids=inputs,
+                generation_config=static_cache_pool.generation_config(gen_config),
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+                past_key_values=static_cache
+            )
+        new_tokens = outputs[0, prompt_token_length:]
+    else:
+        llama_model.eval()
+        with torch.no_grad():
+            # 4. Generate output
+            # We pass input_ids and attention_mask from the tokenizer output
+            outputs = llama_model.generate(
+                input_ids=inputs,
+                generation_config=gen_config,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+                # Only the abstract tokens are prefilled when the prefix is cached
+                past_key_values=get_prefix_past_key_values(inputs, loaded)
+            )
+
+        # 5. Decode only the *new* tokens
+        new_tokens = outputs[0, prompt_token_length:]
+
+    prefill_seconds, decode_seconds = timer.stop()
+    generated_count = len(new_tokens)
+    observe_generation(prompt_token_length, generated_count, prefill_seconds, decode_seconds)
+
+    stop_reason = pls_stopper.reason if pls_stopper is not None else None
+    if stop_reason is not None:
+        # Leave out the heading or repeated span that triggered the stop
+        new_tokens = new_tokens[:pls_stopper.keep_tokens]
+    elif cancel_stopper is not None and cancel_stopper.reason is not None:
+        stop_reason = cancel_stopper.reason
+    else:
+        stop_reason = "max_new_tokens" if generated_count >= gen_config.max_new_tokens else "eos"
+    observe_stop(stop_reason, generated_count, gen_config.max_new_tokens)
+
+    if stop_reason == "disconnected":
+        # Nobody is waiting for the partial text
+        raise GenerationCancelled(stop_reason)
+    if stop_reason == "deadline":
+        cancellation.truncated = stop_reason
 
     generated_text = llama_tokenizer.decode(new_tokens, skip_special_tokens=True)
-    print(generated_text)
+    if pls_stopper is not None and pls_stopper.keep_tokens is not None:
+        generated_text = generated_text.rstrip()
+    log_sampled(
+        "generation",
+        model=loaded.name,
+        device=str(inputs.device),
+        prompt_tokens=prompt_token_length,
+        new_tokens=generated_count,
+        stop_reason=stop_reason,
+        prefill_ms=round(prefill_seconds * 1000, 1),
+        decode_ms=round(decode_seconds * 1000, 1),
+    )
 
+    if stable_streamer is not None:
+        stable_streamer.finish(generated_text)
     return generated_text
-    
 
+
+def _generate_sections(loaded: LoadedModel, inputs: torch.Tensor, gen_config: GenerationConfig, streamer=None,
+                       cancellation=None) -> str:
+    """The PLS sections decoded in parallel from the shared prompt, joined in order."""
+    section_generator = loaded.section_generator
+    eos_token_ids = gen_config.eos_token_id
+    if not isinstance(eos_token_ids, (list, tuple)):
+        eos_token_ids = [eos_token_ids]
+
+    loaded.llama_model.eval()
+    result = section_generator.generate(
+        inputs,
+        # Only the abstract tokens are prefilled when the prefix is cached
+        past_key_values=get_prefix_past_key_values(inputs, loaded),
+        eos_token_ids=set(eos_token_ids),
+        streamer=streamer,
+        cancellation=cancellation,
+    )
+
+    prompt_token_length = inputs.shape[1]
+    generated_count = result["new_tokens"]
+    observe_generation(prompt_token_length, generated_count, result["prefill_seconds"], result["decode_seconds"])
+
+    stop_reason = result["cancel_reason"]
+    if stop_reason is None:
+        stop_reason = "max_new_tokens" if "max_new_tokens" in result["reasons"] else "sections_complete"
+    observe_stop(stop_reason, generated_count, section_generator.max_new_tokens)
+
+    if stop_reason == "disconnected":
+        raise GenerationCancelled(stop_reason)
+    if stop_reason == "deadline":
+        cancellation.truncated = stop_reason
+
+    log_sampled(
+        "generation",
+        model=loaded.name,
+        mode="sections",
+        device=str(inputs.device),
+        prompt_tokens=prompt_token_length,
+        new_tokens=generated_count,
+        stop_reason=stop_reason,
+        section_stop_reasons=result["reasons"],
+        prefill_ms=round(result["prefill_seconds"] * 1000, 1),
+        decode_ms=round(result["decode_seconds"] * 1000, 1),
+    )
+    return result["text"]
+
+
+class GenerationTimer(StoppingCriteria):
+    """
+    Never stops the generation; records when the first token came out so the
+    prefill and decode phases can be timed separately.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+    def stop(self):
+        """Returns (prefill_seconds, decode_seconds)."""
+        end = time.perf_counter()
+        first_token_at = self.first_token_at or end
+        return first_token_at - self.start, end - first_token_at
+
+
+def stream_pls_from_model(abstract: str, prompt_template: str, submit=None, cancellation=None,
+                          model_name: str = None):
+    """
+    Starts the generation right away and returns an iterator that yields the
+    PLS text in chunks as soon as they are decoded.
+    `submit(fn, *args)` schedules the blocking generation and returns a Future;
+    it defaults to a plain background thread. A model that is not resident is
+    loaded there too, not by the caller. `cancellation` and `model_name` are
+    passed on to generate_pls_from_model.
+    """
+    registry = get_model_registry()
+    model_name = registry.resolve(model_name)
+    streamers = queue.Queue()
+
+    def generate():
+        with registry.use(model_name) as loaded:
+            streamer = TextIteratorStreamer(loaded.llama_tokenizer, skip_prompt=True, skip_special_tokens=True)
+            streamers.put(streamer)
+            try:
+                return _generate_pls(loaded, abstract, prompt_template, streamer, cancellation)
+            except BaseException:
+                streamer.end()
+                raise
+
+    future = (submit or submit_thread)(generate)
+    # Unblock the reader if the generation fails or never starts
+    future.add_done_callback(lambda f: streamers.put(None))
+
+    return _iterate_stream(streamers, future)
+
+
+def _iterate_stream(streamers, future):
+    streamer = streamers.get()
+    if streamer is not None:
+        for chunk in streamer:
+            if chunk:
+                yield chunk
+    # Re-raise any generation error
+    future.result()
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from fastapi import HTTPException
+from core.metrics import log_event
+
+
+def load_model_specs(default_name: str, default_path: str, default_source: str = None):
+    """
+    The generation models that can be served, as (specs, default name).
+    MODEL_REGISTRY names a JSON file {"default": name, "models": {name:
+    {"path": ..., "source": ..., "s3_prefix": ..., "draft_path": ...}}},
+    where only "path" is required; without it there is a single model, named
+    `default_name`, at `default_path` from `default_source`.
+    """
+    registry_file = os.environ.get('MODEL_REGISTRY')
+    if not registry_file:
+        name = default_name or default_path
+        return {name: {"path": default_path, "source": default_source}}, name
+
+    with open(registry_file) as f:
+        config = json.load(f)
+    specs = config.get("models") or {}
+    if not specs:
+        raise ValueError(f"MODEL_REGISTRY file {registry_file} lists no models.")
+    for name, spec in specs.items():
+        if not spec.get("path"):
+            raise ValueError(f"Model '{name}' in {registry_file} has no path.")
+    default = config.get("default") or next(iter(specs))
+    if default not in specs:
+        raise ValueError(f"Unknown default model '{default}'. Use one of {', '.join(specs)}.")
+    return specs, default
+
+
+class ModelRegistry:
+    """
+    Generation models by name, loaded on first use and kept resident while
+    they fit in `memory_budget` bytes (0: no limit). Loading a model first
+    unloads the least recently used idle ones until it fits, and again once
+    its real size is known; a model with a generation in progress is never
+    unloaded, so the budget can be exceeded while every resident model is
+    busy. Concurrent requests for a model that is loading wait for that load.
+
+    `load(name, spec)` builds a model and returns it, `unload(model)`
+    releases it and `size(model)` is its memory in bytes. Before a load, the
+    size it last had or `estimate(spec)` is what room is made for.
+    """
+
+    def __init__(self, specs: dict, default: str, load, unload, size, estimate=None, memory_budget: int = 0):
+        self.specs = specs
+        self.default = default
+        self.memory_budget = memory_budget
+        self._load, self._unload, self._size, self._estimate = load, unload, size, estimate
+        self._resident = OrderedDict()
+        self._loading = {}
+        self._in_use = {name: 0 for name in specs}
+        self._sizes = {}
+        self._last_used = {}
+        self._errors = {}
+        self.loads = {name: 0 for name in specs}
+        self.evictions = {name: 0 for name in specs}
+        self._lock = threading.Lock()
+
+    def resolve(self, name: str = None) -> str:
+        """`name`, or the default model when it is None; 404 for an unknown model."""
+        if name is None:
+            return self.default
+        if name not in self.specs:
+            raise HTTPException(status_code=404, detail=f"Unknown model '{name}'. Use one of {', '.join(self.specs)}.")
+        return name
+
+    @contextmanager
+    def use(self, name: str = None):
+        """Yields the model `name` (the default if None), loading it if needed; it stays resident meanwhile."""
+        name = self.resolve(name)
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def acquire(self, name: str):
+        """The loaded model `name`, marked in use until release(name)."""
+        while True:
+            with self._lock:
+                model = self._resident.get(name)
+                if model is not None:
+                    self._resident.move_to_end(name)
+                    self._in_use[name] += 1
+                    self._last_used[name] = time.time()
+                    return model
+                future = self._loading.get(name)
+                owner = future is None
+                if owner:
+                    future = self._loading[name] = Future()
+            if not owner:
+                # Raises if that load failed
+                future.result()
+                continue
+            return self._load_owned(name, future)
+
+    def release(self, name: str):
+        with self._lock:
+            self._in_use[name] -= 1
+            self._last_used[name] = time.time()
+
+    def get(self, name: str = None):
+        """The model `name` if it is resident, without loading it or marking it in use."""
+        return self._resident.get(self.resolve(name))
+
+    def resident(self) -> list:
+        return list(self._resident.values())
+
+    def preload(self, name: str) -> dict:
+        """Starts loading `name` in a background thread unless it is resident or loading; returns its status."""
+        name = self.resolve(name)
+        with self._lock:
+            start = name not in self._resident and name not in self._loading
+            if start:
+                # Claimed here, so the status below already says "loading"
+                future = self._loading[name] = Future()
+        if start:
+            threading.Thread(target=self._preload, args=(name, future), name=f"preload-{name}", daemon=True).start()
+        return self.status()["models"][name]
+
+    def _preload(self, name, future):
+        try:
+            self._load_owned(name, future)
+        except Exception:
+            # Logged and reported by status()
+            return
+        self.release(name)
+
+    def _load_owned(self, name, future):
+        """Loads `name` for the caller that registered `future`; returns it marked in use."""
+        log_event("model_registry_load", model=name)
+        start = time.monotonic()
+        try:
+            self._make_room(name, self._sizes.get(name) or self._estimated_size(name))
+            model = self._load(name, self.specs[name])
+            size = self._size(model)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(name)
+                self._errors[name] = f"{type(e).__name__}: {e}"
+            log_event("model_registry_load_failed", level=logging.ERROR, model=name, error=self._errors[name])
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._loading.pop(name)
+            self._resident[name] = model
+            self._in_use[name] += 1
+            self._sizes[name] = size
+            self._last_used[name] = time.time()
+            self._errors.pop(name, None)
+            self.loads[name] += 1
+        future.set_result(None)
+        log_event("model_registry_loaded", model=name, seconds=round(time.monotonic() - start, 2),
+                  memory_mb=round(size / 2**20, 1))
+        # The estimate may have been short
+        if not self._make_room(name, 0):
+            log_event("model_registry_over_budget", level=logging.WARNING, model=name,
+                      memory_mb=round(self.memory_used() / 2**20, 1), budget_mb=round(self.memory_budget / 2**20, 1))
+        return model
+
+    def _estimated_size(self, name) -> int:
+        return self._estimate(self.specs[name]) if self._estimate else 0
+
+    def _make_room(self, name, needed: int) -> bool:
+        """
+        Unloads least recently used idle models other than `name` until
+        `needed` more bytes fit; returns whether they do.
+        """
+        if not self.memory_budget:
+            return True
+        evicted = []
+        with self._lock:
+            used = self.memory_used()
+            for other in list(self._resident):
+                if used + needed <= self.memory_budget:
+                    break
+                if other == name or self._in_use[other]:
+                    continue
+                evicted.append((other, self._resident.pop(other)))
+                used -= self._sizes[other]
+                self.evictions[other] += 1
+            fits = used + needed <= self.memory_budget
+        for other, model in evicted:
+            log_event("model_registry_evicted", model=other, for_model=name)
+            self._unload(model)
+        return fits
+
+    def memory_used(self) -> int:
+        """Bytes held by the resident models."""
+        return sum(self.resident_memory().values())
+
+    def resident_memory(self) -> dict:
+        """Bytes held by each resident model."""
+        return {name: self._sizes[name] for name in list(self._resident)}
+
+    def status(self) -> dict:
+        """The default model, the memory budget and the state of each model, for GET /models."""
+        with self._lock:
+            models = {}
+            for name, spec in self.specs.items():
+                if name in self._resident:
+                    state = "loaded"
+                elif name in self._loading:
+                    state = "loading"
+                elif name in self._errors:
+                    state = "failed"
+                else:
+                    state = "not_loaded"
+                size = self._sizes.get(name)
+                last_used = self._last_used.get(name)
+                models[name] = {
+                    "state": state,
+                    "default": name == self.default,
+                    "path": spec["path"],
+                    "memory_mb": None if size is None else round(size / 2**20, 1),
+                    "in_use": self._in_use[name],
+                    "idle_seconds": None if last_used is None or self._in_use[name] else round(time.time() - last_used, 1),
+                    "error": self._errors.get(name),
+                }
+            return {
+                "default": self.default,
+                "memory_budget_mb": round(self.memory_budget / 2**20, 1) if self.memory_budget else None,
+                "memory_used_mb": round(self.memory_used() / 2**20, 1),
+                "models": models,
+            }
@@ -0,0 +1,340 @@
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from fastapi import HTTPException
+from core.startup import ModelStartup
+from core.metrics import log_event
+from core.inference_executor import submit_thread
+from core.cancellation import Cancellation, GenerationCancelled
+from core.model_registry import load_model_specs
+
+DEFAULT_MODEL_NAME = "Llama-3.2-3B-Instruct"
+DEFAULT_MODEL_PATH = "meta-llama/Llama-3.2-3B-Instruct"
+
+
+def model_loading_steps(model_specs: dict, default_model: str) -> dict:
+    """
+    ModelStartup steps for the default generation model and the classifier;
+    the classifier loads in parallel with the model download and the LLM.
+    The other models in `model_specs` load when first used.
+    """
+    from core import model_loader, classifier_model
+
+    model_loader.configure_models(model_specs, default_model)
+    return {
+        "model_files": (model_loader.prepare_registered_model, ()),
+        "llm": (model_loader.load_default_model, ("model_files",)),
+        "classifier": (classifier_model.load_classifier_model, ()),
+    }
+
+
+class ModelServer:
+    """
+    Hosts the generation model and the classifier for API workers running in
+    other processes, so there is a single copy of each on the GPU.
+
+    Workers connect over a Unix socket that only this user can open, and each
+    connection is served by its own thread: the batching scheduler and the
+    classifier batcher see the requests of every worker. At most
+    `max_concurrency` generations run at once. Messages are pickled
+    `(method, args)` requests answered by `("ok", result)`, `("http_error",
+    (status, detail, headers))`, `("cancelled", reason)` or `("error",
+    message)`; a stream sends `("chunk", text)` messages first. While a
+    generation runs, the worker may send `("cancel", (reason,))` on the same
+    connection to stop it, and a worker that hangs up stops it too.
+    """
+
+    def __init__(self, socket_path: str, model_startup, max_concurrency: int = 1):
+        self.socket_path = socket_path
+        self.model_startup = model_startup
+        self.generation_slots = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        previous_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.socket_path, family="AF_UNIX")
+        finally:
+            os.umask(previous_umask)
+        print(f"✅ Model server listening on {self.socket_path}")
+
+        with listener:
+            while True:
+                try:
+                    connection = listener.accept()
+                except OSError:
+                    continue
+                threading.Thread(target=self._serve, args=(connection,), name="model-server", daemon=True).start()
+
+    def _serve(self, connection):
+        with connection:
+            try:
+                while True:
+                    method, args = connection.recv()
+                    if method == "cancel":
+                        # Sent just as the call it was meant for finished
+                        continue
+                    connection.send(self._dispatch(connection, method, args))
+            except (EOFError, OSError):
+                # The worker closed the connection
+                pass
+
+    def _dispatch(self, connection, method, args):
+        # Imported here, not at module level, so API workers using ModelClient never import torch
+        from core import model_loader, classifier_model
+
+        try:
+            if method == "status":
+                result = self.model_startup.status()
+            elif method == "generation_config":
+                # As JSON: unpickling a GenerationConfig would import transformers in the worker
+                result = model_loader.generation_config_for(*args).to_json_string(use_diff=False)
+            elif method == "models":
+                result = model_loader.list_models()
+            elif method == "preload_model":
+                result = model_loader.preload_model(*args)
+            elif method == "classify_text":
+                result = classifier_model.classify_text(*args)
+            elif method == "classify_texts":
+                result = classifier_model.classify_texts(*args)
+            elif method == "generate":
+                abstract, prompt_template, max_latency, model_name = args
+                cancellation = self._cancellation(connection, max_latency)
+                with self.generation_slots:
+                    text = model_loader.generate_pls_from_model(
+                        abstract, prompt_template, cancellation=cancellation, model_name=model_name
+                    )
+                result = text, cancellation.truncated
+            elif method == "stream":
+                abstract, prompt_template, max_latency, model_name = args
+                cancellation = self._cancellation(connection, max_latency)
+                with self.generation_slots:
+                    chunks = model_loader.stream_pls_from_model(
+                        abstract, prompt_template, cancellation=cancellation, model_name=model_name
+                    )
+                    for chunk in chunks:
+                        connection.send(("chunk", chunk))
+                result = cancellation.truncated
+            else:
+                raise ValueError(f"Unknown model server method '{method}'")
+        except HTTPException as e:
+            return "http_error", (e.status_code, e.detail, e.headers)
+        except GenerationCancelled as e:
+            return "cancelled", e.reason
+        except Exception as e:
+            # Also covers a worker that hung up mid-stream; _serve then sees the closed socket
+            log_event("model_server_error", level=logging.ERROR, method=method, error=str(e))
+            return "error", f"{type(e).__name__}: {e}"
+        return "ok", result
+
+    @staticmethod
+    def _cancellation(connection, max_latency=None) -> Cancellation:
+        """
+        Cancellation for a call on `connection`, checked by the generation
+        once per token: it reads a `cancel` message if the worker sent one,
+        and treats a closed connection as a disconnected client.
+        """
+        def poll():
+            try:
+                if not connection.poll():
+                    return None
+                method, args = connection.recv()
+            except (EOFError, OSError):
+                return "disconnected"
+            return args[0] if method == "cancel" else None
+
+        return Cancellation.with_max_latency(max_latency, poll=poll)
+
+
+class ModelClient:
+    """
+    Stands in for model_loader, classifier_model and ModelStartup in an API
+    worker whose models live in a ModelServer. Each call borrows a connection
+    from a pool (opening one if none is idle), so a worker's concurrent
+    requests run concurrently in the server.
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._idle = []
+        self._lock = threading.Lock()
+        self._ready = False
+        self._generation_configs = {}
+
+    def _connect(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Client(self.socket_path, family="AF_UNIX")
+        except OSError:
+            raise HTTPException(
+                status_code=503,
+                detail="The model server is not available.",
+                headers={"Retry-After": os.environ.get('STARTUP_RETRY_AFTER', '10')}
+            )
+
+    def _release(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+
+    def call(self, method: str, *args, on_chunk=None, cancellation=None):
+        """
+        Sends one request and returns its result; `on_chunk` receives streamed
+        chunks, and cancelling `cancellation` while the call runs is forwarded
+        to the server.
+        """
+        connection = self._connect()
+        # Cancels must not reach the server once the connection serves another call
+        forwarding = {"open": True, "lock": threading.Lock()}
+
+        def forward_cancel(reason):
+            with forwarding["lock"]:
+                if forwarding["open"]:
+                    try:
+                        connection.send(("cancel", (reason,)))
+                    except OSError:
+                        pass
+
+        try:
+            connection.send((method, args))
+            if cancellation is not None:
+                cancellation.add_callback(forward_cancel)
+            kind, value = connection.recv()
+            while kind == "chunk":
+                on_chunk(value)
+                kind, value = connection.recv()
+        except BaseException as e:
+            # A half-read reply would be picked up by the next request
+            connection.close()
+            if isinstance(e, (EOFError, OSError)):
+                raise HTTPException(status_code=503, detail="Lost the connection to the model server.")
+            raise
+        finally:
+            with forwarding["lock"]:
+                forwarding["open"] = False
+        self._release(connection)
+
+        if kind == "http_error":
+            status_code, detail, headers = value
+            raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+        if kind == "cancelled":
+            raise GenerationCancelled(value)
+        if kind == "error":
+            raise RuntimeError(value)
+        return value
+
+    # --- model_loader and classifier_model ---
+
+    def classify_text(self, text: str):
+        return self.call("classify_text", text)
+
+    def classify_texts(self, texts: list):
+        return self.call("classify_texts", texts)
+
+    def generate_pls_from_model(self, abstract: str, prompt_template: str, cancellation=None,
+                                model_name: str = None) -> str:
+        max_latency = cancellation.remaining() if cancellation is not None else None
+        text, truncated = self.call("generate", abstract, prompt_template, max_latency, model_name,
+                                    cancellation=cancellation)
+        if cancellation is not None:
+            cancellation.truncated = truncated
+        return text
+
+    def stream_pls_from_model(self, abstract: str, prompt_template: str, submit=None, cancellation=None,
+                              model_name: str = None):
+        """
+        Same contract as model_loader.stream_pls_from_model: `submit` runs the
+        blocking call (here, reading the server's chunks) and returns a Future.
+        """
+        chunks = queue.Queue()
+
+        def stream():
+            max_latency = cancellation.remaining() if cancellation is not None else None
+            truncated = self.call("stream", abstract, prompt_template, max_latency, model_name,
+                                  on_chunk=chunks.put, cancellation=cancellation)
+            if cancellation is not None:
+                cancellation.truncated = truncated
+
+        future = (submit or submit_thread)(stream)
+        future.add_done_callback(lambda f: chunks.put(None))
+        return self._iterate_chunks(chunks, future)
+
+    @staticmethod
+    def _iterate_chunks(chunks, future):
+        for chunk in iter(chunks.get, None):
+            if chunk:
+                yield chunk
+        # Re-raise any generation error
+        future.result()
+
+    def generation_config_for(self, model_name: str = None) -> str:
+        """The generation config of a model as JSON, which is all make_cache_key needs."""
+        if model_name not in self._generation_configs:
+            self._generation_configs[model_name] = self.call("generation_config", model_name)
+        return self._generation_configs[model_name]
+
+    def list_models(self) -> dict:
+        return self.call("models")
+
+    def preload_model(self, name: str) -> dict:
+        return self.call("preload_model", name)
+
+    # --- ModelStartup ---
+
+    def status(self) -> dict:
+        try:
+            return self.call("status")
+        except HTTPException as e:
+            return {"status": "loading", "detail": e.detail, "models": {}}
+
+    def ready(self) -> bool:
+        # Once ready, a server that goes away shows up as 503s on the calls
+        if not self._ready:
+            self._ready = self.status()["status"] == "ready"
+        return self._ready
+
+    def failed(self) -> bool:
+        return self.status()["status"] == "failed"
+
+    def wait(self, timeout: float = None) -> bool:
+        """Polls the server until its models are loaded or failed; returns whether they are ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            state = self.status()["status"]
+            if state != "loading":
+                self._ready = state == "ready"
+                return self._ready
+            time.sleep(0.5)
+        return False
+
+
+def run_model_server(socket_path: str):
+    """Loads the models in the background and serves them on `socket_path`."""
+    model_name, model_path = DEFAULT_MODEL_NAME, DEFAULT_MODEL_PATH
+    if os.environ.get('MODEL_PATH'):
+        model_name, model_path = os.environ.get('MODEL_NAME'), os.environ.get('MODEL_PATH')
+    model_startup = ModelStartup()
+    model_startup.start(model_loading_steps(*load_model_specs(model_name, model_path, os.environ.get('MODEL_SOURCE'))))
+
+    metrics_port = os.environ.get('MODEL_SERVER_METRICS_PORT')
+    if metrics_port:
+        # Generation and classification metrics are recorded in this process
+        from prometheus_client import start_http_server
+        from core.model_loader import track_scheduler_queue
+        track_scheduler_queue()
+        start_http_server(int(metrics_port))
+
+    max_concurrency = int(os.environ.get('INFERENCE_MAX_CONCURRENCY', os.environ.get('BATCH_MAX_SIZE', '1')))
+    ModelServer(socket_path, model_startup, max_concurrency).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves the PLS models to API workers over a Unix socket.")
+    parser.add_argument("--socket", default=os.environ.get('MODEL_SERVER_SOCKET', '/tmp/pls-model-server.sock'))
+    run_model_server(parser.parse_args().socket)
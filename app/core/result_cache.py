@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+from core.cancellation import GenerationCancelled
+
+# How often a request waiting for an identical one checks its own cancellation
+WAIT_POLL_SECONDS = 0.05
+
+
+def make_cache_key(abstract: str, model_name: str, prompt_template: str, gen_config) -> str:
+    """
+    Content address of a generation: the cleaned abstract, model, prompt template
+    and generation config. Generation is greedy, so equal keys give equal PLS.
+    `gen_config` may also be given as its to_json_string(use_diff=False).
+    """
+    if not isinstance(gen_config, str):
+        gen_config = gen_config.to_json_string(use_diff=False)
+    payload = json.dumps(
+        [abstract, model_name, prompt_template, gen_config],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache for finished results (PLS and both score sets).
+
+    Hot entries live in an in-memory LRU; every entry is also written to a
+    SQLite file so results survive restarts. The file is kept under
+    `max_disk_bytes` by evicting the least recently used rows. Identical
+    requests that arrive while the first one is still generating wait for
+    its result instead of starting a second generation.
+    """
+
+    def __init__(self, path, memory_items=256, max_disk_bytes=256 * 1024 * 1024):
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str, count_miss=True):
+        """
+        Returns the cached value or None. `count_miss=False` leaves a miss to
+        be counted by a following acquire().
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is None:
+                if count_miss:
+                    self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: str, value: dict):
+        with self._lock:
+            self._put_locked(key, value)
+
+    def get_or_compute(self, key: str, compute, keep=None, cancellation=None):
+        """
+        Returns the cached value for `key`, waits for an identical request that
+        is already running, or runs `compute()` and stores its result.
+
+        A result for which `keep(value)` is false (a PLS cut short by its
+        request's deadline) is returned but neither stored nor shared, and
+        neither is a generation its client abandoned: the requests waiting
+        for it run their own. A waiting request whose own `cancellation`
+        fires stops waiting and raises GenerationCancelled.
+        """
+        value, claim = self.acquire(key, cancellation)
+        if claim is None:
+            return value
+
+        try:
+            value = compute()
+        except BaseException as e:
+            self.release(key, claim, error=e)
+            raise
+        self.release(key, claim, value if keep is None or keep(value) else None)
+        return value
+
+    def acquire(self, key: str, cancellation=None):
+        """
+        The first half of get_or_compute, for callers that produce the value
+        themselves (a streamed PLS): returns (value, None) with the cached
+        value or that of an identical request once it finishes, or claims
+        `key` and returns (None, claim). The claim must then be passed to
+        release(), which wakes the requests waiting for it.
+        """
+        while True:
+            with self._lock:
+                value = self._get_locked(key)
+                if value is not None:
+                    self.hits += 1
+                    return value, None
+                future = self._in_flight.get(key)
+                owner = future is None
+                if owner:
+                    self.misses += 1
+                    future = self._in_flight[key] = Future()
+                else:
+                    self.hits += 1
+
+            if owner:
+                return None, future
+            value = self._wait(future, cancellation)
+            if value is not None:
+                return value, None
+
+    def release(self, key: str, claim, value=None, error=None):
+        """
+        Ends a `claim` from acquire(); later calls do nothing. `value` is
+        stored and handed to the waiting requests, `error` is raised in them,
+        and with neither (a result not kept, a stream its client left) they
+        run their own.
+        """
+        with self._lock:
+            if self._in_flight.get(key) is not claim:
+                return
+            # Waiting requests are woken only once the key is no longer in flight
+            del self._in_flight[key]
+            if value is not None:
+                self._put_locked(key, value)
+        if error is not None:
+            claim.set_exception(error)
+        else:
+            claim.set_result(value)
+
+    @staticmethod
+    def _wait(future, cancellation=None):
+        """
+        The value of an identical request's `future`, or None if it was not
+        kept or its client abandoned it. Raises GenerationCancelled once
+        `cancellation` fires.
+        """
+        while True:
+            if cancellation is not None:
+                cancellation.check()
+            try:
+                return future.result(timeout=None if cancellation is None else WAIT_POLL_SECONDS)
+            except FutureTimeoutError:
+                continue
+            except GenerationCancelled:
+                return None
+
+    # --- Internal helpers, called with the lock held ---
+
+    def _get_locked(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def _put_locked(self, key, value):
+        self._remember(key, value)
+        encoded = json.dumps(value, ensure_ascii=False)
+        self._db.execute(
+            "INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, encoded, len(encoded.encode("utf-8")), time.time())
+        )
+        self._evict_disk()
+        self._db.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+
+
+class StreamClaim:
+    """
+    get_or_compute for a streamed PLS. submit() replaces the `submit` given
+    to stream_pls_from_model: in the inference worker, before generating,
+    it waits for an identical request that is already running, or claims
+    `key` for this one. Owners claim only once they hold a worker, as in
+    get_or_compute, so the requests waiting for them never hold up the
+    generation they wait for.
+
+    If a result was waited for, `value` holds it and no chunks are streamed.
+    Otherwise the stream passes its result to release(); release_when_done()
+    is the backstop for a stream that never ran to its end.
+    """
+
+    def __init__(self, cache: ResultCache, key: str, submit, cancellation=None):
+        self.cache = cache
+        self.key = key
+        self._submit = submit
+        self.cancellation = cancellation
+        self.value = None
+        self.claim = None
+        self.future = None
+
+    def submit(self, fn):
+        def run():
+            self.value, self.claim = self.cache.acquire(self.key, self.cancellation)
+            if self.claim is None:
+                return None
+            try:
+                return fn()
+            except BaseException as e:
+                self.release(error=e)
+                raise
+
+        self.future = self._submit(run)
+        return self.future
+
+    def release(self, value=None, error=None):
+        """ResultCache.release for this stream's claim, if it has one."""
+        if self.claim is not None:
+            self.cache.release(self.key, self.claim, value, error)
+
+    def release_when_done(self):
+        """Once the generation is over, lets the requests still waiting for this stream run their own."""
+        if self.future is not None:
+            wait([self.future])
+        self.release()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = ".s3_manifest.json"
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def sync_from_s3(client, bucket: str, prefix: str, local_path: str, max_workers: int = 8,
+                 part_size: int = 64 * 1024 * 1024, verify_etag: bool = True) -> dict:
+    """
+    Mirrors s3://bucket/prefix into `local_path`.
+
+    Files whose size and ETag match the local manifest (and whose size on disk
+    still matches) are skipped. The rest are downloaded concurrently, each one
+    with ranged requests of `part_size` bytes, into a temporary file that is
+    checked against the object's size and ETag before it replaces the old file.
+    Objects encrypted with SSE-KMS have ETags that are not MD5s; pass
+    `verify_etag=False` to only check their size. Up to `max_workers` files
+    download at once with up to `max_workers` ranged requests each, so
+    `client` should allow max_workers * max_workers pooled connections.
+    Returns counts of downloaded and skipped files and bytes.
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    os.makedirs(local_path, exist_ok=True)
+    manifest_path = os.path.join(local_path, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
+    transfer_config = TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=max_workers,
+    )
+
+    objects = list_objects(client, bucket, prefix)
+    to_download = []
+    stats = {"downloaded": 0, "skipped": 0, "downloaded_bytes": 0, "skipped_bytes": 0}
+    for obj in objects:
+        relative_path = os.path.relpath(obj["Key"], prefix)
+        local_file_path = os.path.join(local_path, relative_path)
+        if is_up_to_date(manifest.get(relative_path), obj, local_file_path):
+            stats["skipped"] += 1
+            stats["skipped_bytes"] += obj["Size"]
+        else:
+            to_download.append((obj, relative_path, local_file_path))
+
+    def download(item):
+        obj, relative_path, local_file_path = item
+        print(f"Downloading {obj['Key']} to {local_file_path}")
+        download_verified(client, bucket, obj, local_file_path, transfer_config, verify_etag)
+        with manifest_lock:
+            manifest[relative_path] = {"size": obj["Size"], "etag": obj["ETag"]}
+            save_manifest(manifest_path, manifest)
+
+    # Files download in parallel, and each large file is itself split into
+    # parallel ranged requests
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_download)))) as pool:
+        for _ in pool.map(download, to_download):
+            pass
+
+    stats["downloaded"] = len(to_download)
+    stats["downloaded_bytes"] = sum(obj["Size"] for obj, _, _ in to_download)
+    return stats
+
+
+def list_objects(client, bucket: str, prefix: str) -> list:
+    paginator = client.get_paginator('list_objects_v2')
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            # Skip "directory" placeholder keys
+            if not obj['Key'].endswith('/'):
+                objects.append(obj)
+    return objects
+
+
+def is_up_to_date(entry, obj, local_file_path) -> bool:
+    return (
+        entry is not None
+        and entry["size"] == obj["Size"]
+        and entry["etag"] == obj["ETag"]
+        and os.path.exists(local_file_path)
+        and os.path.getsize(local_file_path) == obj["Size"]
+    )
+
+
+def download_verified(client, bucket, obj, local_file_path, transfer_config, verify_etag=True):
+    """
+    Downloads one object to a temporary file next to `local_file_path`,
+    verifies it and moves it into place, so a crash never leaves a partial
+    file under the final name.
+    """
+    directory = os.path.dirname(local_file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".part")
+    os.close(fd)
+    try:
+        client.download_file(bucket, obj["Key"], tmp_path, Config=transfer_config)
+        verify_download(client, bucket, obj, tmp_path, verify_etag)
+        os.replace(tmp_path, local_file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def verify_download(client, bucket, obj, path, verify_etag=True):
+    """Checks the size and the MD5-based ETag of a downloaded file."""
+    size = os.path.getsize(path)
+    if size != obj["Size"]:
+        raise IOError(f"{obj['Key']}: expected {obj['Size']} bytes, got {size}")
+    if not verify_etag:
+        return
+
+    etag = obj["ETag"].strip('"')
+    if "-" in etag:
+        # Multipart ETag: MD5 of the part MD5s. The part size used for the
+        # upload is the length of part 1.
+        parts = int(etag.split("-")[1])
+        part_size = client.head_object(Bucket=bucket, Key=obj["Key"], PartNumber=1)["ContentLength"]
+        actual = multipart_etag(path, part_size)
+        if not actual.endswith(f"-{parts}"):
+            actual = None
+    else:
+        actual = file_md5(path).hexdigest()
+
+    if actual != etag:
+        raise IOError(f"{obj['Key']}: checksum mismatch (ETag {etag}, local {actual})")
+
+
+def file_md5(path, start=0, length=None):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest
+
+
+def multipart_etag(path, part_size) -> str:
+    size = os.path.getsize(path)
+    part_digests = b"".join(
+        file_md5(path, start, part_size).digest() for start in range(0, size, part_size)
+    )
+    parts = (size + part_size - 1) // part_size
+    return f"{hashlib.md5(part_digests).hexdigest()}-{parts}"
+
+
+def load_manifest(path) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # A damaged manifest only costs a full re-download
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -1,29 +1,237 @@
-import numpy as np
-import torch
-import readability
+import math
+import os
+import string
+from concurrent.futures import ProcessPoolExecutor
+import regex
 import syntok.segmenter as segmenter
+from syntok.tokenizer import Token, Tokenizer
 from core.class_model import ReadabilityScores
 
 # --- 5. Scoring Functions ---
 
 # --- Readability Functions ---
 
-def get_scores(text: str) -> ReadabilityScores:
+# Same syllable rules, punctuation test and Dale-Chall familiar words as
+# readability.getmeasures(lang='en'), so the grades match it exactly.
+# Loaded on first use so importing this module stays cheap at startup.
+count_syllables, BASIC_WORDS = None, None
+PUNCTUATION = frozenset(string.punctuation)
+
+# token -> (characters, syllables, is_complex, is_complex_dc), filled on first sight
+WORD_TABLE = {}
+WORD_TABLE_MAX_SIZE = 500_000
+
+# How syntok splits a text into paragraphs, and then into runs it tokenizes one by one
+PARAGRAPH_SEPARATOR = regex.compile("\r?\n(?:\\s*\r?\n)+")
+WORD_RUN = regex.compile(r"[^\s\u200b]+")
+NON_SPACE = regex.compile(r"\S")
+
+# run -> ((spacing, value, offset in the run), ...) of its syntok tokens, filled on first sight
+RUN_TABLE = {}
+RUN_TABLE_MAX_SIZE = 500_000
+RUN_TOKENIZER = Tokenizer(replace_not_contraction=False)
+
 
-    tokenized = '\n\n'.join(
-     '\n'.join(' '.join(token.value for token in sentence)
-        for sentence in paragraph)
-     for paragraph in segmenter.analyze(text))
-    print(tokenized)
-
-    results = readability.getmeasures(tokenized, lang='en')
-    scores = ReadabilityScores(
-        CLI=results['readability grades']['Coleman-Liau'],
-        FRE=results['readability grades']['FleschReadingEase'],         
-        GFI=results['readability grades']['GunningFogIndex'],
-        SMOG=results['readability grades']['SMOGIndex'],
-        FKGL=results['readability grades']['Kincaid'],
-        DCRS=results['readability grades']['DaleChallIndex']
+def tokenize(text: str, offset: int = 0):
+    """
+    The Tokens syntok's Tokenizer(replace_not_contraction=False) gives for
+    `text` found at `offset`. It splits each whitespace-separated run on its
+    own, so the split of a run is looked up in RUN_TABLE; only the spacing
+    before the run comes from the text around it.
+    """
+    end = 0
+    for match in WORD_RUN.finditer(text):
+        run = match.group()
+        split = RUN_TABLE.get(run)
+        if split is None:
+            split = tuple((t.spacing, t.value, t.offset) for t in RUN_TOKENIZER.tokenize(run))
+            if len(RUN_TABLE) < RUN_TABLE_MAX_SIZE:
+                RUN_TABLE[run] = split
+        start = match.start()
+        spacing = text[end:start]
+        for token_spacing, value, token_offset in split:
+            yield Token(spacing + token_spacing, value, offset + start + token_offset)
+            spacing = ""
+        end = match.end()
+    if end < len(text):
+        yield Token(text[end:], "", offset + len(text))
+
+
+def word_stats(token: str):
+    """
+    Per-token counts used by the readability formulas, or None for pure
+    punctuation tokens (which getmeasures does not count as words).
+    """
+    stats = WORD_TABLE.get(token)
+    if stats is not None:
+        return stats
+    if all(ch in PUNCTUATION for ch in token):
+        return None
+    if count_syllables is None:
+        _load_langdata()
+
+    syllables = count_syllables(token)
+    # Proper nouns and numbers are never complex
+    countable = not token[0].isupper() and not token.isdigit()
+    stats = (
+        len(token),
+        syllables,
+        countable and syllables >= 3,
+        countable and token.lower() not in BASIC_WORDS,
     )
+    if len(WORD_TABLE) < WORD_TABLE_MAX_SIZE:
+        WORD_TABLE[token] = stats
+    return stats
+
+
+def _load_langdata():
+    global count_syllables, BASIC_WORDS
+    from readability.langdata import LANGDATA
+    BASIC_WORDS = LANGDATA['en']['basicwords']
+    count_syllables = LANGDATA['en']['syllables']
+
+
+class ReadabilityCounts:
+    """
+    Surface counts of a text: the only inputs the CLI, FRE, GFI, SMOG, FKGL
+    and DCRS formulas need.
+    """
+
+    def __init__(self):
+        self.sentences = 0
+        self.words = 0
+        self.characters = 0
+        self.syllables = 0
+        self.complex_words = 0
+        self.complex_words_dc = 0
+
+    def add_sentence(self, tokens):
+        """Adds one sentence given as an iterable of token strings."""
+        self.sentences += 1
+        self.add_words(tokens)
+
+    def add_words(self, tokens):
+        """Adds the words of an iterable of token strings, whatever sentences they belong to."""
+        for token in tokens:
+            stats = word_stats(token)
+            if stats is None:
+                continue
+            self.words += 1
+            self.characters += stats[0]
+            self.syllables += stats[1]
+            self.complex_words += stats[2]
+            self.complex_words_dc += stats[3]
+
+    def add_text(self, text: str):
+        """Segments a text as syntok's segmenter.analyze does and adds all of its sentences."""
+        for offset, paragraph in segmenter.preprocess_with_offsets(text):
+            for sentence in segmenter.segment(tokenize(paragraph, offset)):
+                self.add_sentence(word for token in sentence for word in token.value.split())
+
+    def to_scores(self) -> ReadabilityScores:
+        if not self.words:
+            raise ValueError("I can't do this, there's no words there!")
+
+        words, sentences = self.words, self.sentences
+        words_per_sentence = words / sentences
+        syllables_per_word = self.syllables / words
+
+        complex_dc_percent = self.complex_words_dc / words * 100
+        dale_chall = 0.1579 * complex_dc_percent + 0.0496 * words_per_sentence
+        if complex_dc_percent <= 5:
+            dale_chall += 3.6365
+
+        return ReadabilityScores(
+            CLI=5.879851 * self.characters / words - 29.587280 * sentences / words - 15.800804,
+            FRE=206.835 - 84.6 * syllables_per_word - 1.015 * words_per_sentence,
+            GFI=0.4 * (words_per_sentence + 100 * (self.complex_words / words)),
+            SMOG=math.sqrt(self.complex_words * (30 / sentences)) + 3,
+            FKGL=11.8 * syllables_per_word + 0.39 * words_per_sentence - 15.59,
+            DCRS=dale_chall
+        )
+
+
+class ReadabilityAccumulator:
+    """
+    ReadabilityCounts of a text that arrives in pieces, such as a PLS while it
+    is decoded. syntok splits paragraphs at blank lines and tokenizes each
+    whitespace-separated run on its own, so the words of a run are counted as
+    soon as whitespace follows it, and the sentences of a paragraph once the
+    next paragraph starts. scores() only has the last paragraph left to split
+    into sentences, and gives exactly get_scores of the whole text.
+    """
+
+    def __init__(self):
+        self.counts = ReadabilityCounts()
+        # The text not tokenized yet, from `_offset` in the whole text
+        self._pending = ""
+        self._offset = 0
+        # Tokens of the current paragraph
+        self._tokens = []
+
+    def add(self, text: str):
+        """Adds the next piece of the text."""
+        self._pending += text
+        self._advance(final=False)
+
+    def scores(self) -> ReadabilityScores:
+        """The scores of all the text added; nothing can be added after."""
+        self._advance(final=True)
+        self._end_paragraph(len(self._pending))
+        return self.counts.to_scores()
+
+    def _advance(self, final: bool):
+        while True:
+            match = PARAGRAPH_SEPARATOR.search(self._pending)
+            # Until text follows it, more blank lines could still extend the separator
+            if match is None or not (final or NON_SPACE.search(self._pending, match.end())):
+                break
+            self._end_paragraph(match.start())
+            self._skip(match.end() - match.start())
+
+        end = 0
+        for match in WORD_RUN.finditer(self._pending):
+            # The last run may continue in the next piece
+            if match.end() == len(self._pending) and not final:
+                break
+            end = match.end()
+        self._tokenize(end)
+
+    def _tokenize(self, end: int):
+        """Tokenizes the pending text up to `end`, which ends a run or the paragraph."""
+        if not end:
+            return
+        tokens = list(tokenize(self._pending[:end], self._offset))
+        self.counts.add_words(word for token in tokens for word in token.value.split())
+        self._tokens.extend(tokens)
+        self._skip(end)
+
+    def _skip(self, length: int):
+        self._pending = self._pending[length:]
+        self._offset += length
+
+    def _end_paragraph(self, end: int):
+        self._tokenize(end)
+        self.counts.sentences += sum(1 for _ in segmenter.segment(iter(self._tokens)))
+        self._tokens = []
+
+
+def get_scores(text: str) -> ReadabilityScores:
+    counts = ReadabilityCounts()
+    counts.add_text(text)
+    return counts.to_scores()
+
+
+def get_scores_batch(texts, processes: int = None) -> list:
+    """
+    Scores many texts. With `processes` > 1 (by default os.cpu_count()) the
+    texts are spread over a process pool, which pays off for whole corpora.
+    """
+    texts = list(texts)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if not processes or processes <= 1 or len(texts) < 2:
+        return [get_scores(text) for text in texts]
 
-    return scores
\ No newline at end of file
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(get_scores, texts, chunksize=max(1, len(texts) // (processes * 4))))
@@ -0,0 +1,214 @@
+import os
+import time
+
+import torch
+from transformers import DynamicCache
+
+from core.stopping import PLS_SECTIONS, SectionStoppingCriteria
+
+# Each parallel sequence starts the answer with the heading of its section
+SECTION_HEADINGS = tuple(f"## {section.title()}\n" for section in PLS_SECTIONS)
+SECTION_SEPARATOR = "\n\n"
+
+
+def section_token_budgets() -> list:
+    """SECTION_MAX_NEW_TOKENS: the max new tokens of each section, in PLS_SECTIONS order."""
+    budgets = [int(b) for b in os.environ.get('SECTION_MAX_NEW_TOKENS', '48,256,256,320').split(',')]
+    if len(budgets) != len(PLS_SECTIONS):
+        raise ValueError(f"SECTION_MAX_NEW_TOKENS needs {len(PLS_SECTIONS)} values, one per section.")
+    return budgets
+
+
+class Section:
+    """The decoding state of one section."""
+
+    def __init__(self, heading: str, stopper, budget: int):
+        self.heading = heading
+        self.stopper = stopper
+        self.budget = budget
+        self.reason = None
+        self.streamed = ""
+
+    @property
+    def tokens(self):
+        return self.stopper.ids
+
+    def text(self, tokenizer, complete_lines_only=False) -> str:
+        """
+        The heading and the kept tokens, without trailing whitespace. While
+        the section is decoding, only its finished lines that no stop can
+        drop any more are included.
+        """
+        if complete_lines_only:
+            body = tokenizer.decode(self.tokens[:self.stopper.final_tokens()], skip_special_tokens=True)
+            body = body[:body.rfind("\n") + 1]
+        else:
+            body = tokenizer.decode(self.tokens[:self.stopper.keep_tokens], skip_special_tokens=True)
+        text = (self.heading + body).rstrip()
+        # Streamed text cannot be taken back
+        return text if text.startswith(self.streamed) else self.streamed
+
+
+class SectionGenerator:
+    """
+    Section-parallel greedy generation of a PLS. The chat prompt with the
+    abstract is prefilled once, then its KV cache is shared by one sequence
+    per PLS section. Each sequence starts the answer with its section's
+    heading ("## Rationale") and decodes within its own token budget until its
+    SectionStoppingCriteria ends it. The sequences decode as one batch and
+    leave it when they finish, so latency follows the longest section rather
+    than the sum of all four; the sections are then joined in order.
+
+    Streamed text comes a finished line at a time, in section order: later
+    sections are held back until the ones before them are done.
+    """
+
+    def __init__(self, model, tokenizer, budgets=None, word_budget: int = 900):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.budgets = budgets or section_token_budgets()
+        self.word_budget = word_budget
+        self.heading_ids = [
+            tokenizer(heading, add_special_tokens=False, return_tensors="pt").input_ids[0]
+            for heading in SECTION_HEADINGS
+        ]
+
+    @property
+    def max_new_tokens(self) -> int:
+        return sum(self.budgets)
+
+    def generate(self, input_ids, past_key_values=None, eos_token_ids=(), streamer=None, cancellation=None) -> dict:
+        """
+        Generates the sections for a (1, prompt_length) chat prompt that ends
+        with the assistant header. `past_key_values` may hold the KV of its
+        leading tokens (the prefix cache). Decoding stops when every section
+        is done or `cancellation` fires. Returns the joined `text`, each
+        section's stop reason and generated tokens, their total count, the
+        cancel reason and the prefill and decode times.
+        """
+        start = time.perf_counter()
+        sections = [
+            Section(heading, SectionStoppingCriteria(self.tokenizer, 0, word_budget=self.word_budget), budget)
+            for heading, budget in zip(SECTION_HEADINGS, self.budgets)
+        ]
+        stream = _SectionStream(sections, self.tokenizer, streamer)
+        cancel_reason = None
+
+        with torch.no_grad():
+            next_tokens, cache, mask = self._prefill(input_ids, past_key_values)
+            prefill_seconds = time.perf_counter() - start
+            active = list(range(len(sections)))
+
+            while True:
+                for index, token in zip(active, next_tokens.tolist()):
+                    section = sections[index]
+                    reason = section.stopper.update([token]) if token not in eos_token_ids else "eos"
+                    if reason is None and len(section.tokens) >= section.budget:
+                        reason = "max_new_tokens"
+                    section.reason = reason
+                if cancellation is not None:
+                    cancel_reason = cancellation.reason()
+                    if cancel_reason is not None:
+                        break
+                stream.update()
+
+                keep = [row for row, index in enumerate(active) if sections[index].reason is None]
+                if not keep:
+                    break
+                if len(keep) < len(active):
+                    rows = torch.tensor(keep, device=mask.device)
+                    cache.batch_select_indices(rows)
+                    mask, next_tokens = mask[rows], next_tokens[rows]
+                    active = [active[row] for row in keep]
+
+                mask = torch.cat([mask, mask.new_ones((len(active), 1))], dim=-1)
+                outputs = self.model(
+                    input_ids=next_tokens.unsqueeze(-1),
+                    attention_mask=mask,
+                    position_ids=mask.sum(-1, keepdim=True) - 1,
+                    past_key_values=cache,
+                    use_cache=True,
+                )
+                cache = outputs.past_key_values
+                next_tokens = outputs.logits[:, -1, :].argmax(dim=-1)
+
+        for section in sections:
+            section.reason = section.reason or cancel_reason
+        stream.finish()
+        return {
+            "text": SECTION_SEPARATOR.join(section.text(self.tokenizer) for section in sections),
+            "reasons": [section.reason for section in sections],
+            "section_tokens": [list(section.tokens) for section in sections],
+            "new_tokens": sum(len(section.tokens) for section in sections),
+            "cancel_reason": cancel_reason,
+            "prefill_seconds": prefill_seconds,
+            "decode_seconds": time.perf_counter() - start - prefill_seconds,
+        }
+
+    def _prefill(self, input_ids, past_key_values=None):
+        """
+        Prefills the shared prompt once, then the headings of every section
+        as one batch on copies of its cache. Returns the first token of each
+        section, the batched cache and its attention mask.
+        """
+        device = self.model.device
+        cache = past_key_values if past_key_values is not None else DynamicCache()
+        cached = cache.get_seq_length()
+        self.model(input_ids=input_ids[:, cached:].to(device), past_key_values=cache, use_cache=True)
+        cache.batch_repeat_interleave(len(self.heading_ids))
+
+        # Layout of each row: [shared prompt][padding][heading], as in the batching scheduler
+        shared = input_ids.shape[1]
+        width = max(len(ids) for ids in self.heading_ids)
+        headings = torch.full((len(self.heading_ids), width), self.tokenizer.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(self.heading_ids), shared + width), dtype=torch.long)
+        mask[:, :shared] = 1
+        for row, ids in enumerate(self.heading_ids):
+            headings[row, width - len(ids):] = ids
+            mask[row, shared + width - len(ids):] = 1
+
+        headings, mask = headings.to(device), mask.to(device)
+        outputs = self.model(
+            input_ids=headings,
+            attention_mask=mask,
+            position_ids=(mask.cumsum(-1) - 1)[:, shared:],
+            past_key_values=cache,
+            use_cache=True,
+        )
+        return outputs.logits[:, -1, :].argmax(dim=-1), outputs.past_key_values, mask
+
+
+class _SectionStream:
+    """Pushes the sections' finished lines to a TextIteratorStreamer, in section order."""
+
+    def __init__(self, sections, tokenizer, streamer=None):
+        self.sections = sections
+        self.tokenizer = tokenizer
+        self.streamer = streamer
+        self.current = 0
+
+    def update(self):
+        while self.streamer is not None and self.current < len(self.sections):
+            section = self.sections[self.current]
+            done = section.reason is not None
+            # Only decoded again when a line was finished
+            if done or "\n" in section.stopper.piece(section.tokens[-1]):
+                self._push(section, section.text(self.tokenizer, complete_lines_only=not done))
+            if not done:
+                return
+            self.current += 1
+
+    def finish(self):
+        if self.streamer is None:
+            return
+        self.update()
+        self.streamer.end()
+
+    def _push(self, section, text):
+        new_text = text[len(section.streamed):]
+        if not new_text:
+            return
+        if not section.streamed and self.current:
+            new_text = SECTION_SEPARATOR + new_text
+        section.streamed = text
+        self.streamer.on_finalized_text(new_text)
@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+import time
+from core.metrics import COLD_START_SECONDS, MODEL_LOAD_SECONDS, log_event
+
+# transformers switches torch's global default dtype while it builds a model,
+# so two models built at the same time in different loading threads can get
+# each other's dtype. Every from_pretrained of a model holds this lock.
+model_build_lock = threading.Lock()
+
+
+def process_start_time() -> float:
+    """
+    Wall-clock time at which this process started, so cold starts include the
+    interpreter and library imports. Falls back to now outside Linux.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, after the parenthesised command name
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+class ModelStartup:
+    """
+    Runs the model loading steps in background threads, in parallel unless a
+    step waits for another one, and records the state and duration of each.
+    States go pending -> loading -> ready or failed.
+    """
+
+    def __init__(self):
+        self.process_started = process_start_time()
+        self.cold_start_seconds = None
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def start(self, steps: dict):
+        """
+        `steps` maps a name to `(fn, after)`. Each `fn()` runs in its own
+        thread once the steps named in `after` are ready.
+        """
+        with self._lock:
+            for name in steps:
+                self._steps[name] = {"state": "pending", "seconds": None, "error": None, "done": threading.Event()}
+        for name, (fn, after) in steps.items():
+            threading.Thread(
+                target=self._run, args=(name, self._steps[name], fn, after), name=f"load-{name}", daemon=True
+            ).start()
+
+    def _run(self, name, step, fn, after):
+        for dependency in after:
+            self._steps[dependency]["done"].wait()
+            if self._steps[dependency]["state"] != "ready":
+                self._finish(name, step, "failed", error=f"'{dependency}' did not load")
+                return
+
+        step["state"] = "loading"
+        start = time.monotonic()
+        try:
+            fn()
+        except Exception as e:
+            self._finish(name, step, "failed", time.monotonic() - start, error=f"{type(e).__name__}: {e}")
+        else:
+            self._finish(name, step, "ready", time.monotonic() - start)
+
+    def _finish(self, name, step, state, seconds=None, error=None):
+        step.update(state=state, seconds=seconds, error=error)
+        if seconds is not None:
+            MODEL_LOAD_SECONDS.labels(name).set(seconds)
+        if error:
+            log_event("model_load_failed", level=logging.ERROR, step=name, error=error)
+        else:
+            log_event("model_loaded", step=name, seconds=round(seconds, 2))
+
+        with self._lock:
+            if self.cold_start_seconds is None and self.ready():
+                self.cold_start_seconds = time.time() - self.process_started
+                COLD_START_SECONDS.set(self.cold_start_seconds)
+                log_event("startup_complete", cold_start_seconds=round(self.cold_start_seconds, 2))
+        step["done"].set()
+
+    def ready(self) -> bool:
+        return bool(self._steps) and all(step["state"] == "ready" for step in self._steps.values())
+
+    def failed(self) -> bool:
+        return any(step["state"] == "failed" for step in self._steps.values())
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until every step has finished; returns whether all are ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for step in list(self._steps.values()):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not step["done"].wait(remaining):
+                return False
+        return self.ready()
+
+    def status(self) -> dict:
+        if self.ready():
+            overall = "ready"
+        elif self.failed():
+            overall = "failed"
+        else:
+            overall = "loading"
+        return {
+            "status": overall,
+            "uptime_seconds": round(time.time() - self.process_started, 2),
+            "cold_start_seconds": None if self.cold_start_seconds is None else round(self.cold_start_seconds, 2),
+            "models": {
+                name: {
+                    "state": step["state"],
+                    "seconds": None if step["seconds"] is None else round(step["seconds"], 2),
+                    "error": step["error"],
+                }
+                for name, step in self._steps.items()
+            },
+        }
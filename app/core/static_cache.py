@@ -0,0 +1,135 @@
+import copy
+import threading
+import time
+from contextlib import contextmanager
+
+import torch
+from transformers import CompileConfig, GenerationConfig, StaticCache
+
+from core.batch_scheduler import common_prefix_length
+
+
+class StaticCachePool:
+    """
+    Preallocated KV caches for single-sequence generation, so decoding runs
+    on fixed shapes and its forward pass can be compiled.
+
+    Prompts are bucketed by length: a prompt of up to `bucket` tokens gets a
+    StaticCache of `bucket + max_new_tokens` positions, and each bucket's
+    decode step is compiled once (CUDA graphs on GPU). Prompts longer than the
+    largest bucket fall back to the dynamic cache. Caches are reset and reused
+    across requests; concurrent generations each take their own, allocated on
+    first use. Prefill always runs eagerly, since its shape changes with every
+    prompt.
+    """
+
+    def __init__(self, model, buckets, max_new_tokens, compile_decode=True):
+        self.model = model
+        self.buckets = sorted(buckets)
+        self.max_new_tokens = max_new_tokens
+        self.compile_config = self._compile_config() if compile_decode else None
+
+        self._idle = {bucket: [] for bucket in self.buckets}
+        self._lock = threading.Lock()
+        # CUDA graphs must not be replayed by two threads at once
+        self._graph_lock = threading.Lock() if self.compile_config and model.device.type == "cuda" else None
+
+        # One compiled graph per bucket
+        if self.compile_config and torch._dynamo.config.recompile_limit < len(self.buckets):
+            torch._dynamo.config.recompile_limit = len(self.buckets)
+
+    def _compile_config(self):
+        if self.model.device.type == "cuda":
+            return CompileConfig(fullgraph=False, dynamic=False, mode="reduce-overhead")
+        # CUDA graphs do not exist on CPU, and transformers only compiles there when asked to
+        compile_config = CompileConfig(fullgraph=False, dynamic=False, mode="default")
+        compile_config._compile_all_devices = True
+        return compile_config
+
+    def bucket_for(self, prompt_length: int):
+        return next((bucket for bucket in self.buckets if prompt_length <= bucket), None)
+
+    def generation_config(self, gen_config: GenerationConfig) -> GenerationConfig:
+        """Copy of `gen_config` that compiles the decode step, or keeps it eager."""
+        gen_config = copy.deepcopy(gen_config)
+        if self.compile_config is None:
+            gen_config.disable_compile = True
+        else:
+            gen_config.compile_config = self.compile_config
+        return gen_config
+
+    @contextmanager
+    def cache_for(self, input_ids, prefix_cache=None):
+        """
+        Yields an empty StaticCache for a (1, prompt_length) prompt, holding the
+        KV of the leading tokens it shares with `prefix_cache`, or None if the
+        prompt is longer than every bucket.
+        """
+        bucket = self.bucket_for(input_ids.shape[-1])
+        if bucket is None:
+            yield None
+            return
+
+        with self._lock:
+            cache = self._idle[bucket].pop() if self._idle[bucket] else None
+        if cache is None:
+            cache = StaticCache(config=self.model.config, max_cache_len=bucket + self.max_new_tokens)
+        cache.reset()
+
+        try:
+            if prefix_cache is not None:
+                self._copy_prefix(cache, input_ids, prefix_cache)
+            if self._graph_lock is None:
+                yield cache
+            else:
+                with self._graph_lock:
+                    yield cache
+        finally:
+            with self._lock:
+                self._idle[bucket].append(cache)
+
+    @staticmethod
+    def _copy_prefix(cache, input_ids, prefix_cache):
+        length = common_prefix_length(prefix_cache["input_ids"], input_ids.reshape(-1).cpu())
+        # At least one token has to be left for the model to prefill
+        length = min(length, input_ids.shape[-1] - 1)
+        if length <= 0:
+            return
+        for layer_idx, layer in enumerate(prefix_cache["past_key_values"].layers):
+            cache.update(layer.keys[:, :, :length], layer.values[:, :, :length], layer_idx)
+
+    def warm_up(self, pad_token_id: int, new_tokens: int = 3):
+        """
+        Runs a short generation for every bucket so the caches are allocated
+        and the decode step compiled before the first request. If compiling
+        fails (no compiler for the backend, unsupported model), the pool keeps
+        its static caches and decodes eagerly.
+        """
+        start = time.perf_counter()
+        warmup_config = GenerationConfig(
+            max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False,
+            pad_token_id=pad_token_id, eos_token_id=pad_token_id,
+        )
+        for bucket in self.buckets:
+            input_ids = torch.full((1, bucket), pad_token_id, dtype=torch.long, device=self.model.device)
+            try:
+                self._generate(input_ids, warmup_config)
+            except Exception as e:
+                if self.compile_config is None:
+                    raise
+                print(f"Could not compile the decode step, decoding eagerly with the static cache. Error: {e}")
+                self.compile_config = None
+                self._graph_lock = None
+                self._generate(input_ids, warmup_config)
+
+        print(f"✅ Static KV cache ready. Prompt buckets: {self.buckets}, "
+              f"compiled decode: {self.compile_config is not None}, warmup: {time.perf_counter() - start:.1f}s")
+
+    def _generate(self, input_ids, gen_config):
+        with self.cache_for(input_ids) as cache, torch.no_grad():
+            self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                generation_config=self.generation_config(gen_config),
+                past_key_values=cache,
+            )
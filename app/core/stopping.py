@@ -0,0 +1,326 @@
+import logging
+import regex
+import torch
+from transformers import StoppingCriteria
+from core.metrics import log_event
+
+# The sections PROMPT_TEMPLATE asks for, in order
+PLS_SECTIONS = ("plain title", "rationale", "trial design", "results")
+
+MARKDOWN_HEADING = regex.compile(r"^(#{1,6})\s+(.*)$")
+BOLD_HEADING = regex.compile(r"^\*\*(.+?)\*\*:?$")
+NUMBERED_HEADING = regex.compile(r"^\d+[.)]\s+(.*)$")
+HORIZONTAL_RULE = regex.compile(r"^([-*_])\1{2,}$")
+# Closing notes models add once the summary itself is over, written as a label
+# ("Word count: 250", "**Note:**", a bare "References"), not prose such as "Note that ..."
+TRAILER = regex.compile(r"^\W*(word count|note|disclaimer|references)\s*(?:[:*]|$)", regex.IGNORECASE)
+# The lines that can end a summary
+END_MARKERS = (MARKDOWN_HEADING, BOLD_HEADING, NUMBERED_HEADING, HORIZONTAL_RULE, TRAILER)
+
+
+def parse_heading(line: str):
+    """
+    Returns (level, title) for a markdown, bold-only or numbered heading line,
+    or None. Bold and numbered headings get level 7, below every '#' level.
+    The title is lowercased and stripped of markup and a trailing colon.
+    """
+    match = MARKDOWN_HEADING.match(line)
+    if match:
+        level, title = len(match.group(1)), match.group(2)
+    else:
+        match = BOLD_HEADING.match(line) or NUMBERED_HEADING.match(line)
+        if not match:
+            return None
+        level, title = 7, match.group(1)
+    title = title.replace("*", "").strip().rstrip(":").strip().lower()
+    return level, title
+
+
+def may_be_end_marker(line: str) -> bool:
+    """Whether a line starting with `line` (stripped) could be a heading, horizontal rule or closing note."""
+    return any(pattern.match(line, partial=True) for pattern in END_MARKERS)
+
+
+def section_index(title: str):
+    """Index in PLS_SECTIONS of a heading title such as 'Results' or '4. Results: what we found'."""
+    title = NUMBERED_HEADING.sub(r"\1", title).split(":")[0].strip()
+    return PLS_SECTIONS.index(title) if title in PLS_SECTIONS else None
+
+
+class PlsStoppingCriteria(StoppingCriteria):
+    """
+    Ends a PLS generation once it has nothing left to say:
+
+    - "results_complete": the Results section has at least `results_min_words`
+      words and a new section starts (a heading at Results' level or above, a
+      repeated PLS section, a horizontal rule or a closing note such as
+      "Word count: ...").
+    - "word_budget": the finished lines reached `word_budget` words.
+    - "repetition": the last tokens are one short span repeated, or a line
+      was written `max_line_repeats` times.
+
+    The generated tokens are followed line by line: a line is decoded once,
+    when a token with a newline ends it. After a stop, `keep_tokens` is how many generated
+    tokens belong in the summary (the start of the heading or of the repeated
+    span is dropped), or None to keep them all. Before that, final_tokens()
+    is how many whole lines no later stop can drop, and stable_tokens() how
+    many tokens. Works for one sequence; the batching scheduler gives each
+    job its own instance.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, word_budget: int = 900, results_min_words: int = 30,
+                 max_period: int = 64, min_repeat_tokens: int = 32, max_line_repeats: int = 3):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.word_budget = word_budget
+        self.results_min_words = results_min_words
+        self.max_period = max_period
+        self.min_repeat_tokens = min_repeat_tokens
+        self.max_line_repeats = max_line_repeats
+
+        self.ids = []
+        self.pieces = {}
+        self.line_start = 0
+        self.words = 0
+        self.section = -1
+        self.results_level = None
+        self.results_words = 0
+        self.line_counts = {}
+        self.reason = None
+        self.keep_tokens = None
+        # For each period p, how many of the last tokens equal the token p before them
+        self.repeat_runs = [0] * (max_period + 1)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.reason is None:
+            self.reason = self.update(input_ids[0, self.prompt_length + len(self.ids):].tolist())
+        return torch.full((input_ids.shape[0],), self.reason is not None, dtype=torch.bool, device=input_ids.device)
+
+    def update(self, new_ids):
+        """Follows newly generated tokens; returns the stop reason or None."""
+        for token_id in new_ids:
+            self.ids.append(token_id)
+            self.track_repeats()
+            if "\n" in self.piece(token_id):
+                reason = self.end_line()
+                if reason:
+                    return reason
+
+        if self.words >= self.word_budget:
+            return "word_budget"
+        return self.check_repeating_tokens() if self.ids else None
+
+    def track_repeats(self):
+        ids, runs = self.ids, self.repeat_runs
+        last = len(ids) - 1
+        for period in range(1, min(self.max_period, last) + 1):
+            runs[period] = runs[period] + 1 if ids[last - period] == ids[last] else 0
+
+    def final_tokens(self) -> int:
+        """
+        How many generated tokens no later stop can drop: those before the
+        current line, which a heading, closing note or repeated line would
+        drop, and before the span that is still repeating with some period,
+        which the repetition check would drop from its second period on.
+        """
+        return min(self.line_start, len(self.ids) - max(self.repeat_runs))
+
+    def stable_tokens(self) -> int:
+        """
+        Like final_tokens(), but with the current line too once its start
+        rules out the stops that would drop it: a heading, rule or closing
+        note ending the summary, or a line written too often. After a stop,
+        the tokens it keeps.
+        """
+        if self.reason is not None:
+            return len(self.ids) if self.keep_tokens is None else self.keep_tokens
+        line = self.current_line().strip()
+        if not line or self.may_end_summary(line) or self.may_repeat_line(line):
+            return self.final_tokens()
+        return len(self.ids) - max(self.repeat_runs)
+
+    def may_end_summary(self, line: str) -> bool:
+        """Whether end_of_summary could stop at a line that starts with `line`."""
+        results_done = self.results_level is not None and self.results_words >= self.results_min_words
+        return results_done and may_be_end_marker(line)
+
+    def may_repeat_line(self, line: str) -> bool:
+        """Whether a line that starts with `line` could be one repeated_line stops at."""
+        return any(count + 1 >= self.max_line_repeats and seen.startswith(line)
+                   for seen, count in self.line_counts.items())
+
+    def piece(self, token_id) -> str:
+        piece = self.pieces.get(token_id)
+        if piece is None:
+            piece = self.pieces[token_id] = self.tokenizer.decode([token_id])
+        return piece
+
+    def current_line(self) -> str:
+        """Text of the line that starts at token `line_start`, up to the last token."""
+        text = self.tokenizer.decode(self.ids[self.line_start:], skip_special_tokens=True)
+        if self.line_start and self.line_start < len(self.ids):
+            # The first token may hold the end of the previous line
+            first = self.piece(self.ids[self.line_start])
+            text = text[first.rfind("\n") + 1:]
+        return text
+
+    def end_line(self) -> str:
+        """Handles the lines completed by the last token."""
+        lines = self.current_line().split("\n")
+        line_start = self.line_start
+        last = len(self.ids) - 1
+        # The next line starts inside the last token if it has text after its newline
+        self.line_start = last if lines[-1].strip() else last + 1
+
+        for line in lines[:-1]:
+            reason = self.end_of_summary(line.strip())
+            if reason:
+                # Drop the heading, but keep the token that ended the previous
+                # line when it also carries the heading's start
+                keep = line_start
+                if line_start and "\n" in self.piece(self.ids[line_start]):
+                    keep += 1
+                self.keep_tokens = keep
+                return reason
+            self.words += len(line.split())
+            line_start = last
+        return None
+
+    def end_of_summary(self, line: str):
+        if not line:
+            return None
+        heading = parse_heading(line)
+        results_done = self.results_level is not None and self.results_words >= self.results_min_words
+
+        if results_done and (HORIZONTAL_RULE.match(line) or TRAILER.match(line)):
+            return "results_complete"
+        if heading is not None:
+            level, title = heading
+            index = section_index(title)
+            if results_done and (index is not None or level <= self.results_level):
+                return "results_complete"
+            if index is not None:
+                self.section = index
+                if PLS_SECTIONS[index] == "results":
+                    self.results_level = min(level, 2)
+                return None
+
+        if self.results_level is not None:
+            self.results_words += len(line.split())
+        return self.repeated_line(line)
+
+    def repeated_line(self, line: str):
+        """"repetition" once a line of four or more words was written `max_line_repeats` times."""
+        if len(line.split()) >= 4:
+            count = self.line_counts[line] = self.line_counts.get(line, 0) + 1
+            if count >= self.max_line_repeats:
+                return "repetition"
+        return None
+
+    def check_repeating_tokens(self):
+        """
+        Stops when the tail is a span of up to `max_period` tokens repeated at
+        least three times and over at least `min_repeat_tokens` tokens.
+        """
+        ids = self.ids
+        last = ids[-1]
+        window = ids[-self.max_period - 1:-1]
+        # A tail with period p repeats its last token p tokens earlier;
+        # the shortest period keeps the most text
+        periods = [len(window) - i for i, token_id in enumerate(window) if token_id == last]
+        for period in reversed(periods):
+            repeats = max(3, -(-self.min_repeat_tokens // period))
+            length = period * repeats
+            if length > len(ids):
+                continue
+            tail = ids[-length:]
+            if tail[period:] == tail[:-period]:
+                self.keep_tokens = len(ids) - length + period
+                return "repetition"
+        return None
+
+
+class SectionStoppingCriteria(PlsStoppingCriteria):
+    """
+    Ends one section of a section-parallel PLS generation, which starts
+    right after the section's heading: "section_complete" once the section
+    has text and a heading, horizontal rule or closing note starts, plus
+    the word budget and repetition checks of PlsStoppingCriteria.
+    `keep_tokens` then leaves out the line that ended the section.
+    """
+
+    def end_of_summary(self, line: str):
+        if not line:
+            return None
+        if self.words and (parse_heading(line) is not None or HORIZONTAL_RULE.match(line) or TRAILER.match(line)):
+            return "section_complete"
+        return self.repeated_line(line)
+
+    def may_end_summary(self, line: str) -> bool:
+        return bool(self.words) and may_be_end_marker(line)
+
+
+class StableTextStreamer(StoppingCriteria):
+    """
+    Never stops the generation; pushes its text to `streamer` (a
+    TextIteratorStreamer) word by word, as TextIteratorStreamer does, but
+    only up to `pls_stopper.stable_tokens()`: a line that may still turn out
+    to be a heading, closing note or repeat, and a span that is still
+    repeating, wait until the stop is decided. Trailing whitespace waits for
+    the next word, since the PLS is stripped. finish() sends the rest of the
+    returned PLS and ends the stream, so the chunks add up to exactly that PLS.
+    """
+
+    def __init__(self, tokenizer, streamer, pls_stopper: PlsStoppingCriteria):
+        self.tokenizer = tokenizer
+        self.streamer = streamer
+        self.pls_stopper = pls_stopper
+        self.scanned = 0
+        self.words_end = 0
+        self.sent = ""
+
+    def __call__(self, input_ids, scores, **kwargs):
+        ids, stable = self.pls_stopper.ids, self.pls_stopper.stable_tokens()
+        # Only decoded again when a word was finished
+        words_end = self.words_end
+        for i in range(self.scanned, stable):
+            if any(ch.isspace() for ch in self.pls_stopper.piece(ids[i])):
+                words_end = i + 1
+        self.scanned = max(self.scanned, stable)
+        if words_end > self.words_end:
+            self.words_end = words_end
+            text = self.tokenizer.decode(ids[:words_end], skip_special_tokens=True)
+            # The last word may go on in the next tokens
+            last_space = max(text.rfind(ch) for ch in " \n\t")
+            if last_space > 0:
+                self.push(text[:last_space].rstrip())
+        return torch.full((input_ids.shape[0],), False, dtype=torch.bool, device=input_ids.device)
+
+    def push(self, text: str):
+        """Sends `text` past what was already sent, which it extends."""
+        if len(text) > len(self.sent) and text.startswith(self.sent):
+            self.streamer.on_finalized_text(text[len(self.sent):])
+            self.sent = text
+
+    def finish(self, text: str):
+        """Sends the rest of the returned PLS `text` and ends the stream."""
+        if not text.startswith(self.sent):
+            log_event("stream_mismatch", level=logging.ERROR, sent_chars=len(self.sent), pls_chars=len(text))
+        self.push(text)
+        self.streamer.end()
+
+
+class CancellationCriteria(StoppingCriteria):
+    """
+    Stops a generation once its Cancellation fires: the client disconnected or
+    the deadline passed. `reason` is then the cancel reason.
+    """
+
+    def __init__(self, cancellation):
+        self.cancellation = cancellation
+        self.reason = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.reason is None:
+            self.reason = self.cancellation.reason()
+        return torch.full((input_ids.shape[0],), self.reason is not None, dtype=torch.bool, device=input_ids.device)
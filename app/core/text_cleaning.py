@@ -1,24 +1,50 @@
 import re
 import unicodedata
 
+# Control characters (Unicode category C) of ASCII, for str.translate
+ASCII_CONTROL_CHARACTERS = {code: None for code in range(128) if unicodedata.category(chr(code))[0] == "C"}
+# Everything but printable ASCII: the only characters that can be in category C
+NOT_PRINTABLE_ASCII = re.compile(r"[^ -~]")
+
+
 def clean_text(text):
     if not isinstance(text, str):
         return ""
 
-    # 1. Unicode Normalization (NFKC)
-    # This converts "fancy" characters to their standard equivalents.
-    # Example: It turns the special hyphen '‐' (U+2010) into a standard '-' (U+002D).
-    text = unicodedata.normalize('NFKC', text)
+    if text.isascii():
+        # ASCII is already NFKC normalized and its control characters are known
+        text = text.translate(ASCII_CONTROL_CHARACTERS)
+    else:
+        # 1. Unicode Normalization (NFKC)
+        # This converts "fancy" characters to their standard equivalents.
+        # Example: It turns the special hyphen '‐' (U+2010) into a standard '-' (U+002D).
+        if not unicodedata.is_normalized('NFKC', text):
+            text = unicodedata.normalize('NFKC', text)
 
-    # 2. Remove non-printable control characters (if any exist)
-    # This creates a translation table to map control characters to None
-    text = "".join(ch for ch in text if unicodedata.category(ch)[0] != "C")
+        # 2. Remove non-printable control characters (if any exist)
+        # Only the distinct characters outside printable ASCII are looked up,
+        # instead of the category of every character.
+        for ch in set(NOT_PRINTABLE_ASCII.findall(text)):
+            if unicodedata.category(ch)[0] == "C":
+                text = text.replace(ch, "")
 
     # 3. Collapse Whitespace
-    # Replaces newlines, tabs, and multiple spaces with a single space.
-    text = re.sub(r'\s+', ' ', text)
+    # Newlines and tabs were removed above as control characters. str.split()
+    # splits on the same whitespace as the regex \s.
+    text = " ".join(text.split())
 
     # 4. Remove single and double quotes
-    text = re.sub(r'["\']', '', text)
+    # After the collapse, so "a ' b" keeps two spaces as before.
+    return text.replace('"', '').replace("'", '').strip()
+
+
+def clean_texts(texts):
+    """
+    Lazily cleans an iterable of texts, so a large CSV column can be streamed:
 
-    return text.strip()
+        with open(path, newline="", encoding="utf-8") as f:
+            for text in clean_texts(row["original_text"] for row in csv.DictReader(f)):
+                ...
+    """
+    for text in texts:
+        yield clean_text(text)
@@ -1,42 +1,97 @@
 import uvicorn
+import asyncio
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from core.model_loader import load_ai_model, generate_pls_from_model, download_from_s3
-from core.class_model import GenerateRequest, GenerateResponse, AllScores
-from core.scoring import get_scores
-from core.classifier_model import classify_text, load_classifier_model
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.background import BackgroundTask
+from core.class_model import (
+    GenerateRequest, GenerateResponse, AllScores, ClassifyRequest, ClassifyResponse, Classification,
+    BatchItem, BatchItemResult
+)
+from core.scoring import get_scores, ReadabilityAccumulator
 from core.prompt_template import PROMPT_TEMPLATE
-from core.secret_manager import get_secret
 from core.text_cleaning import clean_text
-from huggingface_hub import login
+from core.inference_executor import InferenceExecutor
+from core.result_cache import ResultCache, StreamClaim, make_cache_key
+from core.startup import ModelStartup
+from core.cancellation import Cancellation, GenerationCancelled
+from core.model_server import ModelClient, model_loading_steps
+from core.model_registry import load_model_specs
+from core.metrics import (
+    STAGE_SECONDS, QUEUE_DEPTH, ResultCacheCollector, RequestMetricsMiddleware, log_event, log_sampled
+)
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from pydantic import ValidationError
 
 # Load model and secrets
 model_name = "Llama-3.2-3B-Instruct"
 model_path = "meta-llama/Llama-3.2-3B-Instruct"
 model_source = os.environ.get('MODEL_SOURCE')
 
-if model_source == 's3':
-    print("Downloading model from S3...")
-    download_from_s3()
-elif model_source == 'huggingface':
-    print("Logging in to HuggingFace...")
-    hf_token_source = os.environ.get('HF_TOKEN_SOURCE')
-    if hf_token_source == 'aws':        
-        hf_token =  get_secret('huggingface_token')
-        login(token=hf_token)
-    elif hf_token_source == 'local':
-        login()
-    else:
-        raise HTTPException(status_code=511, detail="HF_TOKEN source not provided")
-
 if os.environ.get('MODEL_PATH'):
     model_name = os.environ.get('MODEL_NAME')
     model_path = os.environ.get('MODEL_PATH')
 
+# The models requests may ask for, by name; MODEL_REGISTRY lists several
+model_specs, default_model_name = load_model_specs(model_name, model_path, model_source)
+
+
+# With MODEL_SERVER_SOCKET the models live in a separate model server process
+# (see serve.py) shared by every API worker, and calls are forwarded to it.
+# Otherwise they load in the background of this process so the server answers
+# /health/live right away. Workers of a model server never import torch.
+model_server_socket = os.environ.get('MODEL_SERVER_SOCKET')
+if model_server_socket:
+    model_client = ModelClient(model_server_socket)
+    model_startup = model_client
+    classify_text, classify_texts = model_client.classify_text, model_client.classify_texts
+    generate_pls_from_model = model_client.generate_pls_from_model
+    stream_pls_from_model = model_client.stream_pls_from_model
+    generation_config_for = model_client.generation_config_for
+    list_models, preload_model = model_client.list_models, model_client.preload_model
+else:
+    from core.model_loader import (
+        generate_pls_from_model, stream_pls_from_model, generation_config_for, track_scheduler_queue,
+        list_models, preload_model
+    )
+    from core.classifier_model import classify_text, classify_texts
+
+    model_startup = ModelStartup()
+    model_startup.start(model_loading_steps(model_specs, default_model_name))
+    track_scheduler_queue()
+
+# Blocking inference runs here, never on the event loop
+inference_executor = InferenceExecutor(
+    max_concurrency=int(os.environ.get('INFERENCE_MAX_CONCURRENCY', os.environ.get('BATCH_MAX_SIZE', '1'))),
+    max_queue=int(os.environ.get('INFERENCE_MAX_QUEUE', '16')),
+    queue_timeout=float(os.environ.get('INFERENCE_QUEUE_TIMEOUT', '120')),
+    retry_after=int(os.environ.get('INFERENCE_RETRY_AFTER', '30')),
+)
+
+# Readability of the abstracts, scored while their PLS is generated. Scoring
+# holds the GIL, so more threads would not make it faster.
+scoring_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scoring")
 
-load_ai_model(model_path)
-load_classifier_model()
+# Finished results keyed by abstract, model, template and generation config
+result_cache = None
+if os.environ.get('RESULT_CACHE', '1') == '1':
+    result_cache = ResultCache(
+        path=os.environ.get('RESULT_CACHE_PATH', './cache/results.sqlite'),
+        memory_items=int(os.environ.get('RESULT_CACHE_MEMORY_ITEMS', '256')),
+        max_disk_bytes=int(float(os.environ.get('RESULT_CACHE_MAX_MB', '256')) * 1024 * 1024),
+    )
+    REGISTRY.register(ResultCacheCollector(result_cache))
+
+# How often a request waiting for its PLS checks whether the client is still there
+DISCONNECT_POLL_SECONDS = float(os.environ.get('DISCONNECT_POLL_MS', '250')) / 1000
+
+# Queue depths are read when /metrics is scraped
+QUEUE_DEPTH.labels("inference").set_function(inference_executor.pending)
 
 # --- 1. Initialize App and Models ---
 
@@ -50,76 +105,247 @@ app.add_middleware(
     allow_methods=["*"],     # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],     # Allow all headers in the request
 )
+app.add_middleware(
+    RequestMetricsMiddleware,
+    paths=["/generate_pls", "/generate_pls/stream", "/generate_pls/batch", "/classify"],
+)
 
-# --- 6. API Endpoint ---
+# --- 5. Request Helpers ---
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
+def require_models():
+    """Raises 503 while the models are still loading and 500 if loading failed."""
+    if model_startup.ready():
+        return
+    if model_startup.failed():
+        raise HTTPException(status_code=500, detail="Model loading failed. See /health/ready.")
+    raise HTTPException(
+        status_code=503,
+        detail="Models are still loading.",
+        headers={"Retry-After": os.environ.get('STARTUP_RETRY_AFTER', '10')}
+    )
 
-@app.get("/get_model_name",
-         response_model=str)
-async def get_model_name():
-    return model_name
 
+def resolve_model(name: str = None) -> str:
+    """The registered model a request asked for, or the default one; 404 for an unknown name."""
+    if name is None:
+        return default_model_name
+    if name not in model_specs:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'. Use one of {', '.join(model_specs)}.")
+    return name
 
-@app.post("/generate_pls", 
-          response_model=GenerateResponse)
-async def generate_pls(request: GenerateRequest):
+
+def prepare_abstract(text: str) -> str:
     """
-    Generates a Plain Language Summary (PLS) from an abstract and evaluates it.
+    Validates, cleans and classifies the input text. Raises 400 for empty input
+    and 422 when the text is already a PLS.
     """
-    try:
-        print("Init Generating PLS...")
-        abstract_text = request.text
-        if not abstract_text.strip():
-            raise HTTPException(status_code=400, detail="Input text cannot be empty.")
-        
-        # --- Step 0: Clean text ---
-        abstract_text = clean_text(abstract_text)
-        
-        # --- Step 1: Classify Text ---
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Input text cannot be empty.")
+
+    with STAGE_SECONDS.labels("clean_text").time():
+        abstract_text = clean_text(text)
+
+    with STAGE_SECONDS.labels("classify_text").time():
         pred, prob = classify_text(abstract_text)
-        print("Text classification: ", pred, " Probability of class 1 (PLS): ", prob)
-        if pred == 'PLS':
-            raise HTTPException(status_code=422, detail="Input text is PLS already.")
-
-        
-        # --- Step 2: Generate PLS (Simulated) ---
-        
-        
-        # Generate PLS
-        print("Generating PLS with real Llama 3.2 3B model...")
-        generated_pls = generate_pls_from_model(abstract_text, PROMPT_TEMPLATE)
-        print("PLS generated successfully.")
-        print(f"PLS: {generated_pls}")
-
-        # --- Step 3: Calculate Scores ---
-                
-        # Readability
-        original_scores = get_scores(abstract_text)
-        generated_scores = get_scores(generated_pls)
-        
-        
-        # --- Step 4: Bundle Scores ---
+    log_sampled("classification", label=pred, pls_probability=round(prob, 4))
+    if pred == 'PLS':
+        raise HTTPException(status_code=422, detail="Input text is PLS already.")
+
+    return abstract_text
+
+
+def cancelled_error(e: GenerationCancelled) -> HTTPException:
+    """
+    504 when the deadline passed before the PLS was generated; 499 (client
+    closed request) when the client is gone, only seen in metrics and logs.
+    """
+    if e.reason == "deadline":
+        return HTTPException(status_code=504, detail="The deadline passed before the PLS could be generated.")
+    return HTTPException(status_code=499, detail="The client closed the request.")
+
+
+async def watch_disconnect(http_request: Request, cancellation: Cancellation):
+    """Cancels the generation once the client disconnects; runs until the task is cancelled."""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+    cancellation.cancel("disconnected")
+
+
+async def cancel_on_disconnect(http_request: Request, events, cancellation: Cancellation):
+    """
+    Streams a blocking event iterator, cancelling the generation behind it if
+    the client disconnects. Starlette only stops reading the body at the next
+    event, which may be many tokens away, so the connection is also watched.
+    """
+    watcher = asyncio.ensure_future(watch_disconnect(http_request, cancellation))
+    finished = False
+    try:
+        async for event in iterate_in_threadpool(events):
+            yield event
+        finished = True
+    finally:
+        watcher.cancel()
+        if not finished:
+            cancellation.cancel("disconnected")
+
+
+def sse_event(event: str, data) -> str:
+    """Formats a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def pls_cache_key(abstract_text: str, model: str = None):
+    """
+    Result cache key for a cleaned abstract and model, or None when the cache
+    is disabled. Loads the model if it is not resident.
+    """
+    if result_cache is None:
+        return None
+    return make_cache_key(abstract_text, resolve_model(model), PROMPT_TEMPLATE, generation_config_for(model))
+
+
+def score_abstract(abstract_text: str):
+    """Starts scoring the abstract in the background, to overlap with its generation; returns a Future."""
+    return scoring_executor.submit(get_scores, abstract_text)
+
+
+def score_pls(abstract_text: str, generated_pls: str, cancellation=None, original=None, generated=None) -> dict:
+    """
+    Readability of both texts, bundled with the PLS as stored in the result
+    cache. `original` may be the Future from score_abstract and `generated` a
+    ReadabilityAccumulator fed with the PLS as it was decoded; otherwise the
+    text is scored here. A PLS cut short by its deadline is marked
+    `truncated` and never cached.
+    """
+    with STAGE_SECONDS.labels("get_scores").time():
         all_scores = AllScores(
-            original=original_scores,
-            generated=generated_scores
+            original=original.result() if original is not None else get_scores(abstract_text),
+            generated=generated.scores() if generated is not None else get_scores(generated_pls)
         )
+    result = {"pls": generated_pls, "scores": all_scores.model_dump()}
+    if cancellation is not None and cancellation.truncated:
+        result["truncated"] = True
+    return result
+
+
+def pls_event_stream(abstract_text: str, pls_chunks, claim=None, cancellation=None, original=None):
+    """
+    Yields `token` events while the PLS is decoded, then a `scores` event with
+    the readability AllScores and a final `done` event, which says whether the
+    deadline truncated the PLS. The PLS is scored chunk by chunk as it streams,
+    and `original` is the Future of the abstract's scores, if already started.
+    With a StreamClaim `claim`, the result goes to the result cache and to the
+    identical requests waiting for it, or, when this request waited for an
+    identical one, its result is replayed.
+    """
+    try:
+        chunks = []
+        generated = ReadabilityAccumulator()
+        for chunk in pls_chunks:
+            chunks.append(chunk)
+            yield sse_event("token", {"text": chunk})
+            # Once the chunk is on its way to the client
+            generated.add(chunk)
+
+        if claim is not None and claim.value is not None:
+            yield from cached_event_stream(claim.value)
+            return
+
+        result = score_pls(abstract_text, "".join(chunks), cancellation, original, generated)
+        truncated = result.get("truncated", False)
+        if claim is not None:
+            claim.release(None if truncated else result)
+        yield sse_event("scores", result["scores"])
+        yield sse_event("done", {"status": "ok", "truncated": truncated})
 
-        # --- Step 5: Return Success Response ---
+    except GenerationCancelled as e:
+        if claim is not None:
+            claim.release(error=e)
+        error = cancelled_error(e)
+        yield sse_event("error", {"status": error.status_code, "detail": error.detail})
+    except Exception as e:
+        if claim is not None:
+            claim.release(error=e)
+        # Headers are already sent, so errors are reported as an event with the status they would have had
+        log_event("stream_error", level=logging.ERROR, error=str(e))
+        if isinstance(e, HTTPException):
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        else:
+            yield sse_event("error", {"status": 500, "detail": f"An internal error occurred: {e}"})
+
+
+def cached_event_stream(result: dict):
+    """Replays a cached result as a single `token` event followed by its scores."""
+    yield sse_event("token", {"text": result["pls"]})
+    yield sse_event("scores", result["scores"])
+    yield sse_event("done", {"status": "ok", "truncated": False})
+
+
+def generate_and_score(abstract_text: str, cancellation=None, model: str = None) -> dict:
+    """Generates the PLS for a cleaned abstract and scores both texts."""
+    original = score_abstract(abstract_text)
+    generated_pls = generate_pls_from_model(abstract_text, PROMPT_TEMPLATE, cancellation=cancellation,
+                                            model_name=model)
+    log_sampled("pls_generated", abstract_chars=len(abstract_text), pls_chars=len(generated_pls))
+
+    return score_pls(abstract_text, generated_pls, cancellation, original)
+
+
+def generate_cached(abstract_text: str, cancellation=None, model: str = None) -> dict:
+    """
+    generate_and_score through the result cache: identical abstracts are served
+    from it, and concurrent duplicates wait for the generation already running.
+    """
+    cache_key = pls_cache_key(abstract_text, model)
+    if cache_key is None:
+        return generate_and_score(abstract_text, cancellation, model)
+    return result_cache.get_or_compute(
+        cache_key,
+        lambda: generate_and_score(abstract_text, cancellation, model),
+        keep=lambda result: not result.get("truncated"),
+        cancellation=cancellation
+    )
+
+
+def prepare_stream(text: str, model: str = None):
+    """
+    prepare_abstract plus the result cache lookup for /generate_pls/stream:
+    (abstract, cache key, cached result or None). Runs in the executor since
+    the key needs the model, which may have to be loaded first. On a miss
+    the stream's StreamClaim looks again, and counts the lookup.
+    """
+    abstract_text = prepare_abstract(text)
+    cache_key = pls_cache_key(abstract_text, model)
+    return abstract_text, cache_key, result_cache.get(cache_key, count_miss=False) if cache_key is not None else None
+
+
+def run_pls_pipeline(text: str, cancellation=None, model: str = None) -> GenerateResponse:
+    """
+    Blocking pipeline behind /generate_pls: clean, classify, generate and score.
+    """
+    try:
+        # --- Step 0 and 1: Clean and classify text ---
+        abstract_text = prepare_abstract(text)
+
+        # --- Step 2 and 3: Generate PLS and calculate scores ---
+        result = generate_cached(abstract_text, cancellation, model)
+
+        # --- Step 4: Return Success Response ---
         return GenerateResponse(
             status="ok",
-            pls=generated_pls,
-            scores=all_scores
+            pls=result["pls"],
+            scores=result["scores"],
+            truncated=result.get("truncated", False)
         )
 
     except HTTPException as http_e:
         # Re-raise HTTP exceptions (like 400 bad request)
         raise http_e
+    except GenerationCancelled as e:
+        raise cancelled_error(e)
     except Exception as e:
         # Catch any other server-side errors
-        print(f"An internal server error occurred: {e}")
+        log_event("pipeline_error", level=logging.ERROR, error=str(e))
         # Return a structured error response
         raise HTTPException(
             status_code=500, 
@@ -127,6 +353,292 @@ async def generate_pls(request: GenerateRequest):
         )
 
 
+def parse_batch_items(body: bytes, content_type: str) -> list:
+    """
+    Reads the items of a /generate_pls/batch request: a JSON list (or an
+    object with an "items" list) or NDJSON, one item per line. An item is an
+    abstract string or an object with `text` and an optional `id`.
+    Returns dicts with `index`, `id` and either a BatchItem or an `error`;
+    only an unreadable JSON body fails the whole request.
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        values = []
+        for line in body.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                values.append(json.loads(line))
+            except ValueError as e:
+                values.append(ValueError(f"Invalid JSON line: {e}"))
+    else:
+        try:
+            values = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if isinstance(values, dict):
+            values = values.get("items")
+        if not isinstance(values, list):
+            raise HTTPException(status_code=400, detail='Expected a list of items or {"items": [...]}.')
+
+    items = []
+    for index, value in enumerate(values):
+        item = {"index": index, "id": str(index)}
+        try:
+            if isinstance(value, Exception):
+                raise value
+            item["item"] = BatchItem(text=value) if isinstance(value, str) else BatchItem.model_validate(value)
+            if item["item"].id is not None:
+                item["id"] = item["item"].id
+        except ValidationError as e:
+            item["error"] = "; ".join(
+                ".".join(str(part) for part in error["loc"]) + ": " + error["msg"] if error["loc"] else error["msg"]
+                for error in e.errors()
+            )
+        except ValueError as e:
+            item["error"] = str(e)
+        items.append(item)
+    return items
+
+
+def batch_line(item: dict, status: int, **fields) -> str:
+    result = BatchItemResult(index=item["index"], id=item["id"], status=status, **fields)
+    return result.model_dump_json(exclude_none=True) + "\n"
+
+
+async def batch_result_stream(items: list):
+    """
+    Yields one NDJSON line per item as soon as it is done: invalid and empty
+    items first, then the items classified as PLS (422), then the generated
+    PLS in completion order. Cleaning and classification run over the whole
+    batch; generation keeps up to INFERENCE_MAX_CONCURRENCY items in flight
+    so the batching scheduler sees full batches.
+    """
+    valid = []
+    for item in items:
+        if "error" in item:
+            yield batch_line(item, 400, detail=f"Invalid item: {item['error']}")
+        elif not item["item"].text.strip():
+            yield batch_line(item, 400, detail="Input text cannot be empty.")
+        else:
+            valid.append(item)
+    if not valid:
+        return
+
+    def clean_and_classify():
+        with STAGE_SECONDS.labels("clean_text").time():
+            texts = [clean_text(item["item"].text) for item in valid]
+        with STAGE_SECONDS.labels("classify_text").time():
+            return texts, classify_texts(texts)
+
+    try:
+        texts, classes = await run_in_threadpool(clean_and_classify)
+    except Exception as e:
+        log_event("batch_error", level=logging.ERROR, error=str(e))
+        for item in valid:
+            yield batch_line(item, 500, detail=f"An internal error occurred: {e}")
+        return
+
+    to_generate = []
+    for item, abstract_text, (pred, prob) in zip(valid, texts, classes):
+        if pred == 'PLS':
+            yield batch_line(item, 422, detail="Input text is PLS already.")
+        else:
+            to_generate.append((item, abstract_text))
+
+    async def generate_item(item, abstract_text, cancellation):
+        try:
+            result = await inference_executor.run(generate_cached, abstract_text, cancellation, item["item"].model)
+            return batch_line(item, 200, pls=result["pls"], scores=result["scores"])
+        except HTTPException as e:
+            return batch_line(item, e.status_code, detail=e.detail)
+        except GenerationCancelled as e:
+            error = cancelled_error(e)
+            return batch_line(item, error.status_code, detail=error.detail)
+        except Exception as e:
+            log_event("pipeline_error", level=logging.ERROR, error=str(e), batch_item=item["id"])
+            return batch_line(item, 500, detail=f"An internal error occurred: {e}")
+
+    cancellations = {}
+
+    def start(pair):
+        cancellation = Cancellation()
+        task = asyncio.ensure_future(generate_item(*pair, cancellation))
+        cancellations[task] = cancellation
+        return task
+
+    queue = iter(to_generate)
+    window = max(1, inference_executor.max_concurrency)
+    running = {start(pair) for _, pair in zip(range(window), queue)}
+    try:
+        while running:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                cancellations.pop(task)
+                yield task.result()
+                pair = next(queue, None)
+                if pair is not None:
+                    running.add(start(pair))
+    finally:
+        # The client went away: running generations stop within a token and
+        # items not yet handed to the executor are dropped
+        for task in running:
+            cancellations[task].cancel("disconnected")
+            task.cancel()
+
+
+# --- 6. API Endpoint ---
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok"}
+
+@app.get("/health/live")
+async def health_live():
+    """The process is up and serving requests, whether or not the models are loaded."""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """
+    200 once every model is loaded, 503 while loading or after a failure.
+    Reports the state and load time of each model and the cold start time.
+    """
+    status = model_startup.status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/get_model_name",
+         response_model=str)
+async def get_model_name():
+    """The default model, used by requests that do not name one."""
+    return default_model_name
+
+
+@app.get("/models")
+async def models():
+    """
+    The registered models: whether each is loaded, loading, failed or not
+    loaded, its memory and how long it has been idle, plus the default model
+    and the MODEL_MEMORY_BUDGET_MB budget.
+    """
+    return await run_in_threadpool(list_models)
+
+
+@app.post("/models/{name}/load")
+async def load_model(name: str):
+    """
+    Loads a model in the background, so traffic can be moved to it once
+    GET /models reports it loaded. 202 while it loads, 200 if it already was.
+    """
+    resolve_model(name)
+    status = await run_in_threadpool(preload_model, name)
+    return JSONResponse(status, status_code=200 if status["state"] == "loaded" else 202)
+
+
+@app.post("/generate_pls", 
+          response_model=GenerateResponse)
+async def generate_pls(request: GenerateRequest, http_request: Request):
+    """
+    Generates a Plain Language Summary (PLS) from an abstract and evaluates it.
+    The generation stops if the client disconnects, and returns what it has
+    when `max_latency_seconds` runs out.
+    """
+    require_models()
+    resolve_model(request.model)
+    cancellation = Cancellation.with_max_latency(request.max_latency_seconds)
+    watcher = asyncio.ensure_future(watch_disconnect(http_request, cancellation))
+    try:
+        return await inference_executor.run(run_pls_pipeline, request.text, cancellation, request.model)
+    finally:
+        watcher.cancel()
+
+
+@app.post("/generate_pls/stream")
+async def generate_pls_stream(request: GenerateRequest, http_request: Request):
+    """
+    Streaming variant of /generate_pls. Validation, classification and admission
+    errors are returned as regular HTTP errors before the event stream starts.
+    """
+    require_models()
+    resolve_model(request.model)
+    cancellation = Cancellation.with_max_latency(request.max_latency_seconds)
+    abstract_text, cache_key, cached = await inference_executor.run(prepare_stream, request.text, request.model)
+
+    claim = None
+    if cached is not None:
+        events = cached_event_stream(cached)
+    else:
+        # Identical requests in flight share one generation, as in generate_cached
+        if cache_key is not None:
+            claim = StreamClaim(result_cache, cache_key, inference_executor.submit, cancellation)
+        original = score_abstract(abstract_text)
+        pls_chunks = stream_pls_from_model(
+            abstract_text, PROMPT_TEMPLATE, submit=claim.submit if claim else inference_executor.submit,
+            cancellation=cancellation, model_name=request.model
+        )
+        events = cancel_on_disconnect(
+            http_request, pls_event_stream(abstract_text, pls_chunks, claim, cancellation, original), cancellation
+        )
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(claim.release_when_done) if claim else None
+    )
+
+
+@app.post("/generate_pls/batch")
+async def generate_pls_batch(request: Request):
+    """
+    Generates the PLS of many abstracts. The body is a JSON list of items (or
+    {"items": [...]}) or NDJSON with one item per line, where an item is a
+    string or {"id": ..., "text": ...}. The response is NDJSON with one
+    BatchItemResult per item, written as each item finishes, so one failing
+    item does not fail the batch.
+    """
+    require_models()
+    items = parse_batch_items(await request.body(), request.headers.get("content-type", ""))
+    max_items = int(os.environ.get('BATCH_MAX_ITEMS', '256'))
+    if len(items) > max_items:
+        raise HTTPException(status_code=413, detail=f"At most {max_items} items per request.")
+    log_sampled("batch_request", items=len(items))
+
+    return StreamingResponse(
+        batch_result_stream(items),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/classify",
+          response_model=ClassifyResponse)
+async def classify(request: ClassifyRequest):
+    """
+    Classifies many texts as PLS or technical in padded batches.
+    """
+    require_models()
+    max_texts = int(os.environ.get('CLASSIFY_MAX_TEXTS', '1000'))
+    if len(request.texts) > max_texts:
+        raise HTTPException(status_code=413, detail=f"At most {max_texts} texts per request.")
+
+    def clean_and_classify():
+        with STAGE_SECONDS.labels("clean_text").time():
+            texts = [clean_text(text) for text in request.texts]
+        return classify_texts(texts)
+
+    # Runs on the default threadpool so it neither blocks the event loop nor
+    # competes with generation slots
+    results = await run_in_threadpool(clean_and_classify)
+    return ClassifyResponse(results=[
+        Classification(label=label, pls_probability=prob) for label, prob in results
+    ])
+
+
 # --- 7. Run the Application ---
 
 if __name__ == "__main__":
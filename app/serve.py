@@ -0,0 +1,56 @@
+"""
+Runs the API with several uvicorn workers sharing one model server.
+
+A single process keeps the generation model and the classifier (core/model_server.py)
+and the API workers forward classification and generation to it over a Unix
+socket, so HTTP handling, text cleaning and readability scoring scale across
+cores while the GPU holds one copy of each model. With one worker the models
+are loaded in the API process as with `uvicorn main:app`. Run from the app
+folder:
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+"""
+import argparse
+import inspect
+import multiprocessing
+import os
+
+import uvicorn
+
+from core.model_server import run_model_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get('API_WORKERS', '1')))
+    parser.add_argument("--socket", default=os.environ.get('MODEL_SERVER_SOCKET', '/tmp/pls-model-server.sock'))
+    # Importing torch and transformers takes several seconds, past uvicorn's default of 5
+    parser.add_argument("--worker-healthcheck-timeout", type=int,
+                        default=int(os.environ.get('WORKER_HEALTHCHECK_TIMEOUT', '60')))
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        uvicorn.run("main:app", host=args.host, port=args.port)
+        return
+
+    # Spawned rather than forked: forking after torch has started its threads is unsafe
+    model_server = multiprocessing.get_context("spawn").Process(
+        target=run_model_server, args=(args.socket,), name="pls-model-server", daemon=True
+    )
+    model_server.start()
+    os.environ['MODEL_SERVER_SOCKET'] = args.socket
+    try:
+        options = {}
+        if "timeout_worker_healthcheck" in inspect.signature(uvicorn.Config).parameters:
+            # Older uvicorn versions have no such option (and answer the health check earlier)
+            options["timeout_worker_healthcheck"] = args.worker_healthcheck_timeout
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, **options)
+    finally:
+        model_server.terminate()
+        model_server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 const apiUrl = 'http://ec2-3-146-126-28.us-east-2.compute.amazonaws.com:8000'
-const generateEnpoint = '/generate_pls'
+const generateStreamEndpoint = '/generate_pls/stream'
 const modelNameEndpoint = '/get_model_name'
 
 
@@ -60,9 +60,13 @@ async function generateSummary() {
     inputArea.disabled = true ;
     outputArea.removeAttribute('aria-invalid');
 
+    outputArea.value = '';
     let response;
     if (inputArea.value.length >= 100) {
-        response = await callGeneratePLS(inputArea.value);
+        response = await callGeneratePLSStream(inputArea.value, (text) => {
+            outputArea.value += text;
+            outputArea.scrollTop = outputArea.scrollHeight;
+        });
     } else {
         response = {
             status: 'Invalid Input',
@@ -86,11 +90,12 @@ async function generateSummary() {
     inputArea.disabled = false;
 }
 
-async function callGeneratePLS(inputText) {
-    const response = await fetch(`${apiUrl}${generateEnpoint}`, {
+async function callGeneratePLSStream(inputText, onToken) {
+    const response = await fetch(`${apiUrl}${generateStreamEndpoint}`, {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
         },
         body: JSON.stringify({text: inputText})
     }).catch(err => ({isException: true, err}));
@@ -103,8 +108,44 @@ async function callGeneratePLS(inputText) {
         const errorData = await response.json(); // Parse the error detail
         return {status: response.status, message: errorData.detail};
     }
-    const data = await response.json();
-    return data;
+
+    // Read the Server-Sent Events as they arrive and render tokens incrementally
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let pls = '';
+    let scores;
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += value;
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+            const event = parseServerSentEvent(rawEvent);
+            if (event.name === 'token') {
+                pls += event.data.text;
+                onToken(event.data.text);
+            } else if (event.name === 'scores') {
+                scores = event.data;
+            } else if (event.name === 'error') {
+                return {status: event.data.status || 500, message: event.data.detail};
+            }
+        }
+    }
+    if (scores === undefined) {
+        return {status: 'Stream Error', message: 'The connection closed before the summary was finished.'};
+    }
+    return {pls: pls, scores: scores};
+}
+
+function parseServerSentEvent(rawEvent) {
+    let name = 'message';
+    let data = '';
+    for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) name = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+    }
+    return {name: name, data: data ? JSON.parse(data) : null};
 }
 
 function printScoresColumn(scores, column) {
@@ -5,4 +5,5 @@ sudo docker run -d \
     --restart unless-stopped \
     --gpus all \
     -p 8000:8000 \
+    -v /home/ubuntu/pls-cache:/app/cache \
     biomedical-text-simplification:latest
\ No newline at end of file
@@ -1,23 +1,29 @@
 #!/bin/bash
 
-# Wait for the application to start (max 5 minutes)
-for i in {1..30}; do
-    # Try to reach the health check endpoint
+# Wait for the models to load (max 5 minutes). /health/ready answers 503 while
+# loading, 200 once every model is ready, and reports a failed load right away.
+for i in {1..60}; do
     # -s: Silent mode
-    # -o /dev/null: Discard output
-    # -w "%{http_code}": Print only the HTTP status code
-    HTTP_CODE=$(curl -s -o /dev/null -w "%{http_code}" http://127.0.0.1:8000/health)
+    # -w "\n%{http_code}": Append the HTTP status code after the body
+    RESPONSE=$(curl -s -w "\n%{http_code}" http://127.0.0.1:8000/health/ready)
+    HTTP_CODE=$(echo "$RESPONSE" | tail -n 1)
+    BODY=$(echo "$RESPONSE" | head -n -1)
 
     if [ "$HTTP_CODE" == "200" ]; then
-        echo "Application is healthy!"
+        echo "Application is ready! $BODY"
         exit 0
     fi
 
-    echo "Waiting for application... (Attempt $i/30)"
-    sleep 10
+    if echo "$BODY" | grep -q '"status":"failed"'; then
+        echo "Model loading failed: $BODY"
+        break
+    fi
+
+    echo "Waiting for application... (Attempt $i/60) $BODY"
+    sleep 5
 done
 
 echo "Application failed to start within timeout."
 # Print container logs to help debugging in CodeDeploy console
 sudo docker logs biomedical-text-simplification
-exit 1
\ No newline at end of file
+exit 1